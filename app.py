@@ -3,13 +3,25 @@ import traceback
 from flask import current_app
 import re
 import os
+import io
+import csv
+import hmac
+import hashlib
 import json
 from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, jsonify, flash, session
+from flask import Flask, Response, render_template, request, redirect, url_for, jsonify, flash, session
+from flask import before_render_template, template_rendered
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.middleware.proxy_fix import ProxyFix
 from flask import Flask, render_template, request
-from qr_utils import generate_qr_base64
+from qr_utils import QRCache, QR_MIMETYPES, generate_qr_batch, qr_etag, upi_url
+from storage import SqliteAccounts, JsonStorage, atomic_write_json
+from shared_state import SharedDict, file_stamp
+from group_cache import GroupCache
+from chat_jobs import JobQueue, QueueFull, FINISHED, TIMEOUT_RESULT
+from csv_import import import_expenses_csv, DEFAULT_BATCH_SIZE
+from group_export import EXPORT_FORMATS, EXPENSE_COLUMNS, SETTLEMENT_COLUMNS, export_chunks
+import metrics
 
 # Configure logging to see detailed errors
 logging.basicConfig(level=logging.DEBUG)
@@ -31,64 +43,239 @@ app.config.update(
 # ===== Fix Reverse Proxy Issues =====
 app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1)
 
+# ===== Request Timing =====
+# Registered first so the timings include every other before_request hook
+if metrics.ENABLED:
+    @app.before_request
+    def start_request_timer():
+        metrics.request_started()
+
+    @app.after_request
+    def record_request_time(response):
+        metrics.request_finished(request.method, request.endpoint, response.status_code, request.path)
+        return response
+
+    before_render_template.connect(lambda sender, template, context, **extra: metrics.render_started(template),
+                                   app, weak=False)
+    template_rendered.connect(lambda sender, template, context, **extra: metrics.render_finished(template),
+                              app, weak=False)
+
+# Addresses allowed to read /metrics, e.g. "127.0.0.1,10.0.0.5", as the socket sees them
+METRICS_ALLOW = set(os.environ.get('METRICS_ALLOW', '127.0.0.1,::1').split(','))
+# When set, /metrics only answers "Authorization: Bearer <token>", from any address
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
 # ===== Create Uploads Folder =====
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# Seconds one chatbot message may take, LLM call included
+CHATBOT_TIMEOUT = float(os.environ.get('CHATBOT_TIMEOUT', 30))
+
+# Expenses per page of the dashboard lists and of /group/<id>/expenses
+EXPENSE_PAGE_SIZE = int(os.environ.get('EXPENSE_PAGE_SIZE', 20))
+MAX_EXPENSE_PAGE_SIZE = 100
+
+# Rendered payment QR codes, keyed by the UPI URL they encode
+qr_cache = QRCache(max_entries=int(os.environ.get('QR_CACHE_SIZE', 256)))
+# Seconds browsers may reuse a QR image before revalidating it with its ETag
+QR_MAX_AGE = int(os.environ.get('QR_MAX_AGE', 24 * 3600))
+
 # Initialize application components - moved after imports
 try:
     from bill_splitter import BillSplitter
-    from chatbot_utils import GeminiExpenseChatbot
-    chatbot = GeminiExpenseChatbot()
-    bill_splitters = {}
+    from chatbot_utils import GeminiExpenseChatbot, ParseCache
+    parse_cache = ParseCache(
+        max_entries=int(os.environ.get('CHATBOT_CACHE_SIZE', 1024)),
+        ttl=int(os.environ.get('CHATBOT_CACHE_TTL', 6 * 3600)),
+        path=os.environ.get('CHATBOT_CACHE_FILE') or None
+    )
+    chatbot = GeminiExpenseChatbot(
+        timeout=CHATBOT_TIMEOUT,
+        cache=parse_cache,
+        fast_path=os.environ.get('CHATBOT_FAST_PATH', '1') != '0',
+        resilience={
+            'rate': float(os.environ.get('GEMINI_RATE', 5)),
+            'burst': int(os.environ.get('GEMINI_BURST', 10)),
+            'max_retries': int(os.environ.get('GEMINI_RETRIES', 2)),
+            'failure_threshold': int(os.environ.get('GEMINI_BREAKER_FAILURES', 5)),
+            'reset_timeout': float(os.environ.get('GEMINI_BREAKER_RESET', 30))
+        }
+    )
+    # Breaker state and model call counters on /metrics
+    metrics.add_collector(chatbot.model.prometheus)
 except ImportError as e:
     logger.error(f"Error importing modules: {e}")
     # Create placeholder to prevent app crashing
-    bill_splitters = {}
     chatbot = None
 
 USERS_FILE = "users.json"
+USERS_DB = "users.db"
+
+# Group persistence: 'journal' appends each change to a per-group log,
+# 'json' rewrites the whole group file on every change and 'sqlite' keeps
+# each group (and the accounts) in SQLite databases
+STORAGE_BACKEND = os.environ.get('BILL_SPLITTER_STORAGE', 'journal')
+# With the json backend, write each group at most once per this many seconds.
+# Only safe when a single worker process serves the groups.
+FLUSH_INTERVAL = float(os.environ.get('BILL_SPLITTER_FLUSH_INTERVAL', 0))
+
+def group_storage_file(group_id):
+    if STORAGE_BACKEND == 'sqlite':
+        return f"{group_id}.db"
+    return f"{group_id}.json"
+
+accounts_db = SqliteAccounts(USERS_DB) if STORAGE_BACKEND == 'sqlite' else None
+
+def load_group(group_id):
+    path = group_storage_file(group_id)
+    storage = STORAGE_BACKEND
+    if STORAGE_BACKEND == 'json' and FLUSH_INTERVAL:
+        storage = JsonStorage(path, flush_interval=FLUSH_INTERVAL)
+    return BillSplitter(storage_file=path, storage=storage)
 
+# Loaded groups, bounded so a long-running worker does not keep every group it ever opened
+group_cache = GroupCache(
+    load_group,
+    max_entries=int(os.environ.get('GROUP_CACHE_MAX_ENTRIES', 128)),
+    max_bytes=int(os.environ.get('GROUP_CACHE_MAX_MB', 256)) * 1024 * 1024,
+    idle_timeout=int(os.environ.get('GROUP_CACHE_IDLE_SECONDS', 1800))
+)
+
+def get_group(group_id):
+    """Return the BillSplitter for a group, loading it if it is not cached"""
+    bs = group_cache.get(group_id)
+    # Other workers may have written to the group since we last looked
+    bs.refresh()
+    return bs
+
+@metrics.instrument('users.load')
 def load_users():
-    try:
-        if os.path.exists(USERS_FILE):
-            with open(USERS_FILE, 'r') as f:
-                return json.load(f)
-        else:
-            logger.warning(f"Users file not found: {USERS_FILE}. Creating empty users dict.")
-            # Create the file with an empty dictionary
-            with open(USERS_FILE, 'w') as f:
-                json.dump({}, f)
-            return {}
-    except Exception as e:
-        logger.error(f"Error loading users: {str(e)}")
+    # Errors propagate: an empty dict here would be saved over every account
+    if STORAGE_BACKEND == 'sqlite':
+        return accounts_db.load()
+    if os.path.exists(USERS_FILE):
+        with open(USERS_FILE, 'r') as f:
+            return json.load(f)
+    else:
+        logger.warning(f"Users file not found: {USERS_FILE}. Creating empty users dict.")
+        # Create the file with an empty dictionary
+        with open(USERS_FILE, 'w') as f:
+            json.dump({}, f)
         return {}
 
+@metrics.instrument('users.save')
 def save_users(users):
     try:
-        with open(USERS_FILE, 'w') as f:
-            json.dump(users, f, indent=2)
+        if STORAGE_BACKEND == 'sqlite':
+            accounts_db.save(users)
+            return
+        atomic_write_json(USERS_FILE, users)
     except Exception as e:
         logger.error(f"Error saving users: {str(e)}")
 
-# Load users at startup
-users = load_users()
+def users_stamp():
+    if STORAGE_BACKEND == 'sqlite':
+        return accounts_db.stamp()
+    return file_stamp(USERS_FILE)
+
+# Accounts shared by all workers; `users` is updated in place when another
+# worker saves, and every change goes through user_store.transaction()
+user_store = SharedDict(load_users, save_users, users_stamp, lock_path=f"{USERS_FILE}.lock")
+users = user_store.data
+
+@app.before_request
+def refresh_users():
+    try:
+        user_store.refresh()
+    except Exception as e:
+        # Keep serving the accounts as last read; changes fail until they load again
+        logger.error(f"Error loading users: {str(e)}")
 
 # ===== Route Definitions =====
+UPI_ID_PATTERN = re.compile(r'^[\w.\-]{2,256}@[A-Za-z][A-Za-z0-9]{1,63}$')
+
+def qr_response(data, fmt):
+    """QR image for data, or 304 when the browser's copy is still current"""
+    etag = qr_etag(data, fmt)
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        body, etag = generate_qr_batch([data], fmt, cache=qr_cache)[data]
+        response = app.response_class(body, mimetype=QR_MIMETYPES[fmt])
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = QR_MAX_AGE
+    return response
+
+def parse_qr_amount(value):
+    """Rupee amount from a query parameter, None if it is not a positive number"""
+    try:
+        amount = round(float(value), 2)
+    except (TypeError, ValueError):
+        return None
+    return amount if 0 < amount < 1e9 else None
+
 @app.route("/payment_qr")
 def payment_qr():
+    upi_id = request.args.get('upi_id', '')
+    name = request.args.get('name', 'Bill Splitter')
+    amount = parse_qr_amount(request.args.get('amount'))
+    fmt = request.args.get('fmt', 'svg')
+    if not UPI_ID_PATTERN.match(upi_id) or amount is None or fmt not in QR_MIMETYPES:
+        return jsonify({'status': 'error', 'message': 'upi_id, a positive amount and fmt svg or png are required'}), 400
     try:
-        # Simulate or get from bill data
-        upi_id = "yourupi@upi"
-        amount = 150
-        name = "Bill Splitter"
-
-        upi_url = f"upi://pay?pa={upi_id}&pn={name}&am={amount}&cu=INR"
-        qr_img = generate_qr_base64(upi_url)
-        return render_template("qr_display.html", qr_img=qr_img)
+        return qr_response(upi_url(upi_id, name, amount), fmt)
     except Exception as e:
         logger.error(f"Error in payment_qr: {str(e)}")
-        flash("Failed to generate QR code", "danger")
-        return redirect(url_for('home'))
+        return jsonify({'status': 'error', 'message': 'Failed to generate QR code'}), 500
+
+def settlement_upi_url(group_id, payee, amount):
+    """UPI link paying a settlement to payee, None if payee has no UPI id"""
+    upi_id = users.get(payee, {}).get('upi_id')
+    if not upi_id:
+        return None
+    group_name = users[payee].get('groups', {}).get(group_id, {}).get('name', 'Bill Splitter')
+    return upi_url(upi_id, payee, amount, note=f"{group_name} settlement")
+
+@app.route('/group/<group_id>/settlement_qr')
+def settlement_qr(group_id):
+    if 'username' not in session:
+        return jsonify({"status": "error", "message": "Please log in first"}), 401
+    if group_id not in users.get(session['username'], {}).get('groups', {}):
+        return jsonify({"status": "error", "message": "You don't have access to this group"}), 403
+
+    payee = request.args.get('to', '')
+    amount = parse_qr_amount(request.args.get('amount'))
+    fmt = request.args.get('fmt', 'svg')
+    if amount is None or fmt not in QR_MIMETYPES:
+        return jsonify({'status': 'error', 'message': 'A positive amount and fmt svg or png are required'}), 400
+    if group_id not in users.get(payee, {}).get('groups', {}):
+        return jsonify({'status': 'error', 'message': f"'{payee}' is not in this group"}), 404
+    url = settlement_upi_url(group_id, payee, amount)
+    if url is None:
+        return jsonify({'status': 'error', 'message': f"'{payee}' has no UPI id"}), 404
+    try:
+        return qr_response(url, fmt)
+    except Exception as e:
+        logger.error(f"Error in settlement_qr: {str(e)}")
+        return jsonify({'status': 'error', 'message': 'Failed to generate QR code'}), 500
+
+def attach_payment_qr(group_id, settlements):
+    """Add a qr_url to each settlement whose payee has a UPI id, rendering the codes in one batch"""
+    payment_urls = []
+    for settlement in settlements:
+        url = settlement_upi_url(group_id, settlement['to'], settlement['amount'])
+        if url is not None:
+            payment_urls.append(url)
+            settlement['qr_url'] = url_for('settlement_qr', group_id=group_id, to=settlement['to'],
+                                           amount=f"{settlement['amount']:.2f}")
+    if payment_urls:
+        # Warm the cache so the image requests that follow do not render anything
+        try:
+            generate_qr_batch(payment_urls, 'svg', cache=qr_cache)
+        except Exception as e:
+            logger.error(f"Error rendering settlement QR codes: {str(e)}")
+    return settlements
 
 @app.route('/')
 def home():
@@ -172,16 +359,26 @@ def register():
             username = request.form['username']
             password = request.form['password']
             email = request.form['email']
+            upi_id = request.form.get('upi_id', '').strip()
+            
+            if upi_id and not UPI_ID_PATTERN.match(upi_id):
+                flash('Invalid UPI id, expected something like name@bank', 'danger')
+                return render_template('register.html')
+            
+            with user_store.transaction():
+                taken = username in users
+                if not taken:
+                    users[username] = {
+                        'password': generate_password_hash(password),
+                        'email': email,
+                        'groups': {}
+                    }
+                    if upi_id:
+                        users[username]['upi_id'] = upi_id
             
-            if username in users:
+            if taken:
                 flash('Username already exists', 'danger')
             else:
-                users[username] = {
-                    'password': generate_password_hash(password),
-                    'email': email,
-                    'groups': {}
-                }
-                save_users(users)
                 flash('Registration successful! Please login.', 'success')
                 return redirect(url_for('login'))
         
@@ -206,18 +403,16 @@ def create_group():
             group_name = request.form['group_name']
             group_id = f"group_{datetime.now().strftime('%Y%m%d%H%M%S')}"
             
-            storage_file = f"{group_id}.json"
-            bill_splitters[group_id] = BillSplitter(storage_file=storage_file)
-            bill_splitters[group_id].add_user(session['username'])
+            get_group(group_id).add_user(session['username'])
             
-            if session['username'] not in users:
-                users[session['username']] = {'groups': {}}
-                
-            users[session['username']]['groups'][group_id] = {
-                'name': group_name,
-                'role': 'admin'
-            }
-            save_users(users)
+            with user_store.transaction():
+                if session['username'] not in users:
+                    users[session['username']] = {'groups': {}}
+                    
+                users[session['username']]['groups'][group_id] = {
+                    'name': group_name,
+                    'role': 'admin'
+                }
             
             flash(f'Group "{group_name}" created successfully!', 'success')
             return redirect(url_for('group_dashboard', group_id=group_id))
@@ -238,14 +433,19 @@ def group_dashboard(group_id):
             flash('You do not have access to this group', 'danger')
             return redirect(url_for('home'))
         
-        if group_id not in bill_splitters:
-            storage_file = f"{group_id}.json"
-            bill_splitters[group_id] = BillSplitter(storage_file=storage_file)
-        
-        bs = bill_splitters[group_id]
+        bs = get_group(group_id)
+        username = session['username']
+        # Read first: if the group changes while the page is built, the next poll catches it
+        group_version = bs.version
         expense_summary = bs.get_expense_summary()
         settlements = bs.calculate_balances()
-        user_info = bs.get_user_expenses(session['username'])
+        # Only the first page of each list, the rest comes from group_api()
+        expenses, expenses_cursor = bs.expense_page('all', limit=EXPENSE_PAGE_SIZE)
+        paid_expenses, paid_cursor = bs.expense_page('paid', username, limit=EXPENSE_PAGE_SIZE)
+        owed_expenses, owed_cursor = bs.expense_page('owed', username, limit=EXPENSE_PAGE_SIZE)
+        
+        attach_payment_qr(group_id, settlements)
+        user_info = bs.get_user_summary(username)
         
         if isinstance(user_info, str):
             user_info = None
@@ -257,7 +457,13 @@ def group_dashboard(group_id):
             expense_summary=expense_summary,
             settlements=settlements,
             user_info=user_info,
-            expenses=bs.expenses,
+            expenses=expenses,
+            expenses_cursor=expenses_cursor,
+            paid_expenses=paid_expenses,
+            paid_cursor=paid_cursor,
+            owed_expenses=owed_expenses,
+            owed_cursor=owed_cursor,
+            group_version=group_version,
             group_users=list(bs.users)
         )
     except Exception as e:
@@ -265,6 +471,109 @@ def group_dashboard(group_id):
         flash("Failed to load group dashboard", "danger")
         return redirect(url_for('home'))
 
+def versioned_json(bs, build):
+    """JSON response for a view of the group, tagged with the group version.
+
+    The strong ETag covers the version, the accounts stamp (settlements carry
+    the payees' UPI QR links), the user and the full URL, so an If-None-Match
+    that still matches gets a 304 without calling build().
+    """
+    with bs.lock:
+        version = bs.version
+        key = f"{session['username']}:{user_store.version}:{request.full_path}"
+        etag = f"v{version}-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]}"
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+        else:
+            response = jsonify(dict(build(), status="success", version=version))
+    response.set_etag(etag)
+    # Browsers may keep the response but must check the version before reusing it
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def expenses_view(group_id, bs, username):
+    before = int(request.args['before']) if request.args.get('before') else None
+    limit = min(MAX_EXPENSE_PAGE_SIZE, max(1, int(request.args.get('limit', EXPENSE_PAGE_SIZE))))
+    expenses, next_cursor = bs.expense_page(request.args.get('list', 'all'), username,
+                                            before=before, limit=limit)
+    return {"expenses": expenses, "next_cursor": next_cursor}
+
+def summary_view(group_id, bs, username):
+    user_summary = bs.get_user_summary(username)
+    return {
+        "summary": bs.get_expense_summary(),
+        "me": None if isinstance(user_summary, str) else user_summary
+    }
+
+def date_arg(name):
+    """A YYYY-MM-DD query parameter, None when it is missing; raises ValueError otherwise"""
+    value = request.args.get(name)
+    return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d') if value else None
+
+def balances_view(group_id, bs, username):
+    as_of = date_arg('as_of')
+    if as_of:
+        return {"balances": bs.get_balances_as_of(as_of), "as_of": as_of}
+    return {"balances": bs.get_net_balances()}
+
+def spending_view(group_id, bs, username):
+    start, end = date_arg('start'), date_arg('end')
+    spending = {"spending": bs.get_spending_summary(start, end)}
+    if request.args.get('by'):
+        spending["rollup"] = bs.get_spending_rollup(request.args['by'], start, end)
+    return spending
+
+def settlements_view(group_id, bs, username):
+    return {"settlements": attach_payment_qr(group_id, bs.calculate_balances())}
+
+def state_view(group_id, bs, username):
+    state = summary_view(group_id, bs, username)
+    # Always today's balances, as_of only applies to the balances view
+    state["balances"] = bs.get_net_balances()
+    state.update(settlements_view(group_id, bs, username))
+    return state
+
+# Read-only JSON views of a group, see group_api()
+GROUP_VIEWS = {
+    'state': state_view,
+    'summary': summary_view,
+    'balances': balances_view,
+    'settlements': settlements_view,
+    'expenses': expenses_view,
+    'spending': spending_view
+}
+
+@app.route('/api/group/<group_id>/<view>')
+def group_api(group_id, view):
+    """Versioned JSON read API: state, summary, balances, settlements, expenses, spending.
+
+    state is summary, balances and settlements together. expenses takes
+    list=all|paid|owed, limit and before (the next_cursor of the previous
+    page) and lists newest first. spending totals the expenses dated from
+    start to end (YYYY-MM-DD, both optional), with by=day|month for a
+    rollup. balances takes as_of=YYYY-MM-DD for the balances over the
+    expenses dated up to then. Every response carries the group version and
+    an ETag; polling with If-None-Match costs a 304 until the group changes.
+    """
+    if 'username' not in session:
+        return jsonify({"status": "error", "message": "Please log in first"}), 401
+    if group_id not in users.get(session['username'], {}).get('groups', {}):
+        return jsonify({"status": "error", "message": "You don't have access to this group"}), 403
+    if view not in GROUP_VIEWS:
+        return jsonify({"status": "error", "message": f"Unknown view '{view}'"}), 404
+    
+    try:
+        bs = get_group(group_id)
+        return versioned_json(bs, lambda: GROUP_VIEWS[view](group_id, bs, session['username']))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"Invalid request: {e}"}), 400
+
+@app.route('/group/<group_id>/expenses')
+def group_expenses(group_id):
+    """Expense pages for the dashboard's load more, same as group_api(group_id, 'expenses')"""
+    return group_api(group_id, 'expenses')
+
 @app.route('/group/<group_id>/add_user', methods=['POST'])
 def add_user_to_group(group_id):
     if 'username' not in session:
@@ -282,21 +591,17 @@ def add_user_to_group(group_id):
             flash(f'User "{username}" does not exist', 'danger')
             return redirect(url_for('group_dashboard', group_id=group_id))
         
-        if group_id not in bill_splitters:
-            storage_file = f"{group_id}.json"
-            bill_splitters[group_id] = BillSplitter(storage_file=storage_file)
-        
-        bs = bill_splitters[group_id]
+        bs = get_group(group_id)
         message = bs.add_user(username)
         
-        if 'groups' not in users[username]:
-            users[username]['groups'] = {}
-            
-        users[username]['groups'][group_id] = {
-            'name': users[session['username']]['groups'][group_id]['name'],
-            'role': 'member'
-        }
-        save_users(users)
+        with user_store.transaction():
+            if 'groups' not in users[username]:
+                users[username]['groups'] = {}
+                
+            users[username]['groups'][group_id] = {
+                'name': users[session['username']]['groups'][group_id]['name'],
+                'role': 'member'
+            }
         
         flash(message, 'success')
         return redirect(url_for('group_dashboard', group_id=group_id))
@@ -315,22 +620,18 @@ def add_expense(group_id):
             flash('You do not have access to this group', 'danger')
             return redirect(url_for('home'))
         
-        if group_id not in bill_splitters:
-            storage_file = f"{group_id}.json"
-            bill_splitters[group_id] = BillSplitter(storage_file=storage_file)
-        
-        bs = bill_splitters[group_id]
+        bs = get_group(group_id)
         paid_by = request.form['paid_by']
         amount = request.form['amount']
         description = request.form['description']
         category = request.form.get('category', '')
         participants = request.form.getlist('participants')
         
-        message = bs.add_expense(paid_by, amount, description, participants)
-        
-        if category and message.startswith("Expense"):
-            expense_id = len(bs.expenses) - 1  # Fixed to use the correct index
-            bs.categorize_expense(expense_id, category)
+        with bs.transaction():
+            message = bs.add_expense(paid_by, amount, description, participants)
+            
+            if category and message.startswith("Expense"):
+                bs.categorize_expense(bs.last_expense_id, category)
         
         flash(message, 'success')
         return redirect(url_for('group_dashboard', group_id=group_id))
@@ -349,11 +650,7 @@ def categorize_expense(group_id):
             flash('You do not have access to this group', 'danger')
             return redirect(url_for('home'))
         
-        if group_id not in bill_splitters:
-            storage_file = f"{group_id}.json"
-            bill_splitters[group_id] = BillSplitter(storage_file=storage_file)
-        
-        bs = bill_splitters[group_id]
+        bs = get_group(group_id)
         expense_id = int(request.form['expense_id'])
         category = request.form['category']
         
@@ -365,6 +662,249 @@ def categorize_expense(group_id):
         flash("Failed to categorize expense", "danger")
         return redirect(url_for('group_dashboard', group_id=group_id))
 
+@app.route('/group/<group_id>/delete_expense', methods=['POST'])
+def delete_expense(group_id):
+    if 'username' not in session:
+        return redirect(url_for('login'))
+    
+    try:
+        if group_id not in users.get(session['username'], {}).get('groups', {}):
+            flash('You do not have access to this group', 'danger')
+            return redirect(url_for('home'))
+        
+        bs = get_group(group_id)
+        expense_id = int(request.form['expense_id'])
+        
+        message = bs.delete_expense(expense_id)
+        flash(message, 'success' if not message.startswith("Error") else 'danger')
+        return redirect(url_for('group_dashboard', group_id=group_id))
+    except Exception as e:
+        logger.error(f"Error in delete_expense: {str(e)}")
+        flash("Failed to delete expense", "danger")
+        return redirect(url_for('group_dashboard', group_id=group_id))
+
+@app.route('/group/<group_id>/import_csv', methods=['POST'])
+def import_csv(group_id):
+    """Bulk add expenses from an uploaded CSV ('file' field) or a text/csv request body"""
+    if 'username' not in session:
+        return jsonify({"status": "error", "message": "Please log in first"}), 401
+    if group_id not in users.get(session['username'], {}).get('groups', {}):
+        return jsonify({"status": "error", "message": "You don't have access to this group"}), 403
+    
+    upload = request.files.get('file')
+    raw = upload.stream if upload is not None else request.stream
+    # Decode as the rows are read, the upload is never loaded whole
+    stream = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+    try:
+        bs = get_group(group_id)
+        batch_size = max(1, int(request.args.get('batch_size', DEFAULT_BATCH_SIZE)))
+        report = import_expenses_csv(bs, stream, batch_size=batch_size)
+    except (ValueError, csv.Error) as e:
+        # Bad header, not UTF-8 or malformed CSV; rows before the fault stay imported
+        return jsonify({"status": "error", "message": f"Could not import the file: {e}"}), 400
+    except Exception as e:
+        logger.error(f"Error in import_csv: {str(e)}")
+        return jsonify({"status": "error", "message": f"An error occurred: {str(e)}"}), 500
+    finally:
+        stream.detach()
+    
+    return jsonify(dict(report, status="success" if report['imported'] or not report['rejected'] else "error"))
+
+def export_response(chunks, filename, fmt, compress):
+    """Stream export chunks to the client as a file download"""
+    if compress:
+        filename += '.gz'
+    response = Response(chunks, mimetype='application/gzip' if compress else EXPORT_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Keep proxies such as nginx from buffering the whole stream before passing it on
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def export_options():
+    """(format, gzip) from the query string, raises ValueError for an unknown format"""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    return fmt, request.args.get('gzip', '0') in ('1', 'true', 'yes')
+
+@app.route('/group/<group_id>/export/expenses')
+def export_expenses(group_id):
+    """Expenses as CSV or NDJSON, filtered by start/end date, paid_by and category"""
+    if 'username' not in session:
+        return jsonify({"status": "error", "message": "Please log in first"}), 401
+    if group_id not in users.get(session['username'], {}).get('groups', {}):
+        return jsonify({"status": "error", "message": "You don't have access to this group"}), 403
+    
+    try:
+        fmt, compress = export_options()
+        filters = {}
+        for param, key in (('start', 'start_date'), ('end', 'end_date')):
+            if request.args.get(param):
+                filters[key] = datetime.strptime(request.args[param], '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"Invalid export options: {e}"}), 400
+    filters['paid_by'] = request.args.get('paid_by') or None
+    filters['category'] = request.args.get('category') or None
+    
+    bs = get_group(group_id)
+    rows = bs.iter_expenses(**filters)
+    return export_response(export_chunks(rows, fmt, EXPENSE_COLUMNS, compress),
+                           f"{group_id}_expenses.{fmt}", fmt, compress)
+
+@app.route('/group/<group_id>/export/settlements')
+def export_settlements(group_id):
+    """Current settlements (from, to, amount) as CSV or NDJSON"""
+    if 'username' not in session:
+        return jsonify({"status": "error", "message": "Please log in first"}), 401
+    if group_id not in users.get(session['username'], {}).get('groups', {}):
+        return jsonify({"status": "error", "message": "You don't have access to this group"}), 403
+    
+    try:
+        fmt, compress = export_options()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"Invalid export options: {e}"}), 400
+    
+    bs = get_group(group_id)
+    
+    def rows():
+        # Computed once the response has started, after the header line went out
+        yield from bs.calculate_balances()
+    
+    return export_response(export_chunks(rows(), fmt, SETTLEMENT_COLUMNS, compress),
+                           f"{group_id}_settlements.{fmt}", fmt, compress)
+
+@app.route('/group/<group_id>/analytics')
+def group_analytics(group_id):
+    if 'username' not in session:
+        return jsonify({"status": "error", "message": "Please log in first"}), 401
+    
+    try:
+        if group_id not in users.get(session['username'], {}).get('groups', {}):
+            return jsonify({"status": "error", "message": "You don't have access to this group"}), 403
+        
+        bs = get_group(group_id)
+        return jsonify({
+            "status": "success",
+            "summary": bs.get_expense_summary(),
+            "monthly": bs.get_monthly_summary(),
+            "user_categories": bs.get_user_category_summary()
+        })
+    except Exception as e:
+        logger.error(f"Error in group_analytics: {str(e)}")
+        return jsonify({"status": "error", "message": f"An error occurred: {str(e)}"}), 500
+
+# Chatbot messages are parsed off the request thread, at most CHATBOT_WORKERS
+# at a time per process; job state lives in files so any worker can report it
+chat_jobs = JobQueue(
+    os.environ.get('CHATBOT_JOB_DIR', 'chat_jobs'),
+    max_workers=int(os.environ.get('CHATBOT_WORKERS', 4)),
+    max_pending=int(os.environ.get('CHATBOT_MAX_PENDING', 32)),
+    timeout=CHATBOT_TIMEOUT
+)
+
+def add_chatbot_members(bs, group_id, username, participants):
+    """Add participants the group does not have yet, linking registered accounts to it"""
+    new_members = [p for p in dict.fromkeys(participants)
+                   if p != username and p not in bs.users]
+    for participant in new_members:
+        bs.add_user(participant)
+    registered = [p for p in new_members if p in users]
+    if registered:
+        with user_store.transaction():
+            for participant in registered:
+                users[participant]['groups'][group_id] = {
+                    'name': users[username]['groups'][group_id]['name'],
+                    'role': 'member'
+                }
+
+def add_chatbot_expense(bs, parsed_data):
+    """Add one parsed expense, returns (error message or None, expense for the response)"""
+    expense_result = bs.add_expense(
+        parsed_data["paid_by"],
+        parsed_data["amount"],
+        parsed_data["description"],
+        parsed_data["participants"],
+        parsed_data.get("date")
+    )
+
+    if not expense_result.startswith("Expense"):
+        return f"Failed to add expense: {expense_result}", None
+
+    # Categorize if available
+    if 'category' in parsed_data and parsed_data["category"] != "other":
+        bs.categorize_expense(bs.last_expense_id, parsed_data["category"])
+
+    return None, {
+        "paid_by": parsed_data["paid_by"],
+        "amount": parsed_data["amount"],
+        "description": parsed_data["description"],
+        "participants": parsed_data["participants"],
+        "date": parsed_data.get("date", datetime.now().strftime("%Y-%m-%d")),
+        "category": parsed_data.get("category", "other")
+    }
+
+def apply_chatbot_expense(group_id, username, parsed_data):
+    """Add a parsed chatbot expense to the group, returns (response body, HTTP status)"""
+    if parsed_data["status"] == "error":
+        return {"status": "error", "message": parsed_data["message"]}, 400
+
+    bs = get_group(group_id)
+    # Everything below is written to the group in one go
+    with bs.transaction():
+        add_chatbot_members(bs, group_id, username, parsed_data["participants"])
+        error, new_expense = add_chatbot_expense(bs, parsed_data)
+        if error:
+            return {"status": "error", "message": error}, 400
+
+    return {
+        "status": "success",
+        "message": f"Expense added: {parsed_data['description']} - ₹{parsed_data['amount']}",
+        "data_type": "expense",
+        "expense": new_expense
+    }, 200
+
+def apply_chatbot_expenses(group_id, username, parsed_batch):
+    """Add every valid expense of a batch parse in one commit, returns (response body, HTTP status)"""
+    if parsed_batch["status"] == "error" and "items" not in parsed_batch:
+        return {"status": "error", "message": parsed_batch["message"]}, 400
+
+    items = parsed_batch["items"]
+    results = []
+    bs = get_group(group_id)
+    with bs.transaction():
+        valid = [item for item in items if item["status"] == "success"]
+        add_chatbot_members(bs, group_id, username,
+                            [p for item in valid for p in item["participants"]])
+        for index, item in enumerate(items):
+            if item["status"] != "success":
+                results.append({"index": index, "status": "error", "message": item["message"]})
+                continue
+            error, new_expense = add_chatbot_expense(bs, item)
+            if error:
+                results.append({"index": index, "status": "error", "message": error})
+            else:
+                results.append({"index": index, "status": "success", "expense": new_expense})
+
+    added = sum(1 for r in results if r["status"] == "success")
+    return {
+        "status": "success" if added else "error",
+        "message": f"Added {added} of {len(items)} expenses",
+        "data_type": "expenses",
+        "added": added,
+        "failed": len(items) - added,
+        "results": results
+    }, 200 if added else 400
+
+def run_chatbot_job(job, group_id, username, message):
+    """Background half of the chatbot endpoint: parse with the LLM, then apply"""
+    # The request handler already tried the local parser
+    parsed_data = chatbot.process_expense(message, timeout=job.time_left(), fast_path=False)
+    if job.expired():
+        # The client has already been told this timed out, do not add it behind their back
+        return None
+    body, code = apply_chatbot_expense(group_id, username, parsed_data)
+    return dict(body, http_status=code)
+
 @app.route('/group/<group_id>/chatbot', methods=['POST'])
 def process_chatbot_request(group_id):
     if 'username' not in session:
@@ -381,67 +921,28 @@ def process_chatbot_request(group_id):
         if chatbot is None:
             return jsonify({"status": "error", "message": "Chatbot is not available"}), 500
 
-        if group_id not in bill_splitters:
-            storage_file = f"{group_id}.json"
-            bill_splitters[group_id] = BillSplitter(storage_file=storage_file)
+        # Formulaic messages are parsed locally and answered right away
+        if chatbot.fast_path:
+            parsed_data = chatbot.parse_fast(message)
+            if parsed_data is not None:
+                body, code = apply_chatbot_expense(group_id, session['username'], parsed_data)
+                return jsonify(body), code
 
-        bs = bill_splitters[group_id]
-        parsed_data = chatbot.process_expense(message)
-
-        if parsed_data["status"] == "error":
+        # The LLM round-trip runs in the job pool, the client polls for the result
+        try:
+            job_id = chat_jobs.submit(session['username'], run_chatbot_job,
+                                      group_id, session['username'], message)
+        except QueueFull:
             return jsonify({
                 "status": "error",
-                "message": parsed_data["message"]
-            }), 400
-
-        # Ensure participants exist
-        for participant in parsed_data["participants"]:
-            if participant != session['username'] and participant not in bs.users:
-                if participant in users:
-                    bs.add_user(participant)
-                    users[participant]['groups'][group_id] = {
-                        'name': users[session['username']]['groups'][group_id]['name'],
-                        'role': 'member'
-                    }
-                    save_users(users)
-                else:
-                    bs.add_user(participant)
-
-        # Add expense
-        expense_result = bs.add_expense(
-            parsed_data["paid_by"],
-            parsed_data["amount"],
-            parsed_data["description"],
-            parsed_data["participants"],
-            parsed_data.get("date")
-        )
-
-        if not expense_result.startswith("Expense"):
-            return jsonify({
-                "status": "error",
-                "message": f"Failed to add expense: {expense_result}"
-            }), 400
-
-        # Categorize if available
-        if 'category' in parsed_data and parsed_data["category"] != "other":
-            expense_id = len(bs.expenses) - 1
-            bs.categorize_expense(expense_id, parsed_data["category"])
-
-        new_expense = {
-            "paid_by": parsed_data["paid_by"],
-            "amount": parsed_data["amount"],
-            "description": parsed_data["description"],
-            "participants": parsed_data["participants"],
-            "date": parsed_data.get("date", datetime.now().strftime("%Y-%m-%d")),
-            "category": parsed_data.get("category", "other")
-        }
+                "message": "The assistant is busy right now, please try again in a moment"
+            }), 429
 
         return jsonify({
-            "status": "success",
-            "message": f"Expense added: {parsed_data['description']} - ₹{parsed_data['amount']}",
-            "data_type": "expense",
-            "expense": new_expense
-        })
+            "status": "queued",
+            "job_id": job_id,
+            "status_url": url_for('chatbot_job_status', group_id=group_id, job_id=job_id)
+        }), 202
 
     except Exception as e:
         logger.error(f"Error in process_chatbot_request: {traceback.format_exc()}")
@@ -451,6 +952,75 @@ def process_chatbot_request(group_id):
             "traceback": traceback.format_exc()
         }), 500
 
+def run_chatbot_bulk_job(job, group_id, username, message):
+    """Background half of the bulk endpoint: one LLM call for the list, then apply"""
+    parsed_batch = chatbot.process_expenses(message, timeout=job.time_left(), fast_path=False)
+    if job.expired():
+        return None
+    body, code = apply_chatbot_expenses(group_id, username, parsed_batch)
+    return dict(body, http_status=code)
+
+@app.route('/group/<group_id>/chatbot/bulk', methods=['POST'])
+def process_chatbot_bulk_request(group_id):
+    if 'username' not in session:
+        return jsonify({"status": "error", "message": "Please log in first"}), 401
+
+    try:
+        if group_id not in users.get(session['username'], {}).get('groups', {}):
+            return jsonify({"status": "error", "message": "You don't have access to this group"}), 403
+
+        message = request.json.get('message', '').strip()
+        if not message:
+            return jsonify({"status": "error", "message": "No message provided"}), 400
+
+        if chatbot is None:
+            return jsonify({"status": "error", "message": "Chatbot is not available"}), 500
+
+        # A list the local parser understands line by line needs no model call
+        if chatbot.fast_path:
+            parsed_batch = chatbot.parse_batch_fast(message)
+            if parsed_batch is not None:
+                body, code = apply_chatbot_expenses(group_id, session['username'], parsed_batch)
+                return jsonify(body), code
+
+        try:
+            job_id = chat_jobs.submit(session['username'], run_chatbot_bulk_job,
+                                      group_id, session['username'], message)
+        except QueueFull:
+            return jsonify({
+                "status": "error",
+                "message": "The assistant is busy right now, please try again in a moment"
+            }), 429
+
+        return jsonify({
+            "status": "queued",
+            "job_id": job_id,
+            "status_url": url_for('chatbot_job_status', group_id=group_id, job_id=job_id)
+        }), 202
+
+    except Exception as e:
+        logger.error(f"Error in process_chatbot_bulk_request: {traceback.format_exc()}")
+        return jsonify({
+            "status": "error",
+            "message": f"An error occurred: {str(e)}"
+        }), 500
+
+@app.route('/group/<group_id>/chatbot/jobs/<job_id>', methods=['GET'])
+def chatbot_job_status(group_id, job_id):
+    if 'username' not in session:
+        return jsonify({"status": "error", "message": "Please log in first"}), 401
+
+    job = chat_jobs.status(job_id, owner=session['username'])
+    if job is None:
+        return jsonify({"status": "error", "message": "Unknown job"}), 404
+    if job['status'] not in FINISHED:
+        return jsonify({"status": "pending", "job_id": job_id, "job_status": job['status']})
+
+    result = dict(job['result'] or TIMEOUT_RESULT)
+    default_code = {'done': 200, 'timeout': 504}.get(job['status'], 500)
+    code = result.pop('http_status', default_code)
+    return jsonify(dict(result, job_id=job_id, job_status=job['status'])), code
+
 @app.route('/group/<group_id>/chatbot/query', methods=['GET'])
 def chatbot_query(group_id):
     if 'username' not in session:
@@ -497,6 +1067,52 @@ def chatbot_query(group_id):
             "message": f"An error occurred: {str(e)}"
         }), 500
 
+@app.route('/group_cache/stats')
+def group_cache_stats():
+    if 'username' not in session:
+        return jsonify({"status": "error", "message": "Please log in first"}), 401
+    return jsonify({"status": "success", "cache": group_cache.stats()})
+
+@app.route('/chatbot/cache/stats')
+def chatbot_cache_stats():
+    if 'username' not in session:
+        return jsonify({"status": "error", "message": "Please log in first"}), 401
+    if chatbot is None:
+        return jsonify({"status": "error", "message": "Chatbot is not available"}), 500
+    return jsonify({
+        "status": "success",
+        "cache": chatbot.cache.stats(),
+        "fast_path": chatbot.fast_path_stats(),
+        "llm": chatbot.llm_stats()
+    })
+
+def metrics_allowed():
+    """Whether the request may read the metrics routes: METRICS_TOKEN, or a direct METRICS_ALLOW peer"""
+    if not metrics.ENABLED:
+        return False
+    if METRICS_TOKEN:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {METRICS_TOKEN}")
+    # ProxyFix takes remote_addr from X-Forwarded-For, which any client can set; and a
+    # request the proxy forwarded comes from the proxy's own, often local, address
+    if 'X-Forwarded-For' in request.headers:
+        return False
+    peer = request.environ.get('werkzeug.proxy_fix.orig', {}).get('REMOTE_ADDR', request.remote_addr)
+    return peer in METRICS_ALLOW
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape target, see metrics_allowed()"""
+    if not metrics_allowed():
+        return jsonify({"status": "error", "message": "Not found"}), 404
+    return Response(metrics.render(), mimetype=metrics.PROMETHEUS_CONTENT_TYPE)
+
+@app.route('/metrics/slow_requests')
+def slow_requests():
+    """The slowest requests the sampling profiler caught (PROFILE_SAMPLE_RATE)"""
+    if not metrics_allowed():
+        return jsonify({"status": "error", "message": "Not found"}), 404
+    return jsonify({"status": "success", "requests": metrics.slowest_requests()})
+
 # Error handlers
 @app.errorhandler(404)
 def page_not_found(e):
@@ -0,0 +1,71 @@
+"""Memory benchmark for in-memory expenses.
+
+Usage: python bench_memory.py [--expenses N] [--users N] [--groups N] [--max-bytes N]
+
+Builds synthetic groups, round-trips them through JSON the way a group file
+is loaded, and measures with tracemalloc how many bytes each expense costs
+as the plain dicts json.load returns and as the compact Expense records
+BillSplitter keeps. Groups share member names, as groups of the same people
+do. Exits with status 1 when a record costs more than --max-bytes.
+"""
+import sys
+import json
+import tracemalloc
+
+from bench_suite import synthetic_expenses
+from expense_record import Expense
+
+DEFAULT_EXPENSES = 20000
+DEFAULT_USERS = 6
+DEFAULT_GROUPS = 5
+
+
+def synthetic_group(expenses, users, seed):
+    """State of a group as to_dict() writes it, with members u0..u<users-1>"""
+    return {'expenses': synthetic_expenses(expenses, users, seed, max_participants=users),
+            'users': [f"u{i}" for i in range(users)]}
+
+
+def measure(payloads, convert):
+    """Bytes held by the converted expenses of every payload"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        groups = []
+        for payload in payloads:
+            groups.append(convert(json.loads(payload)['expenses']))
+        size = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    del groups
+    return size
+
+
+def main(argv):
+    options = {'--expenses': DEFAULT_EXPENSES, '--users': DEFAULT_USERS,
+               '--groups': DEFAULT_GROUPS, '--max-bytes': 0}
+    it = iter(argv)
+    for arg in it:
+        if arg not in options:
+            print(__doc__.strip().splitlines()[2])
+            return 2
+        options[arg] = int(next(it))
+    count = options['--expenses'] * options['--groups']
+
+    payloads = [json.dumps(synthetic_group(options['--expenses'], options['--users'], seed))
+                for seed in range(options['--groups'])]
+    as_dicts = measure(payloads, lambda expenses: expenses)
+    as_records = measure(payloads, lambda expenses: [Expense.from_dict(e) for e in expenses])
+
+    print(f"{count} expenses in {options['--groups']} groups of {options['--users']} users")
+    print(f"  dicts:   {as_dicts / count:7.1f} bytes per expense")
+    print(f"  records: {as_records / count:7.1f} bytes per expense "
+          f"({100 * (1 - as_records / as_dicts):.0f}% smaller)")
+    over = options['--max-bytes'] and as_records / count > options['--max-bytes']
+    if over:
+        print(f"  OVER BUDGET of {options['--max-bytes']} bytes per expense")
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,110 @@
+"""Cold-start import benchmark.
+
+Usage: python bench_startup.py [module ...] [--budget-ms N] [--runs N] [--top N]
+
+Imports each module (default: app and bill_splitter) in fresh interpreters
+with ``python -X importtime``, reports the median import time and the
+dependencies that cost the most, and exits with status 1 when a module takes
+longer than the budget or loads one of the heavy packages that must only be
+imported on first use (HEAVY_MODULES). Runs in a scratch directory because
+importing app creates its data files in the working directory.
+"""
+import os
+import sys
+import json
+import statistics
+import subprocess
+import tempfile
+
+DEFAULT_MODULES = ['app', 'bill_splitter']
+DEFAULT_BUDGET_MS = 400
+
+# Loaded lazily by the code that needs them, never at import time
+HEAVY_MODULES = ['google.generativeai', 'google.api_core', 'qrcode', 'PIL', 'numpy']
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _parse_importtime(stderr):
+    """Return [(depth, name, self_us, cumulative_us)] from -X importtime output"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((depth, name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def measure(module, cwd):
+    """Import module once in a fresh interpreter, returns (rows, heavy modules loaded)"""
+    code = (f"import {module}, sys, json; "
+            f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))")
+    env = dict(os.environ, PYTHONPATH=REPO_DIR + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          cwd=cwd, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+    loaded = json.loads(proc.stdout.strip().splitlines()[-1])
+    return _parse_importtime(proc.stderr), loaded
+
+
+def bench_module(module, runs=5, top=10):
+    with tempfile.TemporaryDirectory() as cwd:
+        totals, breakdowns, loaded = [], [], set()
+        for _ in range(runs):
+            rows, heavy = measure(module, cwd)
+            loaded.update(heavy)
+            # Children are listed before their parent, the target comes last at depth 0
+            end = max(i for i, r in enumerate(rows) if r[0] == 0 and r[1] == module)
+            start = end
+            while start > 0 and rows[start - 1][0] > 0:
+                start -= 1
+            totals.append(rows[end][3])
+            breakdowns.append(rows[start:end])
+
+    # Costliest direct imports of the module in the median run
+    median_run = breakdowns[totals.index(sorted(totals)[len(totals) // 2])]
+    packages = {}
+    for depth, name, _, cumulative in median_run:
+        if depth == 1:
+            packages[name] = packages.get(name, 0) + cumulative
+    costliest = sorted(packages.items(), key=lambda x: -x[1])[:top]
+    return {
+        'module': module,
+        'median_ms': statistics.median(totals) / 1000,
+        'min_ms': min(totals) / 1000,
+        'max_ms': max(totals) / 1000,
+        'costliest_ms': {name: us / 1000 for name, us in costliest},
+        'heavy_loaded': sorted(loaded)
+    }
+
+
+def main(argv):
+    args, options = [], {'--budget-ms': DEFAULT_BUDGET_MS, '--runs': 5, '--top': 10}
+    it = iter(argv)
+    for arg in it:
+        if arg in options:
+            options[arg] = float(next(it))
+        else:
+            args.append(arg)
+    budget = options['--budget-ms']
+
+    failed = False
+    for module in args or DEFAULT_MODULES:
+        result = bench_module(module, runs=int(options['--runs']), top=int(options['--top']))
+        over = result['median_ms'] > budget
+        print(f"{module}: {result['median_ms']:.1f} ms median "
+              f"(min {result['min_ms']:.1f}, max {result['max_ms']:.1f}, budget {budget:.0f})"
+              f"{'  OVER BUDGET' if over else ''}")
+        for name, ms in result['costliest_ms'].items():
+            print(f"  {ms:8.1f} ms  {name}")
+        if result['heavy_loaded']:
+            print(f"  loaded at import time: {', '.join(result['heavy_loaded'])}")
+        failed = failed or over or bool(result['heavy_loaded'])
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
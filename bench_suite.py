@@ -0,0 +1,317 @@
+"""Benchmark suite for BillSplitter and the main Flask routes.
+
+Usage: python bench_suite.py [--sizes 10,1000,100000] [--members 2,500]
+                             [--backends journal,json,sqlite] [--repeat N]
+                             [--max-seconds S] [--seed N] [--no-routes]
+                             [--output FILE] [--baseline FILE] [--tolerance F]
+
+For every backend, group size and member count a seeded synthetic group is
+written to a scratch directory, then each BillSplitter operation is timed
+(load_data is a cold BillSplitter(), calculate_balances drops the settlement
+memo first). The routes are timed through the Flask test client against the
+backend the app is configured for (BILL_SPLITTER_STORAGE), with Gemini
+replaced by llm_client.FakeModel so nothing leaves the machine.
+
+Every case runs --repeat times or until --max-seconds is spent, at least
+once, and is reported as min / median / max milliseconds. --output writes
+the results as JSON; with --baseline the medians are compared with an
+earlier --output file and the run exits with status 1 when a case got more
+than --tolerance slower (and by more than NOISE_MS).
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import datetime
+import platform
+import statistics
+import tempfile
+from contextlib import redirect_stdout
+
+from bill_splitter import BillSplitter
+from ledger import compute_balances
+from storage import SqliteStorage, atomic_write_json
+
+DEFAULT_SIZES = [10, 1000, 100000]
+DEFAULT_MEMBERS = [2, 500]
+DEFAULT_BACKENDS = ['journal', 'json', 'sqlite']
+DEFAULT_TOLERANCE = 0.25
+# Differences below this are timer noise, never a regression
+NOISE_MS = 0.5
+# Most participants in one synthetic expense, whatever the group size
+MAX_PARTICIPANTS = 8
+
+CATEGORIES = ['Food', 'Travel', 'Rent', 'Utilities', 'Entertainment', None]
+# What the stubbed model answers for every message the local parser leaves to it
+FAKE_REPLY = json.dumps({"amount": 340, "paid_by": "u0", "participants": ["u0", "u1"],
+                         "description": "cab fare", "date": "2024-06-01", "category": "Travel"})
+
+
+def synthetic_expenses(expenses, members, seed=0, max_participants=MAX_PARTICIPANTS):
+    """Expenses in the dict layout, over members u0..u<members-1>, the same for the same seed"""
+    rng = random.Random(seed)
+    names = [f"u{i}" for i in range(members)]
+    start = datetime.date(2024, 1, 1)
+    rows = []
+    for expense_id in range(1, expenses + 1):
+        participants = rng.sample(names, rng.randint(min(2, members), min(members, max_participants)))
+        expense = {
+            'id': expense_id,
+            'paid_by': rng.choice(participants),
+            'amount': rng.randint(100, 500000) / 100,
+            'description': f"Expense {expense_id}",
+            'date': (start + datetime.timedelta(days=rng.randrange(365))).isoformat(),
+            'participants': participants
+        }
+        category = rng.choice(CATEGORIES)
+        if category:
+            expense['category'] = category
+        rows.append(expense)
+    return rows
+
+
+def write_group(path, backend, expenses, members, seed=0):
+    """Store a synthetic group at path the way the backend would have saved it"""
+    rows = synthetic_expenses(expenses, members, seed)
+    users = [f"u{i}" for i in range(members)]
+    state = {
+        'expenses': rows,
+        'users': users,
+        'balances_paise': compute_balances(users, rows),
+        'last_expense_id': len(rows)
+    }
+    if backend == 'sqlite':
+        storage = SqliteStorage(path)
+        storage.import_state(state)
+        storage.close()
+    else:
+        atomic_write_json(path, state, indent=None)
+
+
+def timed(fn, repeat, max_seconds):
+    """Run fn up to repeat times within max_seconds, returns the timings in ms"""
+    samples = []
+    deadline = time.perf_counter() + max_seconds
+    while len(samples) < repeat:
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+        if time.perf_counter() > deadline:
+            break
+    return {
+        'min_ms': min(samples),
+        'median_ms': statistics.median(samples),
+        'max_ms': max(samples),
+        'runs': len(samples)
+    }
+
+
+def bench_splitter(path, backend, repeat, max_seconds):
+    """Time the BillSplitter operations on a stored group"""
+    results = {}
+    results['load_data'] = timed(lambda: BillSplitter(path, storage=backend).close(),
+                                 repeat, max_seconds)
+    bs = BillSplitter(path, storage=backend)
+    members = sorted(bs.users)
+    payer, other = members[0], members[-1]
+
+    def calculate_balances():
+        bs._settlements = None
+        bs.calculate_balances()
+
+    balances = {user: 0 for user in bs.users}
+    balances.update(bs.balances)
+    cases = {
+        'calculate_balances': calculate_balances,
+        '_simplify_settlements': lambda: bs._simplify_settlements(balances),
+        'get_user_expenses': lambda: bs.get_user_expenses(payer),
+        'get_user_summary': lambda: bs.get_user_summary(payer),
+        'get_expense_summary': bs.get_expense_summary,
+        'expense_page': lambda: bs.expense_page('owed', payer),
+        # The synthetic expenses are dated across 2024
+        'get_spending_summary': lambda: bs.get_spending_summary('2024-03-10', '2024-08-20'),
+        'get_spending_rollup': lambda: bs.get_spending_rollup('month'),
+        'get_balances_as_of': lambda: bs.get_balances_as_of('2024-06-15'),
+        # Last, so the other cases see the group as it was generated
+        'add_expense': lambda: bs.add_expense(payer, 123.45, "Benchmark", [payer, other],
+                                              date="2024-06-01", category="Food")
+    }
+    for name, fn in cases.items():
+        results[name] = timed(fn, repeat, max_seconds)
+    bs.close()
+    return results
+
+
+class RouteBench:
+    """The Flask app in the current directory with a stubbed model and a logged-in member"""
+
+    def __init__(self):
+        import app as appmod
+        from chatbot_utils import GeminiExpenseChatbot
+        from llm_client import FakeModel
+        from werkzeug.security import generate_password_hash
+        self.app = appmod
+        self.backend = appmod.STORAGE_BACKEND
+        self.model = FakeModel(lambda prompt: FAKE_REPLY)
+        # No rate limit: the benchmark times the app, not the token bucket
+        appmod.chatbot = GeminiExpenseChatbot(model=self.model, fast_path=True,
+                                              resilience={'rate': 1e6, 'burst': 10 ** 6})
+        self.password = generate_password_hash("benchmark")
+        self.client = appmod.app.test_client()
+        self.messages = 0
+
+    def group_path(self, group_id):
+        return self.app.group_storage_file(group_id)
+
+    def join(self, group_id, members):
+        """Give every member an account in the group, then log in as u0"""
+        with self.app.user_store.transaction() as users:
+            for member in members:
+                account = users.setdefault(member, {'password': self.password,
+                                                    'email': f"{member}@example.com",
+                                                    'groups': {}})
+                account['groups'][group_id] = {'name': group_id,
+                                               'role': 'admin' if member == 'u0' else 'member'}
+        with self.client.session_transaction() as session:
+            session['username'] = 'u0'
+
+    def message(self, text):
+        # Distinct messages, so the parse cache never answers for the model
+        self.messages += 1
+        return {'message': f"{text} #{self.messages}"}
+
+    def chatbot(self, group_id):
+        """Post a message the local parser cannot take and poll its job until it is done"""
+        response = self.client.post(f'/group/{group_id}/chatbot',
+                                    json=self.message("Split the cab fare between u0 and u1"))
+        data = response.get_json()
+        while data.get('status') == 'queued' or data.get('status') == 'pending':
+            time.sleep(0.001)
+            data = self.client.get(data.get('status_url') or
+                                   f"/group/{group_id}/chatbot/jobs/{data['job_id']}").get_json()
+        return data
+
+    def run(self, group_id, repeat, max_seconds):
+        client = self.client
+        etag = client.get(f'/api/group/{group_id}/state').headers.get('ETag')
+        cases = {
+            'GET dashboard': lambda: client.get(f'/group/{group_id}'),
+            'GET api state': lambda: client.get(f'/api/group/{group_id}/state'),
+            'GET api state 304': lambda: client.get(f'/api/group/{group_id}/state',
+                                                    headers={'If-None-Match': etag}),
+            'GET expenses page': lambda: client.get(f'/group/{group_id}/expenses?list=owed'),
+            'POST chatbot fast path': lambda: client.post(
+                f'/group/{group_id}/chatbot', json=self.message("u0 paid 120 for lunch with u1")),
+            'POST chatbot model': lambda: self.chatbot(group_id),
+            'POST add_expense': lambda: client.post(f'/group/{group_id}/add_expense', data={
+                'paid_by': 'u0', 'amount': '99.50', 'description': 'Benchmark',
+                'participants': ['u0', 'u1'], 'category': 'Food'})
+        }
+        # The chatbot prints every parse, keep that out of the report
+        with redirect_stdout(io.StringIO()):
+            return {name: timed(fn, repeat, max_seconds) for name, fn in cases.items()}
+
+
+def compare(results, baseline, tolerance):
+    """Cases whose median got slower than the baseline allows, as printable lines"""
+    regressions = []
+    for case, result in results.items():
+        before = baseline.get(case)
+        if before is None:
+            continue
+        slower = result['median_ms'] - before['median_ms']
+        if slower > NOISE_MS and result['median_ms'] > before['median_ms'] * (1 + tolerance):
+            regressions.append(f"{case}: {before['median_ms']:.2f} -> {result['median_ms']:.2f} ms "
+                               f"(+{100 * slower / before['median_ms']:.0f}%)")
+    return regressions
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(',') if v]
+
+
+def main(argv):
+    options = {'--sizes': DEFAULT_SIZES, '--members': DEFAULT_MEMBERS,
+               '--backends': DEFAULT_BACKENDS, '--repeat': 5, '--max-seconds': 5.0,
+               '--seed': 0, '--output': None, '--baseline': None,
+               '--tolerance': DEFAULT_TOLERANCE, '--no-routes': False}
+    parsers = {'--sizes': _int_list, '--members': _int_list,
+               '--backends': lambda v: v.split(','), '--repeat': int, '--max-seconds': float,
+               '--seed': int, '--output': str, '--baseline': str, '--tolerance': float}
+    it = iter(argv)
+    for arg in it:
+        if arg == '--no-routes':
+            options[arg] = True
+        elif arg in parsers:
+            options[arg] = parsers[arg](next(it))
+        else:
+            print(__doc__.strip().split('\n\n')[1])
+            return 2
+
+    results = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        # The app keeps its accounts and groups in the working directory
+        cwd = os.getcwd()
+        os.chdir(scratch)
+        try:
+            routes = None if options['--no-routes'] else RouteBench()
+            for size in options['--sizes']:
+                for members in options['--members']:
+                    backends = list(options['--backends'])
+                    if routes is not None and routes.backend not in backends:
+                        backends.append(routes.backend)
+                    for backend in backends:
+                        group_id = f"bench_{backend}_{size}x{members}"
+                        path = (routes.group_path(group_id) if routes is not None and
+                                backend == routes.backend else
+                                f"{group_id}.{'db' if backend == 'sqlite' else 'json'}")
+                        started = time.perf_counter()
+                        write_group(path, backend, size, members, options['--seed'])
+                        print(f"{backend} {size} expenses x {members} members "
+                              f"(generated in {time.perf_counter() - started:.1f} s)")
+                        cases = {}
+                        if backend in options['--backends']:
+                            cases.update(bench_splitter(path, backend, options['--repeat'],
+                                                        options['--max-seconds']))
+                        if routes is not None and backend == routes.backend:
+                            routes.join(group_id, [f"u{i}" for i in range(members)])
+                            cases.update(routes.run(group_id, options['--repeat'],
+                                                    options['--max-seconds']))
+                        for name, result in cases.items():
+                            results[f"{backend}/{size}x{members}/{name}"] = result
+                            print(f"  {name:24} {result['median_ms']:10.2f} ms median "
+                                  f"(min {result['min_ms']:.2f}, max {result['max_ms']:.2f}, "
+                                  f"{result['runs']} runs)")
+        finally:
+            os.chdir(cwd)
+
+    if options['--output']:
+        report = {
+            'meta': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'seed': options['--seed'],
+                'created': datetime.datetime.now().isoformat(timespec='seconds')
+            },
+            'results': results
+        }
+        with open(options['--output'], 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {len(results)} results to {options['--output']}")
+
+    if options['--baseline']:
+        with open(options['--baseline'], 'r') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, options['--tolerance'])
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        print(f"{len(regressions)} of {len(results)} cases slower than the baseline allows "
+              f"(tolerance {100 * options['--tolerance']:.0f}%)")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
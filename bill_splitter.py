@@ -1,47 +1,752 @@
-import os
-import json
+import sys
+import bisect
+import logging
 import datetime
+import threading
 from collections import defaultdict
+from contextlib import contextmanager
+
+from expense_record import Expense, expense_size
+import metrics
+from ledger import to_paise, from_paise, expense_deltas, expense_shares, compute_balances
+from settlement import settle, DEFAULT_TIME_BUDGET
+from storage import open_storage
+
+logger = logging.getLogger(__name__)
+
+# Expenses sampled by BillSplitter.estimated_size()
+SIZE_SAMPLE = 16
+# Approximate cost of an expense's id, payer and participant index entries
+INDEX_BYTES_PER_EXPENSE = 300
+# Approximate cost of an expense's id and balance deltas in the date index
+DATE_INDEX_BYTES_PER_EXPENSE = 120
+# Lists expense_page() serves: every expense, those a user paid, those a user owes on
+EXPENSE_LISTS = ('all', 'paid', 'owed')
+# Periods get_spending_rollup() groups by
+SPENDING_PERIODS = ('day', 'month')
+
+class ExpenseIndex:
+    """In-memory lookups by expense id, payer and participant"""
+    
+    def __init__(self, expenses=()):
+        self.by_id = {}
+        # user -> {expense id: expense}, kept in id order
+        self.paid = defaultdict(dict)
+        self.participating = defaultdict(dict)
+        # user -> sorted ids of the expenses they paid, and of those they share without
+        # having paid; pages of either list are sliced out with bisect
+        self.paid_ids = defaultdict(list)
+        self.owing_ids = defaultdict(list)
+        for expense in expenses:
+            self.add(expense)
+    
+    def add(self, expense):
+        expense_id = expense['id']
+        self.by_id[expense_id] = expense
+        self._insert(self.paid[expense['paid_by']], expense)
+        bisect.insort(self.paid_ids[expense['paid_by']], expense_id)
+        for participant in set(expense['participants']):
+            self._insert(self.participating[participant], expense)
+            if participant != expense['paid_by']:
+                bisect.insort(self.owing_ids[participant], expense_id)
+    
+    def remove(self, expense):
+        expense_id = expense['id']
+        self.by_id.pop(expense_id, None)
+        self.paid[expense['paid_by']].pop(expense_id, None)
+        self._discard(self.paid_ids[expense['paid_by']], expense_id)
+        for participant in set(expense['participants']):
+            self.participating[participant].pop(expense_id, None)
+            if participant != expense['paid_by']:
+                self._discard(self.owing_ids[participant], expense_id)
+    
+    @staticmethod
+    def _discard(ids, expense_id):
+        i = bisect.bisect_left(ids, expense_id)
+        if i < len(ids) and ids[i] == expense_id:
+            del ids[i]
+    
+    @staticmethod
+    def _insert(bucket, expense):
+        expense_id = expense['id']
+        out_of_order = bool(bucket) and expense_id < next(reversed(bucket))
+        bucket[expense_id] = expense
+        if out_of_order:
+            # Only an edit moving an older expense into this bucket gets here
+            items = sorted(bucket.items())
+            bucket.clear()
+            bucket.update(items)
+    
+    def paid_by(self, username):
+        return list(self.paid.get(username, {}).values())
+    
+    def with_participant(self, username):
+        return list(self.participating.get(username, {}).values())
+    
+    def page(self, kind, username, before, limit):
+        """Up to limit expenses from the 'paid' or 'owed' list with ids below before, newest first"""
+        ids = (self.paid_ids if kind == 'paid' else self.owing_ids).get(username, [])
+        end = len(ids) if before is None else bisect.bisect_left(ids, before)
+        return [self.by_id[i] for i in reversed(ids[max(0, end - limit):end])]
+
+class ExpenseAggregates:
+    """Running totals in paise by category, by month and by user and category"""
+    
+    def __init__(self, expenses=()):
+        self.total = 0
+        self.categories = {}
+        self.months = {}
+        # user -> total they paid
+        self.paid = {}
+        # user -> category -> that user's share
+        self.user_categories = defaultdict(dict)
+        for expense in expenses:
+            self.add(expense)
+    
+    def add(self, expense, sign=1):
+        """Add (sign=1) or take out (sign=-1) an expense"""
+        amount = sign * to_paise(expense['amount'])
+        category = expense.get('category', 'Uncategorized')
+        self.total += amount
+        self._bump(self.categories, category, amount)
+        self._bump(self.months, (expense.get('date') or 'Unknown')[:7], amount)
+        self._bump(self.paid, expense['paid_by'], amount)
+        for participant, share in expense_shares(expense):
+            self._bump(self.user_categories[participant], category, sign * share)
+    
+    def recategorize(self, expense, category):
+        """Move an expense into another category bucket"""
+        self.add(expense, sign=-1)
+        expense = dict(expense, category=category)
+        self.add(expense)
+    
+    @staticmethod
+    def _bump(bucket, key, amount):
+        value = bucket.get(key, 0) + amount
+        if value:
+            bucket[key] = value
+        else:
+            bucket.pop(key, None)
+
+class Period:
+    """Totals in paise of the expenses dated on one day, or in one month"""
+    __slots__ = ('total', 'count', 'categories', 'deltas')
+    
+    _bump = staticmethod(ExpenseAggregates._bump)
+    
+    def __init__(self):
+        self.total = 0
+        self.count = 0
+        self.categories = {}
+        # user -> change in their net balance
+        self.deltas = {}
+    
+    def merge(self, other):
+        """Add the totals of another period"""
+        self.total += other.total
+        self.count += other.count
+        for category, amount in other.categories.items():
+            self._bump(self.categories, category, amount)
+        for user, delta in other.deltas.items():
+            self._bump(self.deltas, user, delta)
+    
+    def add(self, amount, category, deltas, sign=1):
+        """Add (sign=1) or take out (sign=-1) an expense of amount paise and its balance deltas"""
+        self.total += sign * amount
+        self.count += sign
+        self._bump(self.categories, category, sign * amount)
+        own = self.deltas
+        for user, delta in deltas.items():
+            # _bump inlined, this runs for every participant of every expense
+            value = own.get(user, 0) + sign * delta
+            if value:
+                own[user] = value
+            else:
+                own.pop(user, None)
+
+class DateIndex:
+    """Expenses by date, for range totals and balances as of a date.
+    
+    days and months are the sorted dates (and YYYY-MM months) that have
+    expenses, each with a Period of totals; a date range is two bisects
+    into days. Prefix sums of the daily totals and counts, and every user's
+    balance before each month, are rebuilt lazily from the earliest day or
+    month a change touched, so adding today's expense only redoes the tail.
+    Expenses without a date are left out.
+    """
+    
+    def __init__(self, expenses=()):
+        self.days = []
+        self.months = []
+        self.by_day = {}
+        self.by_month = {}
+        # date -> ids of the expenses on that day, sorted
+        self.day_ids = {}
+        # _totals[i] and _counts[i] sum days[:i]; entries past _days_valid + 1 are stale
+        self._totals = [0]
+        self._counts = [0]
+        self._days_valid = 0
+        # _balances[i] is every user's balance before months[i], the last one after all of them
+        self._balances = [{}]
+        self._months_valid = 0
+        self._build(expenses)
+    
+    def _build(self, expenses):
+        """Index expenses given in id order, days first and then each month from its days"""
+        for expense in expenses:
+            date = expense.get('date')
+            if not date:
+                continue
+            period = self.by_day.get(date)
+            if period is None:
+                period = self.by_day[date] = Period()
+                self.day_ids[date] = []
+            self.day_ids[date].append(expense['id'])
+            period.add(to_paise(expense['amount']), expense.get('category', 'Uncategorized'),
+                       expense_deltas(expense))
+        self.days = sorted(self.by_day)
+        for date in self.days:
+            month = self.by_month.get(date[:7])
+            if month is None:
+                month = self.by_month[date[:7]] = Period()
+            month.merge(self.by_day[date])
+        self.months = sorted(self.by_month)
+    
+    def add(self, expense):
+        date = expense.get('date')
+        if not date:
+            return
+        bisect.insort(self.day_ids.setdefault(date, []), expense['id'])
+        self._update(expense, date, 1)
+    
+    def remove(self, expense):
+        date = expense.get('date')
+        if not date:
+            return
+        ids = self.day_ids[date]
+        ExpenseIndex._discard(ids, expense['id'])
+        if not ids:
+            del self.day_ids[date]
+        self._update(expense, date, -1)
+    
+    def recategorize(self, expense, category):
+        """Move an expense into another category bucket"""
+        self.remove(expense)
+        self.add(dict(expense, category=category))
+    
+    def _update(self, expense, date, sign):
+        # Converted once for both the day and the month
+        change = (to_paise(expense['amount']), expense.get('category', 'Uncategorized'),
+                  expense_deltas(expense), sign)
+        i = self._bucket(self.days, self.by_day, date, change)
+        self._days_valid = min(self._days_valid, i)
+        i = self._bucket(self.months, self.by_month, date[:7], change)
+        self._months_valid = min(self._months_valid, i)
+    
+    @staticmethod
+    def _bucket(keys, periods, key, change):
+        """Add a change to the period at key, returns the key's position in keys"""
+        i = bisect.bisect_left(keys, key)
+        period = periods.get(key)
+        if period is None:
+            period = periods[key] = Period()
+            keys.insert(i, key)
+        period.add(*change)
+        if not period.count:
+            del periods[key]
+            del keys[i]
+        return i
+    
+    def _prefix_sums(self):
+        valid = self._days_valid
+        del self._totals[valid + 1:]
+        del self._counts[valid + 1:]
+        total, count = self._totals[-1], self._counts[-1]
+        for date in self.days[valid:]:
+            period = self.by_day[date]
+            total += period.total
+            count += period.count
+            self._totals.append(total)
+            self._counts.append(count)
+        self._days_valid = len(self.days)
+    
+    def _month_balances(self):
+        valid = self._months_valid
+        del self._balances[valid + 1:]
+        balances = dict(self._balances[-1])
+        for month in self.months[valid:]:
+            for user, delta in self.by_month[month].deltas.items():
+                Period._bump(balances, user, delta)
+            self._balances.append(dict(balances))
+        self._months_valid = len(self.months)
+    
+    def span(self, start=None, end=None):
+        """(lo, hi) such that days[lo:hi] are the dates from start to end, both inclusive"""
+        lo = bisect.bisect_left(self.days, start) if start else 0
+        hi = bisect.bisect_right(self.days, end) if end else len(self.days)
+        return lo, max(lo, hi)
+    
+    def totals(self, start=None, end=None):
+        """(total, number of expenses) from start to end"""
+        lo, hi = self.span(start, end)
+        self._prefix_sums()
+        return self._totals[hi] - self._totals[lo], self._counts[hi] - self._counts[lo]
+    
+    def ids(self, start=None, end=None):
+        """Ids of the expenses from start to end, by date"""
+        lo, hi = self.span(start, end)
+        return [expense_id for date in self.days[lo:hi] for expense_id in self.day_ids[date]]
+    
+    def periods(self, start=None, end=None):
+        """(key, Period) pairs that together cover start to end.
+        
+        A month wholly inside the range is one month Period, the days of the
+        months cut by either end come one by one, so the cost grows with the
+        months spanned plus at most two months of days.
+        """
+        lo, hi = self.span(start, end)
+        self._prefix_sums()
+        i = lo
+        while i < hi:
+            month = self.days[i][:7]
+            # Past the last day of the month, every one of them starts with it
+            j = bisect.bisect_left(self.days, month + '\uffff', i)
+            period = self.by_month[month]
+            if (j <= hi and i == bisect.bisect_left(self.days, month, 0, i + 1) and
+                    self._counts[j] - self._counts[i] == period.count):
+                yield month, period
+                i = j
+                continue
+            for date in self.days[i:min(j, hi)]:
+                yield date, self.by_day[date]
+            i = min(j, hi)
+    
+    def categories(self, start=None, end=None):
+        """Category totals from start to end"""
+        categories = {}
+        for _, period in self.periods(start, end):
+            for category, amount in period.categories.items():
+                Period._bump(categories, category, amount)
+        return categories
+    
+    def rollup(self, by='month', start=None, end=None):
+        """[(day or month, total, number of expenses)] from start to end, in date order"""
+        if by == 'day':
+            lo, hi = self.span(start, end)
+            return [(date, self.by_day[date].total, self.by_day[date].count)
+                    for date in self.days[lo:hi]]
+        rows = {}
+        for key, period in self.periods(start, end):
+            row = rows.setdefault(key[:7], [0, 0])
+            row[0] += period.total
+            row[1] += period.count
+        return [(month, total, count) for month, (total, count) in rows.items()]
+    
+    def balances_as_of(self, date):
+        """Every user's net balance over the expenses dated up to and including date"""
+        self._month_balances()
+        # Months before the date's month are whole, its own days are added one by one
+        k = bisect.bisect_left(self.months, date[:7])
+        balances = dict(self._balances[k])
+        if k < len(self.months):
+            lo = bisect.bisect_left(self.days, self.months[k])
+            hi = bisect.bisect_right(self.days, date)
+            for day in self.days[lo:hi]:
+                for user, delta in self.by_day[day].deltas.items():
+                    Period._bump(balances, user, delta)
+        return balances
 
 class BillSplitter:
-    def __init__(self, storage_file="expenses.json"):
+    def __init__(self, storage_file="expenses.json", storage='json', verify_ledger=False,
+                 settlement_strategy='auto', settlement_time_budget=DEFAULT_TIME_BUDGET):
         self.storage_file = storage_file
-        self.expenses = []
+        self.settlement_strategy = settlement_strategy
+        self.settlement_time_budget = settlement_time_budget
+        self.storage = open_storage(storage_file, storage)
+        self._expenses = []
+        # Secondary indexes and running totals over self._expenses, built on first use
+        self._index = None
+        self._aggregates = None
+        self._date_index = None
         self.users = set()
+        # Running net balance per user in paise, kept in step with every change
+        self.balances = {}
+        self._last_expense_id = 0
+        # Bumped by every change record, stored with the group so all workers agree on it
+        self.version = 0
+        # (version, strategy, time budget) -> settlement report, see calculate_balances()
+        self._settlements = None
+        # Storage stamp as of our last load or write, see refresh()
+        self._stamp = None
+        # Why the last load failed; the group is neither written nor trusted until a load succeeds
+        self._load_error = None
+        # Change records held back by an open transaction(), None outside one
+        self._pending = None
+        self.lock = threading.RLock()
         self.load_data()
+        if verify_ledger:
+            mismatches = self.verify_balances(repair=True)
+            if mismatches:
+                print(f"Balance ledger for {storage_file} was out of sync, rebuilt: {mismatches}")
     
     def load_data(self):
         """Load existing expense data if available"""
-        if os.path.exists(self.storage_file):
-            try:
-                with open(self.storage_file, 'r') as f:
-                    data = json.load(f)
-                    self.expenses = data.get('expenses', [])
-                    self.users = set(data.get('users', []))
-            except Exception as e:
-                print(f"Error loading data: {e}")
-                self.expenses = []
-                self.users = set()
+        with self.lock, self.storage.lock:
+            self._load_locked()
     
+    @metrics.instrument('bill_splitter.load')
+    def _load_locked(self):
+        try:
+            self._stamp = self.storage.stamp()
+            state, records = self.storage.load()
+            self._expenses = []
+            self._index = None
+            self._aggregates = None
+            self._date_index = None
+            self.users = set()
+            self.balances = {}
+            self._settlements = None
+            state = state or {}
+            self.version = state.get('version', 0)
+            self._expenses = [Expense.from_dict(e) for e in state.get('expenses', [])]
+            self.users = set(state.get('users', []))
+            self._last_expense_id = max([state.get('last_expense_id', 0)] +
+                                        [e.id for e in self._expenses])
+            if 'balances_paise' in state:
+                self.balances = dict(state['balances_paise'])
+            else:
+                # Groups saved before the ledger existed get it rebuilt once
+                self.balances = self._replay_balances()
+            # Replay changes journaled after the last snapshot
+            for record in records:
+                self._apply(record)
+        except Exception as e:
+            # A half-read group must never be written back over the stored one
+            self._load_error = e
+            logger.error(f"Error loading {self.storage_file}: {e}")
+            raise
+        self._load_error = None
+    
+    def refresh(self):
+        """Pick up changes other worker processes made to the stored group.
+        
+        Costs one stat (or SQLite data_version check) when nothing changed.
+        Returns True if the in-memory state was updated; raises if the stored
+        group cannot be read, so no change is written over it.
+        """
+        if self._load_error is None and self.storage.stamp() == self._stamp:
+            return False
+        with self.lock, self.storage.lock:
+            stamp = self.storage.stamp()
+            if self._load_error is None and stamp == self._stamp:
+                return False
+            read_tail = getattr(self.storage, 'read_tail', None)
+            # After a failed load only a full reload will do
+            records = read_tail() if read_tail and self._load_error is None else None
+            if records is None:
+                self._load_locked()
+            else:
+                for record in records:
+                    self._apply(record)
+            self._stamp = stamp
+            return True
+    
+    @property
+    def expenses(self):
+        """All expenses of the group in insertion order"""
+        if self.storage.supports_queries:
+            return self.storage.all_expenses()
+        return self._expenses
+    
+    def iter_expenses(self, start_date=None, end_date=None, paid_by=None, category=None,
+                      chunk_size=500):
+        """Yield expenses in id order, optionally filtered, without copying the whole list.
+
+        Dates are inclusive YYYY-MM-DD bounds; category 'Uncategorized' matches
+        expenses without one. Expenses are copied a chunk at a time under the
+        lock, so changes made meanwhile never break the iteration.
+        """
+        if self.storage.supports_queries:
+            yield from self.storage.iter_expenses(start_date, end_date, paid_by, category, chunk_size)
+            return
+        for chunk in self._expense_chunks(start_date, end_date, chunk_size):
+            for expense in chunk:
+                date = expense.get('date') or ''
+                if ((start_date and date < start_date) or (end_date and date > end_date) or
+                        (paid_by and expense['paid_by'] != paid_by) or
+                        (category and expense.get('category', 'Uncategorized') != category)):
+                    continue
+                yield expense
+    
+    def _expense_chunks(self, start_date, end_date, chunk_size):
+        """Copies of the expenses iter_expenses() filters, chunk_size at a time in id order"""
+        if start_date:
+            # Only the expenses dated in range are visited; without a start date the
+            # undated ones match too, and those are not in the date index
+            with self.lock:
+                ids = sorted(self._dates().ids(start_date, end_date))
+            for i in range(0, len(ids), chunk_size):
+                with self.lock:
+                    by_id = self._indexes().by_id
+                    yield [by_id[e].copy() for e in ids[i:i + chunk_size] if e in by_id]
+            return
+        last_id = 0
+        while True:
+            with self.lock:
+                # Expenses are kept in id order, resume after the last one yielded
+                start = bisect.bisect_right(self._expenses, last_id, key=lambda e: e['id'])
+                chunk = [e.copy() for e in self._expenses[start:start + chunk_size]]
+            yield chunk
+            if len(chunk) < chunk_size:
+                return
+            last_id = chunk[-1]['id']
+
+    def to_dict(self):
+        """Return a serialisable copy of the group state"""
+        with self.lock:
+            return {
+                'expenses': [e.copy() for e in self.expenses],
+                'users': list(self.users),
+                'balances_paise': dict(self.balances),
+                'last_expense_id': self._last_expense_id,
+                'version': self.version
+            }
+    
+    @metrics.instrument('bill_splitter.save_data')
     def save_data(self):
         """Save expense data to file"""
-        data = {
-            'expenses': self.expenses,
-            'users': list(self.users)
-        }
-        with open(self.storage_file, 'w') as f:
-            json.dump(data, f, indent=2)
+        with self.lock, self.storage.lock:
+            if self._load_error is not None:
+                raise RuntimeError(f"Not saving {self.storage_file}, it failed to load: {self._load_error}")
+            self.storage.commit(self, [])
+            self._stamp = self.storage.stamp()
+    
+    @contextmanager
+    def transaction(self):
+        """Group several changes into one atomic write.
+        
+        Inside the block changes apply to memory as usual but are only handed
+        to the storage backend, together, when it exits. If the block raises,
+        nothing is written and the group is reloaded from storage. The group
+        stays locked for the whole block; nested transactions join the
+        outer one.
+        """
+        with self.lock, self.storage.lock:
+            if self._pending is not None:
+                yield self
+                return
+            self.refresh()
+            self._pending = []
+            try:
+                yield self
+            except BaseException:
+                self._pending = None
+                if self.storage.supports_queries:
+                    self.storage.rollback()
+                self._load_locked()
+                raise
+            records, self._pending = self._pending, None
+            if records:
+                # SQLite already holds the staged rows, only the ledger is left to write
+                self.storage.commit(self, [] if self.storage.supports_queries else records)
+                self._stamp = self.storage.stamp()
+    
+    def flush(self):
+        """Make sure everything written so far is on disk"""
+        with self.lock:
+            self.storage.flush()
+    
+    def close(self):
+        """Flush and release the storage backend, it reopens if used again"""
+        with self.lock:
+            self.storage.close()
+    
+    def estimated_size(self):
+        """Rough in-memory footprint in bytes, from a sample of expenses"""
+        size = sys.getsizeof(self.users) + sum(sys.getsizeof(u) for u in self.users)
+        size += sys.getsizeof(self.balances) + 64 * len(self.balances)
+        expenses = self._expenses
+        if expenses:
+            step = max(1, len(expenses) // SIZE_SAMPLE)
+            sample = expenses[::step][:SIZE_SAMPLE]
+            per_expense = sum(expense_size(e) for e in sample) / len(sample)
+            size += sys.getsizeof(expenses) + int(per_expense * len(expenses))
+            if self._index is not None:
+                size += INDEX_BYTES_PER_EXPENSE * len(expenses)
+            if self._date_index is not None:
+                size += DATE_INDEX_BYTES_PER_EXPENSE * len(expenses)
+        return size
+    
+    def _apply(self, record):
+        """Apply a single change record to the in-memory state"""
+        op = record['op']
+        if op == 'add_user':
+            self.users.add(record['username'])
+            self.balances.setdefault(record['username'], 0)
+        elif op == 'add_expense':
+            expense = record['expense']
+            self._apply_to_ledger(self.balances, expense)
+            self._last_expense_id = max(self._last_expense_id, expense['id'])
+            # Backends that answer queries store the expense themselves on commit
+            if not self.storage.supports_queries:
+                # The record keeps its dict, memory gets the compact form
+                expense = Expense.from_dict(expense)
+                self._expenses.append(expense)
+                if self._index is not None:
+                    self._index.add(expense)
+                if self._aggregates is not None:
+                    self._aggregates.add(expense)
+                if self._date_index is not None:
+                    self._date_index.add(expense)
+        elif op == 'update_expense':
+            old = self._find_expense(record['id'])
+            self._apply_to_ledger(self.balances, old, sign=-1)
+            self._apply_to_ledger(self.balances, record['expense'])
+            if not self.storage.supports_queries:
+                if self._aggregates is not None:
+                    self._aggregates.add(old, sign=-1)
+                    self._aggregates.add(record['expense'])
+                if self._date_index is not None:
+                    self._date_index.remove(old)
+                self._index.remove(old)
+                old.update(record['expense'])
+                self._index.add(old)
+                if self._date_index is not None:
+                    self._date_index.add(old)
+        elif op == 'delete_expense':
+            old = self._find_expense(record['id'])
+            self._apply_to_ledger(self.balances, old, sign=-1)
+            if not self.storage.supports_queries:
+                if self._aggregates is not None:
+                    self._aggregates.add(old, sign=-1)
+                if self._date_index is not None:
+                    self._date_index.remove(old)
+                self._index.remove(old)
+                # Kept in id order, so no need to compare it against every expense
+                del self._expenses[bisect.bisect_left(self._expenses, old.id, key=lambda e: e.id)]
+        elif op == 'categorize':
+            if not self.storage.supports_queries:
+                expense = self._find_expense(record['id'])
+                if expense is not None:
+                    if self._aggregates is not None:
+                        self._aggregates.recategorize(expense, record['category'])
+                    if self._date_index is not None:
+                        self._date_index.recategorize(expense, record['category'])
+                    expense['category'] = record['category']
+        else:
+            raise ValueError(f"Unknown change record '{op}'")
+        self.version += 1
+    
+    @staticmethod
+    def _apply_to_ledger(balances, expense, sign=1):
+        """Add (sign=1) or reverse (sign=-1) an expense's effect on net balances"""
+        for user, delta in expense_deltas(expense).items():
+            balances[user] = balances.get(user, 0) + sign * delta
+    
+    def _replay_balances(self):
+        """Compute net balances from scratch over the full expense history"""
+        return compute_balances(self.users, self.expenses)
+    
+    @metrics.instrument('bill_splitter.verify_balances')
+    def verify_balances(self, repair=False):
+        """Check the running ledger against a full replay.
+        
+        Returns {user: (ledger, replayed)} for every user that disagrees; with
+        repair=True the ledger is replaced by the replayed balances.
+        """
+        with self.lock:
+            expected = self._replay_balances()
+            mismatches = {}
+            for user in set(expected) | set(self.balances):
+                ledger = self.balances.get(user, 0)
+                replayed = expected.get(user, 0)
+                if ledger != replayed:
+                    mismatches[user] = (ledger, replayed)
+            if mismatches and repair:
+                self.balances = expected
+                self._settlements = None
+            return mismatches
+    
+    @metrics.instrument('bill_splitter.record')
+    def _record(self, **record):
+        """Apply a change and hand it to the storage backend
+        
+        Holds the group's file lock so writes from several worker processes
+        never interleave, and catches up with their changes first. Returns
+        False if the expense the change targets was removed meanwhile.
+        Inside a transaction() the record is queued instead of committed.
+        """
+        with self.lock, self.storage.lock:
+            if self._pending is not None:
+                self._apply(record)
+                if self.storage.supports_queries:
+                    # Stage it so queries later in the transaction see the change
+                    self.storage.stage(record)
+                self._pending.append(record)
+                return True
+            if self.refresh():
+                if record['op'] == 'add_expense':
+                    record['expense']['id'] = self._next_expense_id()
+                elif 'id' in record and self._find_expense(record['id']) is None:
+                    return False
+            self._apply(record)
+            self.storage.commit(self, [record])
+            self._stamp = self.storage.stamp()
+            return True
+    
+    def _indexes(self):
+        """Return the expense indexes, building them on first use"""
+        if self._index is None:
+            self._index = ExpenseIndex(self._expenses)
+        return self._index
+    
+    def _totals(self):
+        """Return the running aggregates, building them on first use"""
+        if self._aggregates is None:
+            self._aggregates = ExpenseAggregates(self._expenses)
+        return self._aggregates
+    
+    def _dates(self):
+        """Return the date index, building it on first use"""
+        if self._date_index is None:
+            self._date_index = DateIndex(self._expenses)
+        return self._date_index
+    
+    def _find_expense(self, expense_id):
+        """Look up an expense by id"""
+        if self.storage.supports_queries:
+            return self.storage.get_expense(expense_id)
+        return self._indexes().by_id.get(expense_id)
+    
+    def _expenses_paid_by(self, username):
+        if self.storage.supports_queries:
+            return self.storage.expenses_paid_by(username)
+        return self._indexes().paid_by(username)
+    
+    def _expenses_with_participant(self, username):
+        if self.storage.supports_queries:
+            return self.storage.expenses_with_participant(username)
+        return self._indexes().with_participant(username)
+    
+    @property
+    def last_expense_id(self):
+        """Id of the most recently added expense, 0 if there is none"""
+        return self._last_expense_id
+    
+    def _next_expense_id(self):
+        if self.storage.supports_queries:
+            return max(self._last_expense_id, self.storage.max_expense_id()) + 1
+        return self._last_expense_id + 1
     
     def add_user(self, username):
         """Add a new user to the system"""
         if username in self.users:
             return f"User '{username}' already exists."
         
-        self.users.add(username)
-        self.save_data()
+        self._record(op='add_user', username=username)
         return f"User '{username}' added successfully."
     
-    def add_expense(self, paid_by, amount, description, participants=None, date=None):
+    def add_expense(self, paid_by, amount, description, participants=None, date=None, category=None):
         """Add a new expense to the system"""
         # Validate user
         if paid_by not in self.users:
@@ -62,147 +767,275 @@ class BillSplitter:
         
         # Create expense record
         expense = {
-            'id': len(self.expenses) + 1,
+            'id': self._next_expense_id(),
             'paid_by': paid_by,
-            'amount': float(amount),
+            'amount': from_paise(to_paise(amount)),
             'description': description,
             'date': date,
             'participants': participants
         }
+        if category:
+            expense['category'] = category
         
-        self.expenses.append(expense)
-        self.save_data()
+        self._record(op='add_expense', expense=expense)
         return f"Expense '{description}' ({amount}) added successfully."
 
+    def update_expense(self, expense_id, paid_by=None, amount=None, description=None,
+                       participants=None, date=None):
+        """Edit an existing expense, only the given fields change"""
+        expense = self._find_expense(expense_id)
+        if expense is None:
+            return f"Error: Expense {expense_id} not found."
+        
+        updated = expense.copy()
+        if paid_by is not None:
+            if paid_by not in self.users:
+                return f"Error: User '{paid_by}' does not exist."
+            updated['paid_by'] = paid_by
+        if amount is not None:
+            updated['amount'] = from_paise(to_paise(amount))
+        if description is not None:
+            updated['description'] = description
+        if date is not None:
+            updated['date'] = date
+        if participants:
+            for participant in participants:
+                if participant not in self.users:
+                    return f"Error: Participant '{participant}' does not exist."
+            updated['participants'] = list(participants)
+        
+        if not self._record(op='update_expense', id=expense_id, expense=updated):
+            return f"Error: Expense {expense_id} not found."
+        return f"Expense {expense_id} updated successfully."
+    
+    def delete_expense(self, expense_id):
+        """Remove an expense and reverse its effect on balances"""
+        if self._find_expense(expense_id) is None:
+            return f"Error: Expense {expense_id} not found."
+        if not self._record(op='delete_expense', id=expense_id):
+            return f"Error: Expense {expense_id} not found."
+        return f"Expense {expense_id} deleted successfully."
+
     def categorize_expense(self, expense_id, category):
         """Categorize an expense"""
-        for expense in self.expenses:
-            if expense['id'] == expense_id:
-                expense['category'] = category
-                self.save_data()
-                return f"Expense {expense_id} categorized as '{category}'."
-        return f"Error: Expense {expense_id} not found."
+        if self._find_expense(expense_id) is None:
+            return f"Error: Expense {expense_id} not found."
+        if not self._record(op='categorize', id=expense_id, category=category):
+            return f"Error: Expense {expense_id} not found."
+        return f"Expense {expense_id} categorized as '{category}'."
 
+    @metrics.instrument('bill_splitter.get_expense_summary')
     def get_expense_summary(self):
         """Get a summary of all expenses as a dictionary"""
-        if not self.expenses:
-            return {
-                'total_amount': 0,
-                'categories': {}
-            }
+        if self.storage.supports_queries:
+            total_amount, categories = self.storage.expense_summary()
+        else:
+            totals = self._totals()
+            total_amount, categories = totals.total, totals.categories
+        
+        return {
+            'total_amount': from_paise(total_amount),
+            'categories': {c: from_paise(a) for c, a in categories.items()}
+        }
     
-        total_amount = sum(expense['amount'] for expense in self.expenses)
-        categories = defaultdict(float)
+    def get_monthly_summary(self):
+        """Get total spending per month (YYYY-MM)"""
+        if self.storage.supports_queries:
+            months = self.storage.monthly_totals()
+        else:
+            months = self._totals().months
+        return {month: from_paise(months[month]) for month in sorted(months)}
     
-        for expense in self.expenses:
-            category = expense.get('category', 'Uncategorized')
-            categories[category] += expense['amount']
+    def get_user_category_summary(self, username=None):
+        """Get each user's share of spending per category, or one user's if given"""
+        if self.storage.supports_queries:
+            totals = self.storage.user_category_totals(username)
+        else:
+            user_categories = self._totals().user_categories
+            if username is not None:
+                totals = {username: user_categories.get(username, {})}
+            else:
+                totals = user_categories
+        return {user: {c: from_paise(a) for c, a in categories.items()}
+                for user, categories in totals.items() if categories}
     
+    @metrics.instrument('bill_splitter.get_spending_summary')
+    def get_spending_summary(self, start_date=None, end_date=None):
+        """Total, expense count and category totals of the expenses dated in a range.
+        
+        Dates are inclusive YYYY-MM-DD bounds, None leaves that end open.
+        Expenses without a date are left out. Answered from the date index
+        (or the indexed date column on SQLite) without scanning the group.
+        """
+        if self.storage.supports_queries:
+            total_amount, count, categories = self.storage.date_range_summary(start_date, end_date)
+        else:
+            with self.lock:
+                dates = self._dates()
+                total_amount, count = dates.totals(start_date, end_date)
+                categories = dates.categories(start_date, end_date)
+        
         return {
-            'total_amount': total_amount,
-            'categories': dict(categories)  # Convert defaultdict to regular dict
-         }
-    
-    def calculate_balances(self):
-        """Calculate who owes whom how much"""
-        # Initialize balances dictionary
-        balances = {user: 0 for user in self.users}
+            'start_date': start_date,
+            'end_date': end_date,
+            'total_amount': from_paise(total_amount),
+            'expense_count': count,
+            'categories': {c: from_paise(a) for c, a in sorted(categories.items())}
+        }
+    
+    @metrics.instrument('bill_splitter.get_spending_rollup')
+    def get_spending_rollup(self, period='month', start_date=None, end_date=None):
+        """Total and expense count per day or month from start_date to end_date, in date order"""
+        if period not in SPENDING_PERIODS:
+            raise ValueError(f"Unknown period '{period}'")
+        if self.storage.supports_queries:
+            rows = self.storage.period_totals(period, start_date, end_date)
+        else:
+            with self.lock:
+                rows = self._dates().rollup(period, start_date, end_date)
+        return [{'period': key, 'total_amount': from_paise(total), 'expense_count': count}
+                for key, total, count in rows]
+    
+    @metrics.instrument('bill_splitter.get_balances_as_of')
+    def get_balances_as_of(self, date):
+        """Each member's net balance over the expenses dated up to and including date"""
+        with self.lock:
+            if self.storage.supports_queries:
+                balances = self.storage.balances_as_of(date, self.balances)
+            else:
+                balances = self._dates().balances_as_of(date)
+            return {user: from_paise(balances.get(user, 0)) for user in sorted(self.users)}
+    
+    @metrics.instrument('bill_splitter.calculate_balances')
+    def calculate_balances(self, strategy=None, time_budget=None, with_strategy=False):
+        """Calculate who owes whom how much
         
-        # Calculate net balances
-        for expense in self.expenses:
-            payer = expense['paid_by']
-            amount = expense['amount']
-            participants = expense['participants']
-            
-            # Skip if no participants
-            if not participants:
-                continue
+        strategy is one of settlement.STRATEGIES (defaults to the splitter's
+        settlement_strategy) and time_budget the wall-clock seconds it may spend.
+        With with_strategy=True the full settlement report is returned, which
+        includes the strategy that was actually used.
+        """
+        strategy = strategy or self.settlement_strategy
+        time_budget = self.settlement_time_budget if time_budget is None else time_budget
+        with self.lock:
+            key = (self.version, strategy, time_budget)
+            if self._settlements is None or self._settlements[0] != key:
+                # Net balances come from the running ledger, no replay needed
+                balances = {user: 0 for user in self.users}
+                balances.update(self.balances)
                 
-            # Calculate share per person
-            share = amount / len(participants)
-            
-            # Add full amount to payer
-            balances[payer] += amount
-            
-            # Subtract each participant's share
-            for participant in participants:
-                balances[participant] -= share
-        
-        # Convert balances to settlement transactions
-        settlements = self._simplify_settlements(balances)
+                # Convert balances to settlement transactions
+                result = settle(balances, strategy=strategy, time_budget=time_budget)
+                result['settlements'] = [dict(s, amount=from_paise(s['amount'])) for s in result['settlements']]
+                # Unchanged groups get the same answer again without another search
+                self._settlements = (key, result)
+            result = self._settlements[1]
         
+        # Copies, callers are free to annotate them
+        settlements = [dict(s) for s in result['settlements']]
+        if with_strategy:
+            return dict(result, settlements=settlements)
         return settlements
     
     def _simplify_settlements(self, balances):
-        """Simplify the settlement transactions"""
-        # Separate debtors and creditors
-        debtors = [(user, balance) for user, balance in balances.items() if balance < 0]
-        creditors = [(user, balance) for user, balance in balances.items() if balance > 0]
-        
-        # Sort by absolute amount (descending)
-        debtors.sort(key=lambda x: x[1])
-        creditors.sort(key=lambda x: x[1], reverse=True)
-        
-        settlements = []
-        
-        # Match debtors with creditors
-        i, j = 0, 0
-        while i < len(debtors) and j < len(creditors):
-            debtor, debt = debtors[i]
-            creditor, credit = creditors[j]
-            
-            # Determine the transaction amount
-            amount = min(abs(debt), credit)
-            
-            if amount > 0.01:  # Ignore very small amounts
-                settlements.append({
-                    'from': debtor,
-                    'to': creditor,
-                    'amount': round(amount, 2)
-                })
-            
-            # Update remaining balances
-            debtors[i] = (debtor, debt + amount)
-            creditors[j] = (creditor, credit - amount)
-            
-            # Move to next person if their balance is settled
-            if abs(debtors[i][1]) < 0.01:
-                i += 1
-            if creditors[j][1] < 0.01:
-                j += 1
-        
-        return settlements
+        """Simplify the settlement transactions, balances are in paise"""
+        settlements = settle(balances, strategy='greedy')['settlements']
+        return [dict(s, amount=from_paise(s['amount'])) for s in settlements]
     
+    @metrics.instrument('bill_splitter.get_user_expenses')
     def get_user_expenses(self, username):
         """Get all expenses for a specific user"""
         if username not in self.users:
             return f"Error: User '{username}' does not exist."
         
         # Expenses paid by the user
-        paid_expenses = [e for e in self.expenses if e['paid_by'] == username]
+        paid_expenses = self._expenses_paid_by(username)
         
         # Expenses where the user is a participant
-        participating_expenses = [e for e in self.expenses if username in e['participants']]
+        participating_expenses = self._expenses_with_participant(username)
         
-        # Calculate total paid and owed
-        total_paid = sum(e['amount'] for e in paid_expenses)
+        # Calculate total paid and owed in paise
+        total_paid = sum(to_paise(e['amount']) for e in paid_expenses)
         
         total_owed = 0
         for expense in participating_expenses:
-            share = expense['amount'] / len(expense['participants'])
-            total_owed += share
+            for participant, share in expense_shares(expense):
+                if participant == username:
+                    total_owed += share
         
         # Calculate net balance
         net_balance = total_paid - total_owed
         
         return {
             'username': username,
-            'total_paid': round(total_paid, 2),
-            'total_owed': round(total_owed, 2),
-            'net_balance': round(net_balance, 2),
+            'total_paid': from_paise(total_paid),
+            'total_owed': from_paise(total_owed),
+            'net_balance': from_paise(net_balance),
             'paid_expenses': paid_expenses,
             'participating_expenses': participating_expenses
         }
+    
+    def get_net_balances(self):
+        """Each member's net balance, positive if they are owed money"""
+        with self.lock:
+            return {user: from_paise(self.balances.get(user, 0)) for user in sorted(self.users)}
+    
+    @metrics.instrument('bill_splitter.get_user_summary')
+    def get_user_summary(self, username):
+        """A user's totals as in get_user_expenses(), without the expense lists"""
+        if username not in self.users:
+            return f"Error: User '{username}' does not exist."
+        
+        if self.storage.supports_queries:
+            total_paid = self.storage.total_paid_by(username)
+        else:
+            total_paid = self._totals().paid.get(username, 0)
+        # The running ledger already holds paid minus owed
+        net_balance = self.balances.get(username, 0)
+        total_owed = total_paid - net_balance
+        
+        return {
+            'username': username,
+            'total_paid': from_paise(total_paid),
+            'total_owed': from_paise(total_owed),
+            'net_balance': from_paise(net_balance)
+        }
+    
+    @metrics.instrument('bill_splitter.expense_page')
+    def expense_page(self, kind='all', username=None, before=None, limit=20):
+        """One page of an expense list, newest first.
+        
+        kind is one of EXPENSE_LISTS: 'all' expenses, those username 'paid',
+        or those username shares without having paid ('owed', each with the
+        user's 'share'). before is the cursor returned with the previous page.
+        Returns (expenses, cursor of the next page or None on the last one);
+        the cost depends on limit, not on the size of the group.
+        """
+        if kind not in EXPENSE_LISTS:
+            raise ValueError(f"Unknown expense list '{kind}'")
+        limit = max(1, limit)
+        if kind != 'all' and username not in self.users:
+            return [], None
+        
+        if self.storage.supports_queries:
+            expenses = self.storage.expense_page(kind, username, before, limit + 1)
+        else:
+            with self.lock:
+                if kind == 'all':
+                    end = len(self._expenses) if before is None else \
+                        bisect.bisect_left(self._expenses, before, key=lambda e: e['id'])
+                    expenses = self._expenses[max(0, end - limit - 1):end][::-1]
+                else:
+                    expenses = self._indexes().page(kind, username, before, limit + 1)
+                expenses = [e.copy() for e in expenses]
+        
+        next_cursor = expenses[limit - 1]['id'] if len(expenses) > limit else None
+        expenses = expenses[:limit]
+        if kind == 'owed':
+            for expense in expenses:
+                expense['share'] = from_paise(sum(share for participant, share in expense_shares(expense)
+                                                  if participant == username))
+        return expenses, next_cursor
 
 # Sample CLI interface for the bill splitter
 def run_cli():
@@ -314,5 +1147,96 @@ def run_cli():
         else:
             print("Invalid choice. Please try again.")
 
+def run_import(argv):
+    """python bill_splitter.py import GROUP_FILE CSV_FILE [--storage B] [--batch-size N]"""
+    import os
+    import argparse
+    from csv_import import import_expenses_csv, CSVImportError, DEFAULT_BATCH_SIZE
+    
+    parser = argparse.ArgumentParser(prog="bill_splitter.py import",
+                                     description="Bulk import expenses from a CSV file into a group")
+    parser.add_argument('group_file', help="group storage file, e.g. group_20250101120000.json")
+    parser.add_argument('csv_file', help="CSV with paid_by, amount and optionally description, "
+                                         "participants, date and category columns ('-' for stdin)")
+    parser.add_argument('--storage', default=os.environ.get('BILL_SPLITTER_STORAGE', 'journal'),
+                        choices=['json', 'journal', 'sqlite'])
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help="rows written per transaction")
+    args = parser.parse_args(argv)
+    
+    bs = BillSplitter(storage_file=args.group_file, storage=args.storage)
+    try:
+        if args.csv_file == '-':
+            report = import_expenses_csv(bs, sys.stdin, batch_size=args.batch_size)
+        else:
+            with open(args.csv_file, 'r', encoding='utf-8-sig', newline='') as f:
+                report = import_expenses_csv(bs, f, batch_size=args.batch_size)
+    except CSVImportError as e:
+        print(f"Import failed: {e}")
+        return 1
+    finally:
+        bs.close()
+    
+    print(f"Imported {report['imported']} expenses in {report['batches']} batches, "
+          f"rejected {report['rejected']} rows")
+    for error in report['errors']:
+        print(f"  line {error['line']}: {error['message']}")
+    if report['rejected'] > len(report['errors']):
+        print(f"  ... and {report['rejected'] - len(report['errors'])} more")
+    return 1 if report['rejected'] else 0
+
+def run_report(argv):
+    """python bill_splitter.py report GROUP_FILE [--start D] [--end D] [--by day|month] [--as-of D]"""
+    import os
+    import json
+    import argparse
+    
+    def date(value):
+        return datetime.datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+    
+    parser = argparse.ArgumentParser(prog="bill_splitter.py report",
+                                     description="Spending over a date range and balances as of a date")
+    parser.add_argument('group_file', help="group storage file, e.g. group_20250101120000.json")
+    parser.add_argument('--start', type=date, help="first date included, YYYY-MM-DD")
+    parser.add_argument('--end', type=date, help="last date included, YYYY-MM-DD")
+    parser.add_argument('--by', choices=SPENDING_PERIODS, help="also list the totals per day or month")
+    parser.add_argument('--as-of', type=date, help="also show every member's balance as of this date")
+    parser.add_argument('--storage', default=os.environ.get('BILL_SPLITTER_STORAGE', 'journal'),
+                        choices=['json', 'journal', 'sqlite'])
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args(argv)
+    
+    bs = BillSplitter(storage_file=args.group_file, storage=args.storage)
+    try:
+        report = {'spending': bs.get_spending_summary(args.start, args.end)}
+        if args.by:
+            report['rollup'] = bs.get_spending_rollup(args.by, args.start, args.end)
+        if args.as_of:
+            report['balances'] = bs.get_balances_as_of(args.as_of)
+    finally:
+        bs.close()
+    
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+    spending = report['spending']
+    print(f"Spending from {args.start or 'the start'} to {args.end or 'the end'}: "
+          f"₹{spending['total_amount']:.2f} in {spending['expense_count']} expenses")
+    for category, amount in spending['categories'].items():
+        print(f"  {category:20} ₹{amount:.2f}")
+    if args.by:
+        print(f"\nBy {args.by}:")
+        for row in report['rollup']:
+            print(f"  {row['period']:10} ₹{row['total_amount']:.2f} ({row['expense_count']} expenses)")
+    if args.as_of:
+        print(f"\nBalances as of {args.as_of}:")
+        for user, balance in report['balances'].items():
+            print(f"  {user:20} ₹{balance:.2f}")
+    return 0
+
 if __name__ == "__main__":
+    if sys.argv[1:2] == ['import']:
+        sys.exit(run_import(sys.argv[2:]))
+    if sys.argv[1:2] == ['report']:
+        sys.exit(run_report(sys.argv[2:]))
     run_cli()
\ No newline at end of file
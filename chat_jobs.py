@@ -0,0 +1,149 @@
+"""Background jobs for slow chatbot work, polled by the dashboard.
+
+A request submits a job and gets its id back straight away; a small thread
+pool runs at most max_workers jobs at once and refuses new ones (QueueFull)
+when max_pending are already waiting, so a slow LLM can tie up neither the
+gunicorn workers nor unbounded memory.
+
+Job state is written to one JSON file per job, so a status poll answered by
+a different worker process sees the same job. A job still running after
+``timeout`` seconds is reported as timed out; the job function can check
+job.expired() to skip side effects it would otherwise apply too late.
+"""
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from storage import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+FINISHED = ('done', 'failed', 'timeout')
+
+TIMEOUT_RESULT = {'status': 'error', 'message': "The request took too long, please try again"}
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    """Handle passed to the job function"""
+
+    def __init__(self, job_id, timeout):
+        self.id = job_id
+        self.timeout = timeout
+        self.deadline = None
+
+    def time_left(self):
+        """Seconds until the job times out, None if it has not started"""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.time()
+
+    def expired(self):
+        return self.deadline is not None and time.time() > self.deadline
+
+
+class JobQueue:
+    def __init__(self, directory, max_workers=4, max_pending=32, timeout=30, keep_for=600):
+        self.directory = directory
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.keep_for = keep_for
+        os.makedirs(directory, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="chat-job")
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._last_cleanup = time.monotonic()
+
+    def _path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _write(self, state):
+        atomic_write_json(self._path(state['id']), state, indent=None)
+
+    def submit(self, owner, fn, *args):
+        """Queue fn(job, *args) and return the job id; raises QueueFull when busy"""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFull()
+            self._pending += 1
+        job = Job(uuid.uuid4().hex, self.timeout)
+        state = {
+            'id': job.id,
+            'owner': owner,
+            'status': 'queued',
+            'created': time.time(),
+            'started': None,
+            'finished': None,
+            'timeout': self.timeout,
+            'result': None
+        }
+        self._write(state)
+        self._executor.submit(self._run, job, state, fn, args)
+        self._cleanup()
+        return job.id
+
+    def _run(self, job, state, fn, args):
+        try:
+            state['status'] = 'running'
+            state['started'] = time.time()
+            job.deadline = state['started'] + self.timeout
+            self._write(state)
+            try:
+                result = fn(job, *args)
+                status = 'timeout' if job.expired() else 'done'
+            except Exception as e:
+                logger.error(f"Chat job {job.id} failed: {e}")
+                result = {'status': 'error', 'message': f"Processing failed: {e}"}
+                status = 'timeout' if job.expired() else 'failed'
+            if status == 'timeout':
+                result = TIMEOUT_RESULT
+            state.update(status=status, result=result, finished=time.time())
+            self._write(state)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def status(self, job_id, owner=None):
+        """Current state of a job, None if it is unknown or belongs to someone else"""
+        # Ids are hex uuids; anything else could point outside the job directory
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._path(job_id), 'r') as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if owner is not None and state.get('owner') != owner:
+            return None
+        if (state['status'] == 'running' and
+                time.time() - state['started'] > state['timeout']):
+            # Report the timeout now, the worker thread records it when it returns
+            state['status'] = 'timeout'
+            state['result'] = TIMEOUT_RESULT
+        return state
+
+    def stats(self):
+        with self._lock:
+            return {'pending': self._pending, 'max_pending': self.max_pending}
+
+    def _cleanup(self):
+        """Delete job files older than keep_for, at most once a minute"""
+        now = time.monotonic()
+        if now - self._last_cleanup < 60:
+            return
+        self._last_cleanup = now
+        cutoff = time.time() - self.keep_for
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
@@ -1,18 +1,426 @@
 import json
 import os
-import google.generativeai as genai
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
 from dotenv import load_dotenv
 import datetime
 
+from llm_client import ResilientModel, LLMUnavailable
+
+logger = logging.getLogger(__name__)
+
 load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+
+GEMINI_MODEL = "gemini-1.5-flash"
+
+
+class LazyGeminiModel:
+    """genai.GenerativeModel that imports the SDK on its first call.
+
+    google.generativeai takes most of a second to import, and messages the
+    local parser or the cache answer never need it.
+    """
+
+    def __init__(self, model_name=GEMINI_MODEL):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                import google.generativeai as genai
+                genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+                # For version 0.4.1, we need to use a different approach instead of system_instruction
+                self._model = genai.GenerativeModel(
+                    model_name=self.model_name,
+                )
+        return self._model
+
+    def generate_content(self, contents, **kwargs):
+        return (self._model or self._load()).generate_content(contents, **kwargs)
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+# Currency markers dropped so "₹200", "Rs. 200" and "200 rupees" read the same
+_CURRENCY_PATTERNS = [
+    (re.compile(r'₹\s*'), ''),
+    (re.compile(r'\b(?:rs\.?|inr)\s*(?=\d)'), ''),
+    (re.compile(r'(?<=\d)\s*(?:rupees?|rs\b\.?|inr\b|/-)'), ''),
+    (re.compile(r'(?<=\d),(?=\d{3}\b)'), ''),
+]
+_ISO_DATE = re.compile(r'\b\d{4}-\d{2}-\d{2}\b')
+
+
+def _resolve_relative_dates(text, today, flags=0):
+    """Replace words like 'yesterday' or 'last friday' with YYYY-MM-DD"""
+    def iso(days_back):
+        return (today - datetime.timedelta(days=days_back)).isoformat()
+
+    text = re.sub(r'\bday before yesterday\b', lambda m: iso(2), text, flags=flags)
+    text = re.sub(r'\byesterday\b', lambda m: iso(1), text, flags=flags)
+    text = re.sub(r'\b(?:today|tonight|this morning|this evening)\b', lambda m: iso(0), text, flags=flags)
+    text = re.sub(r'\btomorrow\b', lambda m: iso(-1), text, flags=flags)
+    text = re.sub(r'\b(\d+) days? ago\b', lambda m: iso(int(m.group(1))), text, flags=flags)
+
+    def last_weekday(match):
+        days_back = (today.weekday() - WEEKDAYS.index(match.group(1).lower())) % 7 or 7
+        return iso(days_back)
+    return re.sub(r'\blast (' + '|'.join(WEEKDAYS) + r')\b', last_weekday, text, flags=flags)
+
+
+def normalize_expense_text(text, today=None):
+    """Cache key for an expense message.
+
+    Lower-cases, drops currency markers and extra whitespace and resolves
+    relative dates. Messages that name no date get today's date prepended,
+    since the model fills in today for them.
+    """
+    today = today or datetime.date.today()
+    text = ' '.join(text.lower().split())
+    for pattern, replacement in _CURRENCY_PATTERNS:
+        text = pattern.sub(replacement, text)
+    text = _resolve_relative_dates(text, today)
+    text = text.rstrip('.!? ')
+    if not _ISO_DATE.search(text):
+        text = f"{today.isoformat()}|{text}"
+    return text
+
+
+class ParseCache:
+    """LRU cache of successful parses with a time-to-live.
+
+    With a path each stored parse is also appended to a JSON lines file, so a
+    restarted worker starts warm. The file is rewritten with just the live
+    entries once it holds more than twice max_entries lines. Each process
+    keeps its own copy and a rewrite drops what other processes appended
+    since they last loaded, which is fine for a cache.
+    """
+
+    def __init__(self, max_entries=1024, ttl=6 * 3600, path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        # key -> (expiry as a unix timestamp, result)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = {'capacity': 0, 'expired': 0}
+        # Lines in the file, live or not, since it was last rewritten
+        self._logged = 0
+        if path:
+            self._load()
+
+    def get(self, key):
+        """Return a copy of the cached result, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.time():
+                del self._entries[key]
+                self.evictions['expired'] += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return json.loads(json.dumps(entry[1]))
+
+    def put(self, key, result):
+        """Store a successful parse; anything else is ignored"""
+        if not isinstance(result, dict) or result.get("status") != "success":
+            return
+        with self._lock:
+            expires = time.time() + self.ttl
+            self._entries[key] = (expires, json.loads(json.dumps(result)))
+            self._entries.move_to_end(key)
+            self.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions['capacity'] += 1
+            if self.path:
+                self._append(key, expires, result)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self.path:
+                self._rewrite()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        now = time.time()
+        for line in lines:
+            try:
+                key, expires, result = json.loads(line)
+            except (ValueError, TypeError):
+                # A line cut short by a crash, or the file from an older version
+                continue
+            if isinstance(key, str) and expires > now:
+                self._entries[key] = (expires, result)
+                self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._logged = len(lines)
+
+    def _append(self, key, expires, result):
+        if self._logged >= 2 * self.max_entries:
+            self._rewrite()
+            return
+        try:
+            # Opened per write so a rewrite by another process is picked up
+            with open(self.path, 'a') as f:
+                f.write(json.dumps([key, expires, result]) + '\n')
+            self._logged += 1
+        except OSError as e:
+            logger.warning(f"Could not save parse cache: {e}")
+
+    def _rewrite(self):
+        tmp_path = f"{self.path}.tmp.{os.getpid()}.{threading.get_ident()}"
+        try:
+            with open(tmp_path, 'w') as f:
+                f.writelines(json.dumps([key, expires, result]) + '\n'
+                             for key, (expires, result) in self._entries.items())
+            os.replace(tmp_path, self.path)
+            self._logged = len(self._entries)
+        except OSError as e:
+            logger.warning(f"Could not save parse cache: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stores': self.stores,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': dict(self.evictions)
+            }
+
+
+def expense_result(data, today=None):
+    """Validate the model's JSON and turn it into the process_expense result"""
+    # Basic validation
+    if "error" in data:
+        return {"status": "error", "message": data["error"]}
+    if "amount" not in data or data["amount"] is None:
+        return {"status": "error", "message": "No amount specified"}
+
+    # Handle 'today' as date
+    if data.get("date") == "today":
+        data["date"] = (today or datetime.date.today()).strftime("%Y-%m-%d")
+        
+    # Ensure participants is a list and contains at least the payer
+    if "participants" not in data or not data["participants"]:
+        data["participants"] = [data.get("paid_by", "You")]
+    elif data.get("paid_by") not in data["participants"]:
+        data["participants"].append(data.get("paid_by", "You"))
+
+    # Build the result object
+    return {
+        "status": "success",
+        "amount": float(data["amount"]),
+        "paid_by": data.get("paid_by", "You"),
+        "description": data.get("description", "expense"),
+        "date": data.get("date"),
+        "participants": list(set(data.get("participants", ["You"]))),
+        "category": data.get("category", "Other")
+    }
+
+
+# Keyword -> category for the local parser; a message matching none goes to the model
+CATEGORY_KEYWORDS = {
+    'Food': ['dinner', 'lunch', 'breakfast', 'brunch', 'food', 'pizza', 'burger', 'snacks',
+             'chai', 'tea', 'coffee', 'restaurant', 'biryani', 'dosa', 'meal', 'drinks',
+             'beer', 'party', 'cake', 'ice cream', 'swiggy', 'zomato'],
+    'Groceries': ['groceries', 'grocery', 'vegetables', 'fruits', 'milk', 'supermarket'],
+    'Travel': ['cab', 'taxi', 'uber', 'ola', 'auto', 'rickshaw', 'bus', 'train', 'flight',
+               'metro', 'fuel', 'petrol', 'diesel', 'toll', 'parking', 'travel', 'trip', 'tickets'],
+    'Accommodation': ['hotel', 'hostel', 'airbnb', 'stay'],
+    'Rent': ['rent'],
+    'Utilities': ['electricity', 'wifi', 'internet', 'water bill', 'gas bill', 'recharge',
+                  'phone bill', 'utilities'],
+    'Entertainment': ['movie', 'movies', 'netflix', 'concert', 'game', 'bowling', 'show'],
+    'Shopping': ['shopping', 'clothes', 'shoes', 'gift', 'gifts'],
+    'Health': ['medicine', 'medicines', 'doctor', 'pharmacy', 'hospital', 'gym'],
+}
+
+_AMOUNT = r'(?:₹|rs\.?|inr)?\s*(?P<amount>\d[\d,]*(?:\.\d{1,2})?)\s*(?:rupees?|rs\b\.?|inr\b|/-)?'
+_LOCAL_PATTERNS = [
+    # "I spent 500 on dinner with Alice", "Bob paid 1200 for cab"
+    re.compile(r'^(?:(?P<payer>[a-z][\w.-]*)\s+)?(?:have\s+|just\s+)?(?:spent|paid|spend|pay)\s+'
+               + _AMOUNT + r'\s+(?:on|for)\s+(?P<rest>.+)$', re.IGNORECASE),
+    # "Dinner 500 paid by Alice with Bob", "hotel 8000 by me"
+    re.compile(r'^(?P<rest_head>[a-z][a-z ]*?)\s+(?:of\s+|for\s+)?' + _AMOUNT +
+               r'\s+(?:paid\s+)?by\s+(?P<payer>[a-z][\w.-]*)(?P<rest>.*)$', re.IGNORECASE),
+]
+_DATE_SUFFIX = re.compile(r'\s*,?\s+(?:on\s+)?(?P<date>\d{4}-\d{2}-\d{2})$')
+_DATE_PREFIX = re.compile(r'^(?:on\s+)?(?P<date>\d{4}-\d{2}-\d{2})\s*,?\s+')
+_SELF = {'i', 'we', 'me', 'myself', 'you', 'us'}
+# Words that mean the split is more than a list of names
+_UNSURE = re.compile(r'\b(?:split|each|except|owe|owes|share|half|percent|everyone|all|'
+                     r'friends|family|team|others|between|per|and\s+\d)\b|%',
+                     re.IGNORECASE)
+# Words the payer slot can catch that are not people
+_NOT_PAYER = {'also', 'just', 'have', 'had', 'has', 'then', 'so', 'ok', 'and', 'who', 'what'}
+_NAME = re.compile(r'^[a-z][\w.-]*$', re.IGNORECASE)
+_ARTICLE = re.compile(r'^(?:a|an|the|some|our|my)\s+', re.IGNORECASE)
+
+
+_KEYWORD_CATEGORY = {keyword: category for category, keywords in CATEGORY_KEYWORDS.items()
+                     for keyword in keywords}
+_CATEGORY_KEYWORD = re.compile(r'\b(' + '|'.join(
+    re.escape(k) for k in sorted(_KEYWORD_CATEGORY, key=len, reverse=True)) + r')\b')
+
+
+def _category_for(description):
+    """Category of the first keyword in the description ("movie tickets" is a movie)"""
+    match = _CATEGORY_KEYWORD.search(description.lower())
+    return _KEYWORD_CATEGORY[match.group(1)] if match else None
+
+
+def _person(name):
+    return "You" if name.lower() in _SELF else name
+
+
+def parse_expense_locally(text, today=None):
+    """Parse formulaic messages without the model.
+
+    Handles "<payer> spent/paid <amount> on/for <what> [with <names>] [<date>]"
+    and "<what> <amount> paid by <payer> [with <names>]", returning the same
+    structure as GeminiExpenseChatbot.process_expense. Returns None whenever
+    the message has anything the rules are not sure about.
+    """
+    today = today or datetime.date.today()
+    text = ' '.join(text.split()).rstrip('.!')
+    if _UNSURE.search(text):
+        return None
+    text = _resolve_relative_dates(text, today, flags=re.IGNORECASE)
+    date = today.isoformat()
+    for pattern in (_DATE_SUFFIX, _DATE_PREFIX):
+        match = pattern.search(text)
+        if match:
+            date = match.group('date')
+            text = text[:match.start()] + ' ' + text[match.end():]
+            text = text.strip()
+    if _ISO_DATE.search(text):
+        return None
+
+    for pattern in _LOCAL_PATTERNS:
+        match = pattern.match(text)
+        if match:
+            break
+    else:
+        return None
+
+    groups = match.groupdict()
+    rest = groups['rest'].strip()
+    with_part = None
+    with_match = re.search(r'(?:^|\s)(?:with|along with)\s+(?P<names>.+)$', rest, re.IGNORECASE)
+    if with_match:
+        with_part = with_match.group('names')
+        rest = rest[:with_match.start()].strip()
+    description = groups.get('rest_head') or rest
+    if groups.get('rest_head') and rest:
+        # Anything between the payer and "with" is not understood
+        return None
+    description = _ARTICLE.sub('', description).strip()
+    if not description or len(description.split()) > 4 or re.search(r'\d', description):
+        return None
+
+    category = _category_for(description)
+    if category is None:
+        return None
+
+    payer = _person(groups.get('payer') or 'I')
+    if not _NAME.match(payer) or payer.lower() in _NOT_PAYER:
+        return None
+
+    participants = [payer]
+    if with_part:
+        for name in re.split(r'\s*(?:,|&|\band\b)\s*', with_part):
+            if not name:
+                continue
+            if not _NAME.match(name):
+                return None
+            participants.append(_person(name))
+
+    try:
+        amount = float(groups['amount'].replace(',', ''))
+    except ValueError:
+        return None
+    if amount <= 0:
+        return None
+
+    return {
+        "status": "success",
+        "amount": amount,
+        "paid_by": payer,
+        "description": description,
+        "date": date,
+        "participants": list(set(participants)),
+        "category": category
+    }
+
+
+def split_expense_lines(text):
+    """Split a pasted list into one message per expense.
+
+    Lines and semicolons always separate expenses; commas only do when every
+    piece has a number in it, so "with Alice, Bob" stays in one piece.
+    """
+    pieces = [p.strip() for p in re.split(r'[\n;]+', text) if p.strip()]
+    items = []
+    for piece in pieces:
+        parts = [p.strip() for p in piece.split(',') if p.strip()]
+        if len(parts) > 1 and all(re.search(r'\d', p) for p in parts):
+            items.extend(parts)
+        else:
+            items.append(piece)
+    return items
+
+
+def batch_item_result(item):
+    """Validate one element of the model's batch array"""
+    if not isinstance(item, dict):
+        return {"status": "error", "message": "Not an expense object"}
+    try:
+        return expense_result(item)
+    except (TypeError, ValueError) as e:
+        return {"status": "error", "message": f"Invalid expense: {e}"}
+
 
 class GeminiExpenseChatbot:
-    def __init__(self):
-        # For version 0.4.1, we need to use a different approach instead of system_instruction
-        self.model = genai.GenerativeModel(
-            model_name="gemini-1.5-flash",
-        )
+    def __init__(self, timeout=None, cache=None, fast_path=True, model=None, resilience=None):
+        # Default limit in seconds for one model call, retries included
+        self.timeout = timeout
+        # Try parse_expense_locally() before asking the model
+        self.fast_path = fast_path
+        self.fast_path_hits = 0
+        self.fast_path_misses = 0
+        # Messages answered by the local parser because the model was unavailable
+        self.fallbacks = 0
+        # Parses keyed on normalized text; pass a ParseCache to persist or resize it
+        self.cache = cache if cache is not None else ParseCache()
+        if model is None:
+            model = LazyGeminiModel()
+        # Rate limit, retries and circuit breaker; resilience overrides ResilientModel's defaults
+        options = dict(resilience or {})
+        if timeout:
+            options.setdefault('timeout', timeout)
+        self.model = ResilientModel(model, **options)
         
         # The prompt prefix that will be prepended to user inputs
         self.prompt_prefix = """
@@ -33,65 +441,150 @@ class GeminiExpenseChatbot:
             User expense: 
         """
 
-    def process_expense(self, input_text: str):
-        """Parse and return structured expense data"""
-        try:
-            # Combine the prompt prefix with the user input
-            full_prompt = self.prompt_prefix + input_text
-            
-            response = self.model.generate_content(full_prompt)
-            response_text = response.text.strip()
-            
-            # Extract JSON from response (remove any markdown code blocks if present)
-            if "```json" in response_text or "```" in response_text:
-                json_str = response_text.replace("```json", "").replace("```", "").strip()
-            else:
-                json_str = response_text
-            
-            # Handle potential formatting issues in the response
-            json_str = json_str.replace('\n', ' ').replace('\r', '')
+        # Same fields, but for a pasted list of expenses in one call
+        self.batch_prompt_prefix = """
+            You are an expense parsing assistant.
+            The user lists several expenses. Extract EVERY expense, in order,
+            STRICTLY as a JSON array of objects in this format:
+            [{
+                "amount": number,
+                "paid_by": string (default: "You"),
+                "participants": list (including payer),
+                "description": string,
+                "date": string (YYYY-MM-DD, default: today),
+                "category": string (optional, e.g., Food, Travel)
+            }]
             
-            # Print for debugging
-            print(f"Received JSON: {json_str}")
+            Return ONLY the JSON array with no additional text or explanation.
+            For an entry without an amount, put {"error": "No amount found"} in its place.
             
-            data = json.loads(json_str)
+            User expenses: 
+        """
+
+    def process_expense(self, input_text: str, timeout=None, fast_path=None):
+        """Parse and return structured expense data"""
+        if self.fast_path if fast_path is None else fast_path:
+            result = self.parse_fast(input_text)
+            if result is not None:
+                return result
+        key = normalize_expense_text(input_text)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        result = self._parse(input_text, timeout)
+        # Only successful parses are stored, a retry after an error asks the model again
+        self.cache.put(key, result)
+        return result
+
+    def parse_fast(self, input_text):
+        """Local parse only, None when the message needs the model"""
+        result = parse_expense_locally(input_text)
+        if result is None:
+            self.fast_path_misses += 1
+        else:
+            self.fast_path_hits += 1
+        return result
+
+    def llm_stats(self):
+        return dict(self.model.stats(), fallbacks=self.fallbacks)
+
+    def fast_path_stats(self):
+        attempts = self.fast_path_hits + self.fast_path_misses
+        return {
+            'enabled': self.fast_path,
+            'hits': self.fast_path_hits,
+            'misses': self.fast_path_misses,
+            'hit_rate': self.fast_path_hits / attempts if attempts else 0.0
+        }
 
-            # Basic validation
+    def process_expenses(self, input_text: str, timeout=None, fast_path=None):
+        """Parse a pasted list of expenses with at most one model call.
+        
+        Returns {"status", "items": [one process_expense-style result per
+        expense, in order], "valid", "invalid"}. Each item is validated on its
+        own, so one bad line does not sink the rest.
+        """
+        if self.fast_path if fast_path is None else fast_path:
+            result = self.parse_batch_fast(input_text)
+            if result is not None:
+                return result
+        if not input_text.strip():
+            return {"status": "error", "message": "No expenses found"}
+        try:
+            data = self._generate_json(self.batch_prompt_prefix + input_text, timeout)
+        except json.JSONDecodeError as e:
+            return {"status": "error", "message": f"Invalid JSON response: {str(e)}"}
+        except LLMUnavailable as e:
+            return {"status": "error", "message": str(e), "reason": e.reason}
+        except Exception as e:
+            logger.error(f"Error in process_expenses: {str(e)}")
+            return {"status": "error", "message": f"Parsing failed: {str(e)}"}
+        if isinstance(data, dict):
             if "error" in data:
                 return {"status": "error", "message": data["error"]}
-            if "amount" not in data or data["amount"] is None:
-                return {"status": "error", "message": "No amount specified"}
-
-            # Handle 'today' as date
-            if data.get("date") == "today":
-                data["date"] = datetime.datetime.now().strftime("%Y-%m-%d")
-                
-            # Ensure participants is a list and contains at least the payer
-            if "participants" not in data or not data["participants"]:
-                data["participants"] = [data.get("paid_by", "You")]
-            elif data.get("paid_by") not in data["participants"]:
-                data["participants"].append(data.get("paid_by", "You"))
-
-            # Build the result object
-            result = {
-                "status": "success",
-                "amount": float(data["amount"]),
-                "paid_by": data.get("paid_by", "You"),
-                "description": data.get("description", "expense"),
-                "date": data.get("date"),
-                "participants": list(set(data.get("participants", ["You"]))),
-                "category": data.get("category", "Other")
-            }
-            
-            # Print for debugging
-            print(f"Processed expense: {result}")
-            
-            return result
+            data = [data]
+        if not isinstance(data, list):
+            return {"status": "error", "message": "Expected a list of expenses"}
+        return self._batch_result([batch_item_result(item) for item in data])
+
+    def parse_batch_fast(self, input_text):
+        """Local parse of every line, None unless all of them parse"""
+        lines = split_expense_lines(input_text)
+        if not lines:
+            return None
+        items = [parse_expense_locally(line) for line in lines]
+        if any(item is None for item in items):
+            # The whole list goes to the model, so count every line as a miss
+            self.fast_path_misses += len(lines)
+            return None
+        self.fast_path_hits += len(lines)
+        return self._batch_result(items)
+
+    @staticmethod
+    def _batch_result(items):
+        valid = sum(1 for item in items if item["status"] == "success")
+        return {
+            "status": "success" if valid else "error",
+            "message": f"Parsed {valid} of {len(items)} expenses",
+            "items": items,
+            "valid": valid,
+            "invalid": len(items) - valid
+        }
+
+    def _generate_json(self, full_prompt, timeout=None):
+        """Ask the model and decode the JSON in its answer"""
+        timeout = timeout if timeout is not None else self.timeout
+        request_options = {"timeout": timeout} if timeout else None
+        response = self.model.generate_content(full_prompt, request_options=request_options)
+        response_text = response.text.strip()
+        
+        # Extract JSON from response (remove any markdown code blocks if present)
+        if "```json" in response_text or "```" in response_text:
+            json_str = response_text.replace("```json", "").replace("```", "").strip()
+        else:
+            json_str = response_text
+        
+        # Handle potential formatting issues in the response
+        json_str = json_str.replace('\n', ' ').replace('\r', '')
+        return json.loads(json_str)
+
+    def _parse(self, input_text, timeout=None):
+        try:
+            # Combine the prompt prefix with the user input
+            data = self._generate_json(self.prompt_prefix + input_text, timeout)
+            return expense_result(data)
 
         except json.JSONDecodeError as e:
-            print(f"JSON Decode Error: {str(e)}")
-            print(f"Response text: {response.text}")
+            logger.warning(f"Model answered with invalid JSON: {str(e)}")
             return {"status": "error", "message": f"Invalid JSON response: {str(e)}"}
+        except LLMUnavailable as e:
+            # Fail fast, but still take the message if the local rules can
+            logger.warning(f"Model unavailable ({e.reason}): {str(e)}")
+            result = parse_expense_locally(input_text)
+            if result is not None:
+                self.fallbacks += 1
+                return result
+            return {"status": "error", "message": str(e), "reason": e.reason}
         except Exception as e:
-            print(f"Error in process_expense: {str(e)}")
+            logger.error(f"Error in process_expense: {str(e)}")
             return {"status": "error", "message": f"Parsing failed: {str(e)}"}
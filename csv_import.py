@@ -0,0 +1,167 @@
+"""Bulk import of expenses from CSV, e.g. a group's history kept in a spreadsheet.
+
+The first row names the columns (case and spacing do not matter):
+
+  paid_by        required, an existing member of the group
+  amount         required, a positive number up to MAX_AMOUNT ("1,200" and a ₹ sign are fine)
+  description    defaults to "Imported expense"
+  participants   members separated by ';' or '|', empty means everyone
+  date           YYYY-MM-DD or DD/MM/YYYY, defaults to today
+  category       optional
+
+Rows are read one at a time, so a large file is never held in memory, and
+valid rows are written in batches of batch_size, each batch as a single
+BillSplitter transaction. A rejected row is reported with its line number
+and does not stop the import.
+"""
+import re
+import csv
+import math
+import datetime
+from functools import lru_cache
+
+from ledger import to_paise
+
+DEFAULT_BATCH_SIZE = 5000
+# Rejected rows listed in the report, the rest are only counted
+DEFAULT_MAX_ERRORS = 100
+# Largest amount one row may hold, in rupees; keeps every total well inside 64-bit paise
+MAX_AMOUNT = 10 ** 9
+
+REQUIRED_COLUMNS = ('paid_by', 'amount')
+COLUMN_ALIASES = {
+    'payer': 'paid_by',
+    'paid': 'paid_by',
+    'split_between': 'participants',
+    'split_with': 'participants',
+    'note': 'description',
+}
+ISO_DATE = re.compile(r'^(?P<y>\d{4})-(?P<m>\d{1,2})-(?P<d>\d{1,2})$')
+DMY_DATE = re.compile(r'^(?P<d>\d{1,2})/(?P<m>\d{1,2})/(?P<y>\d{4})$')
+
+
+class CSVImportError(ValueError):
+    """The file as a whole cannot be imported"""
+
+
+def _column(name):
+    name = (name or '').strip().lower().replace(' ', '_').replace('-', '_')
+    return COLUMN_ALIASES.get(name, name)
+
+
+def _parse_amount(value):
+    value = (value or '').replace('₹', '').replace(',', '').strip()
+    if not value:
+        raise ValueError("amount is missing")
+    try:
+        amount = float(value)
+    except ValueError:
+        raise ValueError(f"amount '{value}' is not a number")
+    if not math.isfinite(amount) or amount <= 0:
+        raise ValueError(f"amount '{value}' must be positive")
+    if amount > MAX_AMOUNT:
+        raise ValueError(f"amount '{value}' is larger than {MAX_AMOUNT}")
+    # What add_expense() will do with it, so a failure is this row's and not the batch's
+    to_paise(amount)
+    return amount
+
+
+@lru_cache(maxsize=4096)
+def _parse_date(value):
+    """YYYY-MM-DD for a date in either accepted format; spreadsheets repeat dates a lot"""
+    match = ISO_DATE.match(value) or DMY_DATE.match(value)
+    if match:
+        try:
+            return datetime.date(*map(int, match.group('y', 'm', 'd'))).isoformat()
+        except ValueError:
+            pass
+    raise ValueError(f"date '{value}' is not YYYY-MM-DD or DD/MM/YYYY")
+
+
+def parse_row(row, users, today):
+    """Validate one CSV row, returns add_expense() keyword arguments or raises ValueError"""
+    paid_by = (row.get('paid_by') or '').strip()
+    if not paid_by:
+        raise ValueError("paid_by is missing")
+    if paid_by not in users:
+        raise ValueError(f"payer '{paid_by}' is not in the group")
+
+    participants = [p.strip() for p in
+                    (row.get('participants') or '').replace('|', ';').split(';') if p.strip()]
+    unknown = [p for p in participants if p not in users]
+    if unknown:
+        raise ValueError(f"participant(s) {', '.join(repr(p) for p in unknown)} not in the group")
+
+    date = (row.get('date') or '').strip()
+    return {
+        'paid_by': paid_by,
+        'amount': _parse_amount(row.get('amount')),
+        'description': (row.get('description') or '').strip() or "Imported expense",
+        'participants': participants or None,
+        'date': _parse_date(date) if date else today,
+        'category': (row.get('category') or '').strip() or None
+    }
+
+
+def iter_rows(stream):
+    """Yield (line number, row dict) for every data row of a CSV text stream"""
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        raise CSVImportError("The file is empty")
+    columns = [_column(name) for name in header]
+    missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+    if missing:
+        raise CSVImportError(f"Missing column(s): {', '.join(missing)}")
+
+    line = reader.line_num + 1
+    for values in reader:
+        # A quoted field may span lines, report where the row starts
+        start, line = line, reader.line_num + 1
+        if not any(v.strip() for v in values):
+            continue
+        yield start, dict(zip(columns, values))
+
+
+def import_expenses_csv(bs, stream, batch_size=DEFAULT_BATCH_SIZE, max_errors=DEFAULT_MAX_ERRORS):
+    """Add every valid row of a CSV text stream to the splitter.
+
+    Returns {'imported', 'rejected', 'errors': [{'line', 'message'}], 'batches'};
+    raises CSVImportError if the header is unusable.
+    """
+    today = datetime.date.today().isoformat()
+    report = {'imported': 0, 'rejected': 0, 'errors': [], 'batches': 0}
+    batch = []
+
+    def reject(line, message):
+        report['rejected'] += 1
+        if len(report['errors']) < max_errors:
+            report['errors'].append({'line': line, 'message': message})
+
+    def write(batch):
+        with bs.transaction():
+            for line, expense in batch:
+                try:
+                    message = bs.add_expense(**expense)
+                except (ValueError, ArithmeticError) as e:
+                    # Raised before the change is recorded, the rest of the batch still goes in
+                    reject(line, f"amount could not be added: {e}")
+                    continue
+                if message.startswith("Error"):
+                    reject(line, message[len("Error: "):])
+                else:
+                    report['imported'] += 1
+        report['batches'] += 1
+
+    for line, row in iter_rows(stream):
+        try:
+            batch.append((line, parse_row(row, bs.users, today)))
+        except (ValueError, ArithmeticError) as e:
+            reject(line, str(e))
+            continue
+        if len(batch) >= batch_size:
+            write(batch)
+            batch = []
+    if batch:
+        write(batch)
+    return report
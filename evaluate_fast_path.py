@@ -0,0 +1,114 @@
+"""Measure the local fast-path parser against recorded model outputs.
+
+Usage: python evaluate_fast_path.py [corpus.jsonl] [--record] [--verbose]
+
+Each corpus line holds a chat message, the date it was recorded on and the
+result GeminiExpenseChatbot returned for it. The script reports how many
+messages the local parser takes (coverage), how often its answer matches the
+model's field by field, and how long it takes per message. With --record the
+expected results are fetched from Gemini again (needs GEMINI_API_KEY) and the
+corpus is rewritten with today's date.
+"""
+import sys
+import json
+import time
+import datetime
+
+from chatbot_utils import parse_expense_locally
+
+FIELDS = ('amount', 'paid_by', 'participants', 'description', 'date', 'category')
+
+
+def load_corpus(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def record(path, corpus):
+    from chatbot_utils import GeminiExpenseChatbot
+    bot = GeminiExpenseChatbot(fast_path=False)
+    today = datetime.date.today().isoformat()
+    with open(path, 'w', encoding='utf-8') as f:
+        for row in corpus:
+            row = {'text': row['text'], 'today': today, 'expected': bot._parse(row['text'])}
+            f.write(json.dumps(row, ensure_ascii=False) + '\n')
+    print(f"Recorded {len(corpus)} messages into {path}")
+
+
+def _comparable(field, value):
+    if field == 'participants':
+        return sorted(str(p).casefold() for p in value)
+    if field == 'amount':
+        return round(float(value), 2)
+    if isinstance(value, str):
+        return value.strip().casefold()
+    return value
+
+
+def evaluate(corpus, verbose=False):
+    taken = 0
+    wrongly_taken = 0
+    exact = 0
+    field_matches = {field: 0 for field in FIELDS}
+    elapsed = 0.0
+
+    for row in corpus:
+        today = datetime.date.fromisoformat(row['today'])
+        started = time.perf_counter()
+        local = parse_expense_locally(row['text'], today=today)
+        elapsed += time.perf_counter() - started
+        if local is None:
+            continue
+        taken += 1
+        expected = row['expected']
+        if expected.get('status') != 'success':
+            # The model found no expense here, the fast path should not have either
+            wrongly_taken += 1
+            if verbose:
+                print(f"TAKEN, model rejected: {row['text']!r}")
+            continue
+        mismatched = [field for field in FIELDS
+                      if _comparable(field, local[field]) != _comparable(field, expected[field])]
+        for field in FIELDS:
+            if field not in mismatched:
+                field_matches[field] += 1
+        if not mismatched:
+            exact += 1
+        elif verbose:
+            print(f"MISMATCH {row['text']!r}: " +
+                  ", ".join(f"{f} {local[f]!r} != {expected[f]!r}" for f in mismatched))
+
+    total = len(corpus)
+    return {
+        'messages': total,
+        'fast_path_hits': taken,
+        'coverage': taken / total if total else 0.0,
+        'exact_match_rate': exact / taken if taken else 0.0,
+        'false_positives': wrongly_taken,
+        'field_accuracy': {field: field_matches[field] / taken if taken else 0.0
+                           for field in FIELDS},
+        'mean_parse_us': elapsed / total * 1e6 if total else 0.0
+    }
+
+
+def main(argv):
+    args = [a for a in argv if not a.startswith('--')]
+    path = args[0] if args else 'fast_path_corpus.jsonl'
+    corpus = load_corpus(path)
+    if '--record' in argv:
+        record(path, corpus)
+        corpus = load_corpus(path)
+    report = evaluate(corpus, verbose='--verbose' in argv)
+
+    print(f"Messages:        {report['messages']}")
+    print(f"Fast path hits:  {report['fast_path_hits']} ({report['coverage']:.0%} coverage)")
+    print(f"Exact matches:   {report['exact_match_rate']:.0%} of hits")
+    print(f"False positives: {report['false_positives']}")
+    for field, accuracy in report['field_accuracy'].items():
+        print(f"  {field:<13} {accuracy:.0%}")
+    print(f"Mean parse time: {report['mean_parse_us']:.1f} µs")
+    return report
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
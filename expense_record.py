@@ -0,0 +1,142 @@
+"""Compact in-memory expense records.
+
+A group loaded from JSON holds every expense as a dict with its own copy of
+each key, of the payer's and participants' names and of the date string, and
+a participants list with room to grow. Expense keeps the same fields in
+__slots__ instead: names, dates and categories are interned so every
+expense in the process points at one shared string per user (the same
+sharing integer user ids would give, without a lookup table to carry
+around), and participants are a tuple in their original order.
+
+Expense is a Mapping with the dict layout of the rest of the code
+(expense['paid_by'], expense.get('category'), dict(expense)) and is mutable:
+item assignment and update() change known fields in place, for the edits
+BillSplitter makes, while new keys and deletion are not supported. Optional
+fields that are None are left out, as they would be missing from the dict.
+copy() returns a plain dict for JSON, templates and callers that keep it.
+"""
+import sys
+from collections.abc import Mapping
+
+FIELDS = ('id', 'paid_by', 'amount', 'description', 'date', 'participants', 'category')
+# Left out of the mapping while None
+OPTIONAL_FIELDS = frozenset(('description', 'date', 'category'))
+_FIELD_SET = frozenset(FIELDS)
+
+_intern = sys.intern
+
+
+def _interned(value):
+    return _intern(value) if type(value) is str else value
+
+
+class Expense(Mapping):
+    __slots__ = FIELDS
+
+    def __init__(self, id, paid_by, amount, description=None, date=None, participants=(),
+                 category=None):
+        self.id = id
+        self.paid_by = _intern(paid_by)
+        self.amount = amount
+        self.description = description
+        self.date = None if date is None else _intern(date)
+        self.participants = tuple(map(_intern, participants))
+        self.category = None if category is None else _intern(category)
+
+    @classmethod
+    def from_dict(cls, expense):
+        """Build a record from the dict layout used by storage and change records"""
+        # Called once per expense when a group loads, so the fields are set inline
+        self = cls.__new__(cls)
+        get = expense.get
+        self.id = expense['id']
+        self.paid_by = _intern(expense['paid_by'])
+        self.amount = expense['amount']
+        self.description = get('description')
+        date = get('date')
+        self.date = None if date is None else _intern(date)
+        self.participants = tuple(map(_intern, get('participants') or ()))
+        category = get('category')
+        self.category = None if category is None else _intern(category)
+        return self
+
+    def __getitem__(self, key):
+        if key in _FIELD_SET:
+            value = getattr(self, key)
+            if value is not None or key not in OPTIONAL_FIELDS:
+                return value
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key in _FIELD_SET:
+            value = getattr(self, key)
+            if value is not None or key not in OPTIONAL_FIELDS:
+                return value
+        return default
+
+    def __contains__(self, key):
+        return key in _FIELD_SET and (key not in OPTIONAL_FIELDS or getattr(self, key) is not None)
+
+    def keys(self):
+        return [key for key in FIELDS if key in self]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __setitem__(self, key, value):
+        if key not in _FIELD_SET:
+            raise KeyError(key)
+        if key == 'participants':
+            value = tuple(map(_intern, value))
+        elif key != 'description':
+            value = _interned(value)
+        setattr(self, key, value)
+
+    def update(self, other):
+        for key, value in other.items():
+            self[key] = value
+
+    def copy(self):
+        """A plain dict with a participants list, like dict.copy() on the dict layout"""
+        expense = {
+            'id': self.id,
+            'paid_by': self.paid_by,
+            'amount': self.amount,
+            'description': self.description,
+            'date': self.date,
+            'participants': list(self.participants)
+        }
+        if self.description is None:
+            del expense['description']
+        if self.date is None:
+            del expense['date']
+        if self.category is not None:
+            expense['category'] = self.category
+        return expense
+
+    def __eq__(self, other):
+        # Equal to the dict layout of the same expense, whose participants are a list
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        return self.copy() == (other.copy() if isinstance(other, Expense) else dict(other))
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Expense({self.copy()!r})"
+
+
+def expense_size(expense):
+    """Bytes an expense holds on its own; interned names, dates and categories are shared"""
+    if not isinstance(expense, Expense):
+        size = sys.getsizeof(expense)
+        for value in expense.values():
+            size += sys.getsizeof(value)
+            if isinstance(value, list):
+                size += sum(sys.getsizeof(item) for item in value)
+        return size
+    return (sys.getsizeof(expense) + sys.getsizeof(expense.id) + sys.getsizeof(expense.amount) +
+            sys.getsizeof(expense.description) + sys.getsizeof(expense.participants))
@@ -0,0 +1,138 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class GroupCache:
+    """LRU cache of loaded BillSplitter instances keyed by group id.
+
+    Entries are evicted least recently used first when the cache holds more
+    than max_entries groups or more than max_bytes of estimated memory, and
+    dropped once they have not been used for idle_timeout seconds. Evicted
+    splitters are flushed so nothing written through them is lost, then
+    closed to release their files and connections. Both happen after the
+    entry is gone and outside the cache lock, so a slow disk only holds up
+    the request that caused the eviction.
+    """
+
+    def __init__(self, loader, max_entries=128, max_bytes=256 * 1024 * 1024, idle_timeout=1800):
+        if max_entries < 1:
+            raise ValueError(f"max_entries must be at least 1, got {max_entries}")
+        self.loader = loader
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.idle_timeout = idle_timeout
+        # group id -> [splitter, estimated bytes, last access time]
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = {'capacity': 0, 'memory': 0, 'idle': 0}
+
+    def get(self, group_id):
+        """Return the splitter for a group, loading it on a miss"""
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            self._expire(now, evicted)
+            entry = self._entries.get(group_id)
+            if entry is not None:
+                self.hits += 1
+                self._entries.move_to_end(group_id)
+                entry[2] = now
+                self._resize(group_id, entry, evicted)
+            else:
+                self.misses += 1
+        if entry is not None:
+            self._release(evicted)
+            return entry[0]
+
+        # Load outside the lock so one slow group does not block the others
+        splitter = self.loader(group_id)
+
+        with self._lock:
+            entry = self._entries.get(group_id)
+            if entry is None:
+                entry = [splitter, 0, now]
+                self._entries[group_id] = entry
+                self._resize(group_id, entry, evicted)
+            else:
+                # Another thread loaded it meanwhile, keep that one
+                evicted.append(splitter)
+        self._release(evicted)
+        return entry[0]
+
+    def __contains__(self, group_id):
+        with self._lock:
+            return group_id in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def discard(self, group_id):
+        """Drop a group from the cache, flushing and closing it"""
+        with self._lock:
+            entry = self._entries.pop(group_id, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+        if entry is not None:
+            self._release([entry[0]])
+
+    def clear(self):
+        for group_id in list(self._entries):
+            self.discard(group_id)
+
+    def _resize(self, group_id, entry, evicted):
+        """Refresh an entry's size estimate and enforce the limits"""
+        size = entry[0].estimated_size()
+        self._bytes += size - entry[1]
+        entry[1] = size
+        # The entry being used always stays, even if max_entries was lowered below 1
+        while len(self._entries) > max(self.max_entries, 1):
+            self._evict_oldest('capacity', evicted, keep=group_id)
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            self._evict_oldest('memory', evicted, keep=group_id)
+
+    def _expire(self, now, evicted):
+        """Evict entries idle for longer than idle_timeout"""
+        if not self.idle_timeout:
+            return
+        while self._entries:
+            group_id, entry = next(iter(self._entries.items()))
+            if now - entry[2] < self.idle_timeout:
+                break
+            self._evict(group_id, 'idle', evicted)
+
+    def _evict_oldest(self, reason, evicted, keep=None):
+        for group_id in self._entries:
+            if group_id != keep:
+                self._evict(group_id, reason, evicted)
+                return
+
+    def _evict(self, group_id, reason, evicted):
+        """Remove an entry under the lock; the caller releases the splitter after unlocking"""
+        splitter, size, _ = self._entries.pop(group_id)
+        self._bytes -= size
+        self.evictions[reason] += 1
+        evicted.append(splitter)
+
+    @staticmethod
+    def _release(splitters):
+        for splitter in splitters:
+            splitter.close()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'estimated_bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'idle_timeout': self.idle_timeout,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': dict(self.evictions)
+            }
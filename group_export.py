@@ -0,0 +1,81 @@
+"""Streaming export of a group's expenses and settlements as CSV or NDJSON.
+
+Everything here is a generator of byte chunks: rows are serialised a few
+hundred at a time as BillSplitter.iter_expenses() produces them, so memory
+stays flat however large the group is and the response starts before the
+last expense has been read. The expense CSV uses the columns csv_import
+reads, so an export can be imported into another group as it is.
+"""
+import io
+import csv
+import json
+import zlib
+
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+EXPENSE_COLUMNS = ('id', 'date', 'paid_by', 'amount', 'description', 'participants', 'category')
+SETTLEMENT_COLUMNS = ('from', 'to', 'amount')
+
+# Rows serialised per yielded chunk
+ROWS_PER_CHUNK = 500
+
+
+def _csv_value(column, value):
+    if column == 'participants':
+        return ';'.join(value or ())
+    if column == 'amount':
+        return f"{value:.2f}"
+    return '' if value is None else value
+
+
+def csv_chunks(rows, columns, rows_per_chunk=ROWS_PER_CHUNK):
+    """Header line first, then the rows in chunks of rows_per_chunk"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(columns)
+    # The header goes out on its own so the client sees the response start at once
+    yield buffer.getvalue().encode('utf-8')
+    buffer.seek(0)
+    buffer.truncate()
+    pending = 0
+    for row in rows:
+        writer.writerow([_csv_value(column, row.get(column)) for column in columns])
+        pending += 1
+        if pending >= rows_per_chunk:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if pending:
+        yield buffer.getvalue().encode('utf-8')
+
+
+def ndjson_chunks(rows, columns, rows_per_chunk=ROWS_PER_CHUNK):
+    """One JSON object per line, holding only the given columns"""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps({column: row.get(column) for column in columns}, ensure_ascii=False))
+        if len(lines) >= rows_per_chunk:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress a chunk stream into a gzip file on the fly"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        # Sync-flush so every chunk reaches the client now instead of sitting in zlib
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_chunks(rows, fmt, columns, compress=False):
+    """Serialise rows as fmt ('csv' or 'ndjson'), gzipped when compress is set"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'")
+    chunks = (csv_chunks if fmt == 'csv' else ndjson_chunks)(rows, columns)
+    return gzip_chunks(chunks) if compress else chunks
@@ -0,0 +1,143 @@
+"""Exact balance arithmetic in integer paise.
+
+Amounts are converted to integer minor units (paise) once, so shares, net
+balances and settlements never accumulate float error. An expense of N paise
+split between k participants gives every participant N // k paise; the
+N % k leftover paise go one each to participants in name order, starting at
+position ``expense id % k`` so the extra paisa rotates between expenses
+instead of always landing on the same person.
+
+compute_balances() evaluates a whole group in one vectorised pass with NumPy
+when it is installed, and falls back to plain Python otherwise. Both paths use
+integer arithmetic only and give identical results. NumPy is imported on the
+first such call, not at startup.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+PAISE_PER_RUPEE = 100
+
+_numpy = None
+
+
+def _load_numpy():
+    """Import NumPy on first use, returns None if it is not installed"""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:  # NumPy is optional
+            numpy = False
+        _numpy = numpy
+    return _numpy or None
+
+
+def to_paise(amount):
+    """Convert a rupee amount (float, str or Decimal) to integer paise"""
+    rupees = Decimal(str(amount)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    return int(rupees * PAISE_PER_RUPEE)
+
+
+def from_paise(paise):
+    """Convert integer paise back to a rupee float for display"""
+    return paise / PAISE_PER_RUPEE
+
+
+def split_paise(amount_paise, participants, offset=0):
+    """Split an amount between participants, returns [(participant, share)] in name order"""
+    ordered = sorted(participants)
+    count = len(ordered)
+    if not count:
+        return []
+    base, remainder = divmod(amount_paise, count)
+    start = offset % count
+    return [(participant, base + (1 if (rank - start) % count < remainder else 0))
+            for rank, participant in enumerate(ordered)]
+
+
+def expense_shares(expense):
+    """Per-participant shares of an expense in paise"""
+    return split_paise(to_paise(expense['amount']), expense['participants'], expense.get('id', 0))
+
+
+def expense_deltas(expense):
+    """Net balance change per user caused by an expense, in paise"""
+    if not expense['participants']:
+        return {}
+    amount = to_paise(expense['amount'])
+    deltas = {}
+    for participant, share in split_paise(amount, expense['participants'], expense.get('id', 0)):
+        deltas[participant] = deltas.get(participant, 0) - share
+    payer = expense['paid_by']
+    deltas[payer] = deltas.get(payer, 0) + amount
+    return deltas
+
+
+def compute_balances(users, expenses, use_numpy=None):
+    """Net balance in paise for every user over the given expenses"""
+    if use_numpy is None:
+        use_numpy = _load_numpy() is not None
+    if use_numpy:
+        if _load_numpy() is None:
+            raise RuntimeError("NumPy is not installed")
+        return _compute_balances_numpy(users, expenses)
+    return _compute_balances_python(users, expenses)
+
+
+def _compute_balances_python(users, expenses):
+    balances = {user: 0 for user in users}
+    for expense in expenses:
+        for user, delta in expense_deltas(expense).items():
+            balances[user] = balances.get(user, 0) + delta
+    return balances
+
+
+def _compute_balances_numpy(users, expenses):
+    """Vectorised replay over the sparse user x expense incidence matrix.
+
+    Each (expense, participant) pair is one non-zero entry; shares for all
+    entries are computed at once and scattered into the per-user balance
+    vector with bincount.
+    """
+    np = _load_numpy()
+    user_index = {user: i for i, user in enumerate(users)}
+    names = list(users)
+
+    def index_of(user):
+        if user not in user_index:
+            user_index[user] = len(names)
+            names.append(user)
+        return user_index[user]
+
+    payer_idx, amounts, counts, offsets = [], [], [], []
+    entry_user, entry_rank = [], []
+    for expense in expenses:
+        participants = expense['participants']
+        if not participants:
+            continue
+        payer_idx.append(index_of(expense['paid_by']))
+        amounts.append(to_paise(expense['amount']))
+        counts.append(len(participants))
+        offsets.append(expense.get('id', 0))
+        for rank, participant in enumerate(sorted(participants)):
+            entry_user.append(index_of(participant))
+            entry_rank.append(rank)
+
+    if not amounts:
+        return {user: 0 for user in names}
+
+    amounts = np.array(amounts, dtype=np.int64)
+    counts = np.array(counts, dtype=np.int64)
+    starts = np.array(offsets, dtype=np.int64) % counts
+    entry_expense = np.repeat(np.arange(len(counts)), counts)
+    entry_count = counts[entry_expense]
+
+    base, remainder = np.divmod(amounts, counts)
+    rotated_rank = (np.array(entry_rank, dtype=np.int64) - starts[entry_expense]) % entry_count
+    shares = base[entry_expense] + (rotated_rank < remainder[entry_expense])
+
+    size = len(names)
+    # Integer sums stay exact in float64 up to 2**53 paise
+    paid = np.bincount(np.array(payer_idx), weights=amounts, minlength=size)
+    owed = np.bincount(np.array(entry_user), weights=shares, minlength=size)
+    net = np.rint(paid - owed).astype(np.int64)
+    return {user: int(net[i]) for i, user in enumerate(names)}
@@ -0,0 +1,297 @@
+"""Fault-tolerant wrapper around a generative model.
+
+ResilientModel has the same generate_content() call as
+genai.GenerativeModel and adds, in order:
+
+  circuit breaker  after failure_threshold transient failures in a row calls
+                   fail at once (LLMUnavailable) for reset_timeout seconds,
+                   then a single trial call decides whether to close again.
+  rate limit       token bucket of ``rate`` calls per second with ``burst``
+                   capacity; a call waits for a token until its deadline.
+  deadline         every call gets ``timeout`` seconds in total, retries
+                   included; each attempt runs on a helper thread and is
+                   abandoned when the time is up. An abandoned attempt keeps
+                   its thread until the model gives up too, so when all
+                   max_concurrency threads are taken an attempt fails at once
+                   (a transient 'saturated' error) instead of queueing behind
+                   them.
+  retries          transient errors (timeouts, 429, 5xx, connection errors)
+                   are retried up to max_retries times with full-jitter
+                   exponential backoff; other errors are raised as they are.
+
+stats() returns counters and the breaker state for monitoring, and
+prometheus() the same for the /metrics endpoint. FakeModel stands in for
+Gemini in development, tests and benchmarks, with no network access.
+"""
+import sys
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import metrics
+
+
+def transient_errors():
+    """Exception types worth retrying"""
+    errors = (TimeoutError, ConnectionError)
+    # Gemini's errors can only occur once its SDK is loaded, so never import it here
+    api_exceptions = sys.modules.get('google.api_core.exceptions')
+    if api_exceptions is not None:
+        errors += (api_exceptions.TooManyRequests, api_exceptions.ResourceExhausted,
+                   api_exceptions.ServerError, api_exceptions.DeadlineExceeded)
+    return errors
+
+
+class LLMUnavailable(Exception):
+    """The model could not answer: breaker open, rate limited, out of time or failing"""
+
+    def __init__(self, reason, message=None):
+        super().__init__(message or reason)
+        self.reason = reason
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """Take a token, waiting at most timeout seconds; returns False if none came"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or wait > remaining:
+                    return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True if a call may go ahead"""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self._trial_running:
+                # Let exactly one call find out whether the model is back
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.times_opened += 1
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        """End a trial call that neither succeeded nor failed transiently"""
+        with self._lock:
+            self._trial_running = False
+
+
+class ResilientModel:
+    def __init__(self, model, timeout=30, rate=5, burst=10, max_retries=2,
+                 backoff_base=0.5, backoff_max=4.0, failure_threshold=5,
+                 reset_timeout=30, max_concurrency=8):
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        # Attempts run here so a hung request cannot hold the caller past its deadline
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm-call")
+        # Attempts submitted and not finished yet, abandoned ones included
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self.counters = {
+            'calls': 0,
+            'successes': 0,
+            'failures': 0,
+            'attempts': 0,
+            'retries': 0,
+            'timeouts': 0,
+            'rate_limited': 0,
+            'rejected_open': 0,
+            'saturated': 0
+        }
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    @metrics.instrument('llm.generate_content')
+    def generate_content(self, contents, request_options=None, **kwargs):
+        """Call the model with rate limiting, retries, a deadline and the breaker"""
+        timeout = (request_options or {}).get('timeout') or self.timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        self._count('calls')
+
+        if not self.breaker.allow():
+            self._count('rejected_open')
+            raise LLMUnavailable('circuit_open', "The model is unavailable, try again shortly")
+
+        attempt = 0
+        while True:
+            if not self.bucket.acquire(timeout=deadline - time.monotonic()):
+                self._count('rate_limited')
+                self.breaker.release()
+                raise LLMUnavailable('rate_limited', "Too many model calls, try again shortly")
+
+            remaining = deadline - time.monotonic()
+            self._count('attempts')
+            future = self._submit(contents, dict(request_options or {}, timeout=remaining), kwargs)
+            if future is None:
+                self._count('saturated')
+                error, reason = TimeoutError(
+                    f"All {self.max_concurrency} model threads are busy with earlier calls"), 'saturated'
+            else:
+                try:
+                    response = future.result(timeout=remaining)
+                except FutureTimeout:
+                    future.cancel()
+                    self._count('timeouts')
+                    error, reason = TimeoutError(f"No answer within {timeout:g}s"), 'deadline'
+                except transient_errors() as e:
+                    error, reason = e, 'failed'
+                except Exception:
+                    # A bad request or similar: the model is up, retrying will not help
+                    self.breaker.release()
+                    self._count('failures')
+                    raise
+                else:
+                    self.breaker.record_success()
+                    self._count('successes')
+                    self._record_latency(time.monotonic() - started)
+                    return response
+
+            attempt += 1
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+            if attempt > self.max_retries or time.monotonic() + delay >= deadline:
+                self.breaker.record_failure()
+                self._count('failures')
+                self._record_latency(time.monotonic() - started)
+                raise LLMUnavailable(reason, f"The model did not answer: {error}") from error
+            self._count('retries')
+            time.sleep(delay)
+
+    def _submit(self, contents, request_options, kwargs):
+        """Start an attempt on a free helper thread, None if every thread is taken"""
+        with self._lock:
+            if self._in_flight >= self.max_concurrency:
+                return None
+            self._in_flight += 1
+        future = self._executor.submit(self.model.generate_content, contents,
+                                       request_options=request_options, **kwargs)
+        future.add_done_callback(self._attempt_done)
+        return future
+
+    def _attempt_done(self, future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _record_latency(self, elapsed):
+        with self._lock:
+            self._latency_total += elapsed
+            self._latency_max = max(self._latency_max, elapsed)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            finished = counters['successes'] + counters['failures']
+            latency = {
+                'mean': self._latency_total / finished if finished else 0.0,
+                'max': self._latency_max
+            }
+            in_flight = self._in_flight
+        return dict(counters, latency=latency, in_flight=in_flight, breaker={
+            'state': self.breaker.state,
+            'consecutive_failures': self.breaker.failures,
+            'times_opened': self.breaker.times_opened
+        })
+
+    def prometheus(self):
+        """stats() in the Prometheus text format, see metrics.add_collector()"""
+        stats = self.stats()
+        breaker = stats['breaker']
+        return '\n'.join([
+            metrics.render_family('llm_breaker_state', 'gauge',
+                                  "1 for the circuit breaker's current state",
+                                  [({'state': state}, int(state == breaker['state']))
+                                   for state in ('closed', 'open', 'half_open')]),
+            metrics.render_family('llm_breaker_trips_total', 'counter',
+                                  "Times the circuit breaker opened",
+                                  [({}, breaker['times_opened'])]),
+            metrics.render_family('llm_breaker_consecutive_failures', 'gauge',
+                                  "Failed model calls since the last success",
+                                  [({}, breaker['consecutive_failures'])]),
+            metrics.render_family('llm_attempts_in_flight', 'gauge',
+                                  "Model attempts still running, abandoned ones included",
+                                  [({}, stats['in_flight'])]),
+            metrics.render_family('llm_events_total', 'counter',
+                                  "Model calls, attempts and their outcomes",
+                                  [({'event': name}, stats[name]) for name in sorted(self.counters)])
+        ])
+
+
+class FakeModel:
+    """Offline stand-in for genai.GenerativeModel.
+
+    ``responder(prompt)`` returns the text to answer with or raises to
+    simulate an error; latency adds a fixed delay to every call.
+    """
+
+    class Response:
+        def __init__(self, text):
+            self.text = text
+
+    def __init__(self, responder=None, latency=0.0):
+        self.responder = responder or (lambda prompt: '{"error": "No amount found"}')
+        self.latency = latency
+        self.calls = 0
+
+    def generate_content(self, contents, request_options=None, **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self.Response(self.responder(contents))
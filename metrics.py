@@ -0,0 +1,293 @@
+"""In-process timing metrics and an opt-in sampling profiler.
+
+Three histograms are kept per worker process and rendered in the
+Prometheus text format by render():
+
+  http_request_duration_seconds     every request, by method, endpoint and status
+  span_duration_seconds             code wrapped in span() or @instrument()
+  template_render_duration_seconds  every Jinja template render
+
+along with whatever add_collector() callbacks return, such as the model
+client's circuit breaker state.
+
+Settings are read from the environment once, at import:
+
+  METRICS_ENABLED=0           turns everything off; @instrument() then returns
+                              the function unchanged, so the cost is zero
+  PROFILE_SAMPLE_RATE=0.05    fraction of requests run under the sampling
+                              profiler (default 0, off)
+  PROFILE_INTERVAL_MS=5       how often a profiled request's stack is sampled
+  PROFILE_KEEP=20             how many of the slowest profiled requests are kept
+
+A profiled request records its spans and a collapsed-stack sample count
+(the flame graph format), and slowest_requests() returns the slowest ones.
+Each gunicorn worker has its own numbers; a scrape sees the worker that
+answered it. Request times end when the view returns, so a streamed body
+is not included.
+"""
+import os
+import sys
+import time
+import heapq
+import bisect
+import random
+import functools
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 20))
+
+# Upper bounds in seconds, Prometheus' defaults
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Innermost frames kept per profiler sample
+MAX_STACK_DEPTH = 40
+# Stacks listed per slow request, the rest are summed into one line
+MAX_STACKS = 25
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per combination of label values"""
+
+    def __init__(self, name, help_text, labels, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket (the last one is +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def snapshot(self):
+        """{label values: (bucket counts, sum)} copied under the lock"""
+        with self._lock:
+            return {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        bounds = [repr(b) for b in self.buckets] + ['+Inf']
+        for label_values, (counts, total) in sorted(self.snapshot().items()):
+            labels = ','.join(f'{name}="{_escape(value)}"'
+                              for name, value in zip(self.labels, label_values))
+            prefix = labels + ',' if labels else ''
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            suffix = f'{{{labels}}}' if labels else ''
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return '\n'.join(lines)
+
+
+REQUEST_DURATION = Histogram('http_request_duration_seconds', "Time to handle a request",
+                             ('method', 'endpoint', 'status'))
+SPAN_DURATION = Histogram('span_duration_seconds', "Time spent in instrumented code", ('span',))
+RENDER_DURATION = Histogram('template_render_duration_seconds', "Time to render a template",
+                            ('template',))
+HISTOGRAMS = [REQUEST_DURATION, SPAN_DURATION, RENDER_DURATION]
+
+# Per-thread request state: start time, render start, and the profile of a sampled request
+_local = threading.local()
+
+
+# Callables returning more exposition text for render(), see add_collector()
+_collectors = []
+
+
+def add_collector(collect):
+    """Append collect() to every render(), for state other modules keep themselves"""
+    _collectors.append(collect)
+
+
+def render_family(name, kind, help_text, samples):
+    """One gauge or counter in the text format, samples being (labels dict, value) pairs"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        label_text = ','.join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+        lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return '\n'.join(lines)
+
+
+def render():
+    """All histograms and collectors in the Prometheus text exposition format"""
+    return '\n'.join([h.render() for h in HISTOGRAMS] + [collect() for collect in _collectors]) + '\n'
+
+
+def _finish_span(name, started):
+    elapsed = time.perf_counter() - started
+    SPAN_DURATION.observe(elapsed, name)
+    profile = getattr(_local, 'profile', None)
+    if profile is not None:
+        profile['spans'].append((name, round(elapsed * 1000, 3)))
+
+
+@contextmanager
+def span(name):
+    """Time the block as span name"""
+    if not ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _finish_span(name, started)
+
+
+def instrument(name):
+    """Decorator timing every call of a function as span name"""
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _finish_span(name, started)
+        return wrapper
+    return decorate
+
+
+class SamplingProfiler:
+    """Samples the stacks of the threads serving profiled requests.
+
+    One daemon thread runs while at least one profiled request is in
+    flight, and reads sys._current_frames() every interval seconds.
+    """
+
+    def __init__(self, interval=0.005, keep=20):
+        self.interval = interval
+        self.keep = keep
+        # thread id -> Counter of collapsed stacks
+        self._active = {}
+        self._thread = None
+        self._lock = threading.Lock()
+        # Min-heap of (duration, sequence, report) holding the slowest requests
+        self._slowest = []
+        self._sequence = 0
+
+    def start(self, thread_id):
+        with self._lock:
+            self._active[thread_id] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="metrics-profiler", daemon=True)
+                self._thread.start()
+
+    def stop(self, thread_id):
+        """Stop sampling a thread, returns its stack counts"""
+        with self._lock:
+            return self._active.pop(thread_id, Counter())
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                thread_ids = list(self._active)
+            frames = sys._current_frames()
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                key = ';'.join(reversed(stack))
+                with self._lock:
+                    samples = self._active.get(thread_id)
+                    if samples is not None:
+                        samples[key] += 1
+
+    def record(self, duration, report):
+        """Keep report if the request is among the keep slowest so far"""
+        with self._lock:
+            self._sequence += 1
+            entry = (duration, self._sequence, report)
+            if len(self._slowest) < self.keep:
+                heapq.heappush(self._slowest, entry)
+            elif duration > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    def slowest(self):
+        with self._lock:
+            return [report for _, _, report in sorted(self._slowest, reverse=True)]
+
+
+profiler = SamplingProfiler(PROFILE_INTERVAL_MS / 1000, PROFILE_KEEP) if PROFILE_SAMPLE_RATE > 0 else None
+
+
+def request_started():
+    _local.started = time.perf_counter()
+    if profiler is not None and random.random() < PROFILE_SAMPLE_RATE:
+        _local.profile = {'spans': []}
+        profiler.start(threading.get_ident())
+
+
+def request_finished(method, endpoint, status, path):
+    started = getattr(_local, 'started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    _local.started = None
+    REQUEST_DURATION.observe(elapsed, method, endpoint or 'unmatched', str(status))
+    profile = getattr(_local, 'profile', None)
+    if profile is not None:
+        _local.profile = None
+        samples = profiler.stop(threading.get_ident())
+        stacks = samples.most_common(MAX_STACKS)
+        other = sum(samples.values()) - sum(count for _, count in stacks)
+        if other:
+            stacks.append(('(other stacks)', other))
+        profiler.record(elapsed, {
+            'method': method,
+            'path': path,
+            'endpoint': endpoint,
+            'status': status,
+            'duration_ms': round(elapsed * 1000, 3),
+            'finished': time.time(),
+            'spans': profile['spans'],
+            'samples': [{'stack': stack, 'count': count} for stack, count in stacks]
+        })
+
+
+def render_started(template):
+    _local.render_started = time.perf_counter()
+
+
+def render_finished(template):
+    started = getattr(_local, 'render_started', None)
+    if started is not None:
+        _local.render_started = None
+        RENDER_DURATION.observe(time.perf_counter() - started, template.name or 'string')
+
+
+def slowest_requests():
+    """Reports of the slowest profiled requests, slowest first; empty when profiling is off"""
+    return profiler.slowest() if profiler is not None else []
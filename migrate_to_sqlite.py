@@ -0,0 +1,68 @@
+"""One-shot migration of JSON group files and users.json into SQLite.
+
+Usage: python migrate_to_sqlite.py [data_dir]
+
+Every ``group_*.json`` file (including any journal tail written by the
+journal backend) becomes ``group_*.db`` next to it, and ``users.json``
+becomes ``users.db``. Existing databases are left untouched so the tool can
+be re-run safely. Start the app with BILL_SPLITTER_STORAGE=sqlite afterwards.
+"""
+import os
+import sys
+import glob
+import json
+
+from bill_splitter import BillSplitter
+from storage import SqliteStorage, SqliteAccounts
+
+
+def migrate_group(json_path):
+    """Import one group file, returns the number of expenses copied"""
+    db_path = os.path.splitext(json_path)[0] + ".db"
+    if os.path.exists(db_path):
+        print(f"Skipping {json_path}: {db_path} already exists")
+        return 0
+
+    # The journal backend reads plain JSON groups too and replays any log tail
+    source = BillSplitter(storage_file=json_path, storage='journal')
+    state = source.to_dict()
+    source.close()
+    expenses, users = state['expenses'], state['users']
+
+    target = SqliteStorage(db_path)
+    try:
+        target.import_state({'expenses': expenses, 'users': users})
+    finally:
+        target.close()
+    print(f"Migrated {json_path} -> {db_path} ({len(expenses)} expenses, {len(users)} users)")
+    return len(expenses)
+
+
+def migrate_users(data_dir):
+    users_file = os.path.join(data_dir, "users.json")
+    users_db = os.path.join(data_dir, "users.db")
+    if not os.path.exists(users_file):
+        print("No users.json found, skipping accounts")
+        return
+    if os.path.exists(users_db):
+        print(f"Skipping users.json: {users_db} already exists")
+        return
+    with open(users_file, 'r') as f:
+        users = json.load(f)
+    SqliteAccounts(users_db).save(users)
+    print(f"Migrated {users_file} -> {users_db} ({len(users)} accounts)")
+
+
+def main(data_dir="."):
+    migrate_users(data_dir)
+    total = 0
+    # A journaled group may only have a log so far, no snapshot
+    paths = set(glob.glob(os.path.join(data_dir, "group_*.json")))
+    paths.update(p[:-len(".log")] for p in glob.glob(os.path.join(data_dir, "group_*.json.log")))
+    for json_path in sorted(paths):
+        total += migrate_group(json_path)
+    print(f"Done, {total} expenses migrated")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else ".")
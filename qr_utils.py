@@ -1,11 +1,152 @@
 # qr_utils.py
-import qrcode
+"""UPI payment QR codes.
+
+Codes are cached by the exact data they encode (the UPI URL) and output
+format, least recently used first out, so the settlements a dashboard shows
+on every page load are rendered once. SVG is drawn straight from the module
+matrix and needs no Pillow; PNG goes through qrcode's image factory (Pillow
+when installed, pure-Python PNG otherwise).
+"""
 import io
 import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from urllib.parse import urlencode, quote
+
+QR_MIMETYPES = {'svg': 'image/svg+xml', 'png': 'image/png'}
+
+# Quiet zone in modules around the code
+QR_BORDER = 2
+
+
+def upi_url(upi_id, name, amount, note=None):
+    """upi://pay link asking for amount rupees to be paid to upi_id"""
+    params = {'pa': upi_id, 'pn': name, 'am': f"{float(amount):.2f}", 'cu': 'INR'}
+    if note:
+        params['tn'] = note
+    return "upi://pay?" + urlencode(params, quote_via=quote)
+
+
+def qr_etag(data, fmt):
+    """Entity tag for a QR image, known without rendering it"""
+    return hashlib.sha1(f"{fmt}:{QR_BORDER}:{data}".encode('utf-8')).hexdigest()[:24]
 
-def generate_qr_base64(data: str) -> str:
-    qr = qrcode.make(data)
+
+def _qr_matrix(data):
+    # qrcode pulls in Pillow when it is installed, only load it once a QR code is needed
+    import qrcode
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, border=QR_BORDER)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr
+
+
+def _svg(matrix):
+    """One stroked <path> with a relative horizontal line per run of dark modules"""
+    size = len(matrix)
+    runs = []
+    pen_x = pen_y = 0
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < size:
+            if row[x]:
+                start = x
+                while x < size and row[x]:
+                    x += 1
+                runs.append(f"m{start - pen_x} {y - pen_y}h{x - start}")
+                pen_x, pen_y = x, y
+            else:
+                x += 1
+    # The pen starts half a module down so each 1-wide stroke covers its row exactly
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" '
+            f'shape-rendering="crispEdges"><rect width="{size}" height="{size}" fill="#fff"/>'
+            f'<path d="M0 .5{"".join(runs)}" stroke="#000"/></svg>').encode('ascii')
+
+
+def render_qr(data, fmt='svg'):
+    """Render data as a QR code, returns the image bytes"""
+    if fmt not in QR_MIMETYPES:
+        raise ValueError(f"Unknown QR format '{fmt}'")
+    qr = _qr_matrix(data)
+    if fmt == 'svg':
+        return _svg(qr.get_matrix())
     buffered = io.BytesIO()
-    qr.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
-    return f"data:image/png;base64,{img_str}"
+    qr.make_image().save(buffered)
+    return buffered.getvalue()
+
+
+class QRCache:
+    """LRU cache of rendered QR codes keyed by (data, format)"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        # (data, fmt) -> (image bytes, etag)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, data, fmt='svg'):
+        """(image bytes, etag) for data, rendering it on a miss"""
+        return self.get_many([data], fmt)[data]
+
+    def get_many(self, items, fmt='svg'):
+        """Render every code that is not cached yet, returns {data: (image bytes, etag)}"""
+        found, missing = {}, []
+        with self._lock:
+            for data in items:
+                if data in found:
+                    continue
+                entry = self._entries.get((data, fmt))
+                if entry is not None:
+                    self.hits += 1
+                    self._entries.move_to_end((data, fmt))
+                    found[data] = entry
+                else:
+                    self.misses += 1
+                    found[data] = None
+                    missing.append(data)
+
+        # Render outside the lock, the same code may be rendered twice but never wrongly
+        rendered = {data: (render_qr(data, fmt), qr_etag(data, fmt)) for data in missing}
+
+        with self._lock:
+            for data, entry in rendered.items():
+                self._entries[(data, fmt)] = entry
+                self._entries.move_to_end((data, fmt))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        found.update(rendered)
+        return found
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': sum(len(body) for body, _ in self._entries.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+qr_cache = QRCache()
+
+
+def generate_qr_batch(items, fmt='svg', cache=None):
+    """QR codes for many UPI URLs in one call, returns {url: (image bytes, etag)}"""
+    return (cache or qr_cache).get_many(items, fmt)
+
+
+def generate_qr_base64(data: str, fmt: str = 'png') -> str:
+    body, _ = qr_cache.get(data, fmt)
+    img_str = base64.b64encode(body).decode("utf-8")
+    return f"data:{QR_MIMETYPES[fmt]};base64,{img_str}"
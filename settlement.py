@@ -0,0 +1,234 @@
+"""Settlement strategies: turn net balances into a list of transfers.
+
+All amounts are integer paise (see ledger.py), so a group is settled exactly
+when every balance reaches zero.
+
+Strategies:
+  greedy     match the largest debtor with the largest creditor, repeatedly.
+             O(n log n); at most n - 1 transfers.
+  exact      minimum number of transfers. A group whose non-zero balances can
+             be split into m disjoint zero-sum subsets needs exactly n - m
+             transfers, so this searches (with a memoised table over subsets)
+             for the largest such partition. Exponential, small groups only.
+  heuristic  for large groups: cancel exact opposite pairs and zero-sum
+             triples first, then settle the rest greedily.
+  auto       exact up to EXACT_LIMIT non-zero balances, heuristic above.
+
+exact and heuristic check a wall-clock budget (time.perf_counter) as they go.
+When it runs out they fall back to greedy for whatever is still unsettled, so
+a result is always returned and the report says which strategy produced it.
+"""
+import time
+
+STRATEGIES = ('greedy', 'exact', 'heuristic', 'auto')
+
+# Largest number of non-zero balances auto tries the exact solver on
+EXACT_LIMIT = 16
+# Hard cap for an explicit exact request, its tables hold 2**n entries
+EXACT_MAX = 20
+
+DEFAULT_TIME_BUDGET = 0.05
+
+
+class _BudgetExceeded(Exception):
+    pass
+
+
+class _Deadline:
+    """Wall-clock deadline, checked every few iterations to keep overhead low"""
+
+    def __init__(self, budget):
+        self.end = None if budget is None else time.perf_counter() + budget
+        self._ticks = 0
+
+    def check(self):
+        if self.end is None:
+            return
+        self._ticks += 1
+        if self._ticks % 256 == 0 and time.perf_counter() > self.end:
+            raise _BudgetExceeded()
+
+
+def settle(balances, strategy='auto', time_budget=DEFAULT_TIME_BUDGET):
+    """Settle net balances (user -> paise).
+
+    Returns {'settlements': [{'from', 'to', 'amount'}], 'strategy': used,
+    'requested': strategy, 'elapsed': wall-clock seconds}. 'strategy' differs from
+    the requested one when auto picked a solver or the budget forced greedy.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown settlement strategy '{strategy}'")
+    started = time.perf_counter()
+    # Sort by amount then name so every strategy is deterministic
+    entries = sorted(((user, amount) for user, amount in balances.items() if amount),
+                     key=lambda x: (x[1], x[0]))
+
+    used = strategy
+    if strategy == 'auto':
+        used = 'exact' if len(entries) <= EXACT_LIMIT else 'heuristic'
+
+    deadline = _Deadline(time_budget)
+    if used == 'exact':
+        settlements, used = _settle_exact(entries, deadline)
+    elif used == 'heuristic':
+        settlements, used = _settle_heuristic(entries, deadline)
+    else:
+        settlements = _settle_greedy(entries)
+
+    return {
+        'settlements': settlements,
+        'strategy': used,
+        'requested': strategy,
+        'elapsed': time.perf_counter() - started
+    }
+
+
+def _settle_greedy(entries):
+    """Pair the largest debtor with the largest creditor until all are even"""
+    debtors = sorted(((u, a) for u, a in entries if a < 0), key=lambda x: (x[1], x[0]))
+    creditors = sorted(((u, a) for u, a in entries if a > 0), key=lambda x: (-x[1], x[0]))
+
+    settlements = []
+    i, j = 0, 0
+    while i < len(debtors) and j < len(creditors):
+        debtor, debt = debtors[i]
+        creditor, credit = creditors[j]
+        amount = min(-debt, credit)
+        if amount > 0:
+            settlements.append({'from': debtor, 'to': creditor, 'amount': amount})
+        debtors[i] = (debtor, debt + amount)
+        creditors[j] = (creditor, credit - amount)
+        if debtors[i][1] == 0:
+            i += 1
+        if creditors[j][1] == 0:
+            j += 1
+    return settlements
+
+
+def _cancel_pairs(entries):
+    """Settle debtor/creditor pairs with exactly opposite balances, always optimal"""
+    creditors_by_amount = {}
+    for user, amount in entries:
+        if amount > 0:
+            creditors_by_amount.setdefault(amount, []).append(user)
+    settlements, rest = [], []
+    for user, amount in entries:
+        if amount < 0 and creditors_by_amount.get(-amount):
+            creditor = creditors_by_amount[-amount].pop()
+            settlements.append({'from': user, 'to': creditor, 'amount': -amount})
+        elif amount < 0:
+            rest.append((user, amount))
+    for amount, users in creditors_by_amount.items():
+        rest.extend((user, amount) for user in users)
+    rest.sort(key=lambda x: (x[1], x[0]))
+    return settlements, rest
+
+
+def _settle_exact(entries, deadline):
+    settlements, rest = _cancel_pairs(entries)
+    try:
+        groups = _zero_sum_partition(rest, deadline)
+    except _BudgetExceeded:
+        return settlements + _settle_greedy(rest), 'greedy'
+    for group in groups:
+        settlements.extend(_settle_greedy(group))
+    return settlements, 'exact'
+
+
+def _zero_sum_partition(entries, deadline):
+    """Split entries into the largest number of disjoint zero-sum groups.
+
+    best[mask] is the most zero-sum groups the members of ``mask`` can be cut
+    into along a chain of single-member additions, counting the mask itself
+    when its sum is zero; the full mask gives the optimum.
+    """
+    n = len(entries)
+    if n == 0:
+        return []
+    if n > EXACT_MAX:
+        raise _BudgetExceeded()
+    amounts = [amount for _, amount in entries]
+    size = 1 << n
+    total = [0] * size
+    best = [0] * size
+    for mask in range(1, size):
+        deadline.check()
+        low = mask & -mask
+        i = low.bit_length() - 1
+        total[mask] = total[mask ^ low] + amounts[i]
+        value = 0
+        rest = mask
+        while rest:
+            bit = rest & -rest
+            rest ^= bit
+            if best[mask ^ bit] > value:
+                value = best[mask ^ bit]
+        best[mask] = value + (1 if total[mask] == 0 else 0)
+
+    # Walk back down the table, cutting a group whenever the prefix sums to zero
+    groups, current = [], []
+    mask = size - 1
+    while mask:
+        target = best[mask] - (1 if total[mask] == 0 else 0)
+        if total[mask] == 0 and current:
+            groups.append(current)
+            current = []
+        rest = mask
+        while rest:
+            bit = rest & -rest
+            rest ^= bit
+            if best[mask ^ bit] == target:
+                current.append(entries[bit.bit_length() - 1])
+                mask ^= bit
+                break
+    if current:
+        groups.append(current)
+    return groups
+
+
+def _settle_heuristic(entries, deadline):
+    settlements, rest = _cancel_pairs(entries)
+    try:
+        triple_settlements, rest = _cancel_triples(rest, deadline)
+    except _BudgetExceeded:
+        return settlements + _settle_greedy(rest), 'greedy'
+    return settlements + triple_settlements + _settle_greedy(rest), 'heuristic'
+
+
+def _cancel_triples(entries, deadline):
+    """Settle zero-sum triples (one party against two) with two transfers"""
+    debtors = [(u, a) for u, a in entries if a < 0]
+    creditors = [(u, a) for u, a in entries if a > 0]
+    settlements = []
+    # Two creditors covering one debtor, then two debtors owing one creditor
+    for singles, pairs, sign in ((debtors, creditors, 1), (creditors, debtors, -1)):
+        by_amount = {}
+        for user, amount in pairs:
+            by_amount.setdefault(amount, []).append(user)
+        used = set()
+        remaining_singles = []
+        for user, amount in singles:
+            match = None
+            for user_a, amount_a in pairs:
+                deadline.check()
+                if user_a in used:
+                    continue
+                candidates = [u for u in by_amount.get(-amount - amount_a, ())
+                              if u != user_a and u not in used]
+                if candidates:
+                    match = (user_a, amount_a, candidates[0], -amount - amount_a)
+                    break
+            if match is None:
+                remaining_singles.append((user, amount))
+                continue
+            user_a, amount_a, user_b, amount_b = match
+            used.update((user_a, user_b))
+            for other, other_amount in ((user_a, amount_a), (user_b, amount_b)):
+                if sign > 0:
+                    settlements.append({'from': user, 'to': other, 'amount': other_amount})
+                else:
+                    settlements.append({'from': other, 'to': user, 'amount': -other_amount})
+        pairs[:] = [(u, a) for u, a in pairs if u not in used]
+        singles[:] = remaining_singles
+    rest = sorted(debtors + creditors, key=lambda x: (x[1], x[0]))
+    return settlements, rest
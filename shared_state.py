@@ -0,0 +1,130 @@
+"""State shared between gunicorn worker processes through the filesystem.
+
+Each worker keeps its own copy of users.json and of every group it has loaded.
+Writers take an exclusive advisory lock on a ``.lock`` file next to the data
+file, bring their copy up to date, write, and release. Readers compare a cheap
+stamp (os.stat, or SQLite's data_version) on each request and only reload when
+it moved, so unchanged files are never re-read.
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Not on POSIX, fall back to in-process locking only
+    fcntl = None
+
+
+def file_stamp(path):
+    """Cheap change marker for a file, None if it does not exist"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class FileLock:
+    """Exclusive inter-process lock on ``path``, re-entrant within a process"""
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except Exception:
+                if self._fd is not None:
+                    os.close(self._fd)
+                    self._fd = None
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def try_lock_file(path):
+    """Take an exclusive lock on path without waiting, returns the fd or None"""
+    if fcntl is None:
+        return None
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def unlock_file(fd):
+    fcntl.flock(fd, fcntl.LOCK_UN)
+    os.close(fd)
+
+
+class SharedDict:
+    """A dict mirrored from storage that several processes read and write.
+
+    ``data`` is updated in place, so modules holding a reference to it always
+    see the current contents. load() returns the stored dict, save(data) writes
+    it atomically and stamp() returns a value that changes whenever another
+    process saved. If load() raises, ``data`` keeps what was last read and
+    every refresh() and transaction() tries again, so nothing is saved over
+    data that could not be read.
+    """
+
+    def __init__(self, load, save, stamp, lock_path):
+        self._load = load
+        self._save = save
+        self._stamp = stamp
+        self.lock = FileLock(lock_path)
+        self.data = {}
+        self.version = None
+        self.reload()
+
+    def reload(self):
+        with self.lock:
+            version = self._stamp()
+            latest = self._load()
+            # Other threads read data without the lock: replace entries one by
+            # one rather than clearing first, so it never looks empty
+            self.data.update(latest)
+            for key in [key for key in self.data if key not in latest]:
+                del self.data[key]
+            self.version = version
+
+    def refresh(self):
+        """Reload if another process changed the data, returns True if it did"""
+        if self._stamp() == self.version:
+            return False
+        self.reload()
+        return True
+
+    @contextmanager
+    def transaction(self):
+        """Lock, bring the data up to date, let the caller change it, then save"""
+        with self.lock:
+            self.refresh()
+            yield self.data
+            self._save(self.data)
+            self.version = self._stamp()
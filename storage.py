@@ -0,0 +1,844 @@
+import os
+import json
+import time
+import queue
+import sqlite3
+import logging
+import threading
+
+import metrics
+from shared_state import FileLock, file_stamp, try_lock_file, unlock_file, fcntl
+
+logger = logging.getLogger(__name__)
+
+
+def atomic_write_json(path, data, indent=2):
+    """Write JSON to a temp file and rename it over the target"""
+    # Unique per writer so concurrent workers never share a temp file
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, 'w') as f:
+        # dumps() without indent runs on the C encoder, json.dump() never does
+        f.write(json.dumps(data, indent=indent))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class JsonStorage:
+    """Keeps a whole group in one JSON file, rewritten on every change.
+
+    With flush_interval set, commits only mark the group dirty and a timer
+    writes it at most once per interval, so a burst of changes costs a single
+    rewrite. Other workers do not see those changes until the write lands, so
+    only enable it when one process serves the group.
+    """
+
+    # File backends keep expenses in memory; SqliteStorage answers queries itself
+    supports_queries = False
+
+    def __init__(self, path, flush_interval=0):
+        self.path = path
+        self.flush_interval = flush_interval
+        # Held by BillSplitter around loads and writes, shared by all workers
+        self.lock = FileLock(f"{path}.lock")
+        self._dirty = None
+        self._timer = None
+        self._timer_lock = threading.Lock()
+
+    def stamp(self):
+        """Changes whenever any process rewrites the group"""
+        return file_stamp(self.path)
+
+    @metrics.instrument('storage.json.load')
+    def load(self):
+        """Return (state, records) for the group, state is None if nothing is stored"""
+        self.flush()
+        if not os.path.exists(self.path):
+            return None, []
+        with open(self.path, 'r') as f:
+            return json.load(f), []
+
+    @metrics.instrument('storage.json.commit')
+    def commit(self, splitter, records):
+        """Persist the splitter after the given change records were applied"""
+        if not self.flush_interval:
+            atomic_write_json(self.path, splitter.to_dict(), indent=None)
+            return
+        # Snapshot now, so the delayed write holds exactly the committed state
+        state = splitter.to_dict()
+        with self._timer_lock:
+            self._dirty = (splitter, state)
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Write out changes a delayed commit is still holding"""
+        if self._dirty is None:
+            return
+        # Writes happen under the group lock so an older state never lands last
+        with self.lock:
+            with self._timer_lock:
+                dirty, self._dirty = self._dirty, None
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if dirty is None:
+                return
+            splitter, state = dirty
+            atomic_write_json(self.path, state, indent=None)
+            # Our own write, no need for the splitter to reload it
+            splitter._stamp = self.stamp()
+
+    def close(self):
+        self.flush()
+
+
+class _Compactor:
+    """Single background thread that writes journal snapshots"""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, job):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="journal-compactor", daemon=True)
+                self._thread.start()
+        self._queue.put(job)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                job()
+            except Exception as e:
+                logger.error(f"Journal compaction failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def wait(self):
+        """Block until every submitted compaction has finished"""
+        self._queue.join()
+
+
+compactor = _Compactor()
+
+
+def _decode_record(line):
+    """Decode a journal line, None if it holds no record.
+
+    A line that starts with the fragment of a crashed write and ends with a
+    whole record appended after it still gives that record back.
+    """
+    try:
+        return json.loads(line)
+    except ValueError:
+        pass
+    start = line.find(b'{"op"', 1)
+    while start != -1:
+        try:
+            record = json.loads(line[start:])
+            if isinstance(record, dict) and 'seq' in record:
+                return record
+        except ValueError:
+            pass
+        start = line.find(b'{"op"', start + 1)
+    return None
+
+
+def _unbatch(record):
+    """The change records in a journal record, which holds a whole transaction for op 'batch'"""
+    if record.get('op') != 'batch':
+        return [record]
+    for change in record['records']:
+        change['seq'] = record['seq']
+    return record['records']
+
+
+class JournalStorage:
+    """Append-only change log per group, compacted into a snapshot in the background.
+
+    The snapshot lives at ``path`` and uses the same layout as JsonStorage plus a
+    ``journal_seq`` field. Every change is appended as one JSON line to
+    ``path + '.log'``, and a transaction()'s changes share one 'batch' line
+    so they replay all or nothing; records at or below the snapshot's sequence number are
+    skipped on replay, so a crash at any point of a compaction is harmless.
+    Only one process compacts a group at a time (``path + '.compact.lock'``),
+    and the new snapshot is installed under the group lock.
+    """
+
+    supports_queries = False
+
+    def __init__(self, path, fsync_every=32, fsync_interval=1.0, compact_every=1000):
+        self.path = path
+        self.log_path = f"{path}.log"
+        self.old_log_path = f"{path}.log.1"
+        self.compact_lock_path = f"{path}.compact.lock"
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+        self.seq = 0
+        self._log = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._records_since_snapshot = 0
+        self._compacting = False
+        self._lock = threading.Lock()
+        self.lock = FileLock(f"{path}.lock")
+        # Identity and length of the log as far as this process has read it
+        self._log_ino = None
+        self._log_offset = 0
+
+    def stamp(self):
+        """Changes whenever any process appends to or rotates the log"""
+        return file_stamp(self.log_path)
+
+    @metrics.instrument('storage.journal.load')
+    def load(self):
+        """Return (snapshot state, log records newer than the snapshot)"""
+        with self._lock:
+            # Another process may have rotated the log under our open handle
+            self._close_log()
+        state = None
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                state = json.load(f)
+        snapshot_seq = state.get('journal_seq', 0) if state else 0
+        self.seq = snapshot_seq
+
+        records = []
+        if os.path.exists(self.old_log_path):
+            records.extend(self._read_log(self.old_log_path, snapshot_seq))
+        records.extend(self._read_log(self.log_path, snapshot_seq, repair=True))
+        if records:
+            self.seq = max(self.seq, records[-1]['seq'])
+        self._records_since_snapshot = len(records)
+        self._remember_log_position()
+        return state, records
+
+    def read_tail(self):
+        """Records other processes appended since we last read the log.
+
+        Returns None when the log was rotated or truncated in between, in
+        which case the caller has to load() the group again.
+        """
+        stamp = file_stamp(self.log_path)
+        if stamp is None:
+            return None if self._log_ino is not None else []
+        ino, _, size = stamp
+        if self._log_ino is None:
+            # The log was recreated after a rotation, everything in it is new
+            self._log_offset = 0
+        elif ino != self._log_ino or size < self._log_offset:
+            return None
+        records = []
+        torn = False
+        with open(self.log_path, 'rb') as f:
+            f.seek(self._log_offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    torn = True
+                    break
+                self._log_offset += len(line)
+                record = _decode_record(line)
+                if record is None:
+                    logger.warning(f"Skipping unreadable journal line in {self.log_path}")
+                    continue
+                if record['seq'] > self.seq:
+                    records.extend(_unbatch(record))
+                    self.seq = record['seq']
+        if torn:
+            # Called under the group lock, so no write is in progress: a worker
+            # died mid-append. Cut its fragment off before the next record lands
+            # on the same line.
+            logger.warning(f"Truncating incomplete journal tail in {self.log_path}")
+            with open(self.log_path, 'r+b') as f:
+                f.truncate(self._log_offset)
+        self._log_ino = ino
+        self._records_since_snapshot += len(records)
+        return records
+
+    def _remember_log_position(self):
+        stamp = file_stamp(self.log_path)
+        self._log_ino = stamp[0] if stamp else None
+        self._log_offset = stamp[2] if stamp else 0
+
+    def _read_log(self, log_path, after_seq, repair=False):
+        """Read records newer than after_seq, dropping a torn trailing write.
+
+        Only an unterminated last line is cut off. A complete line that does
+        not decode is skipped, keeping the records after it.
+        """
+        if not os.path.exists(log_path):
+            return []
+        records = []
+        valid_bytes = 0
+        with open(log_path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                valid_bytes += len(line)
+                record = _decode_record(line)
+                if record is None:
+                    logger.warning(f"Skipping unreadable journal line in {log_path}")
+                    continue
+                if record.get('seq', 0) > after_seq:
+                    records.extend(_unbatch(record))
+        if repair and valid_bytes < os.path.getsize(log_path):
+            logger.warning(f"Truncating incomplete journal tail in {log_path}")
+            with open(log_path, 'r+b') as f:
+                f.truncate(valid_bytes)
+        return records
+
+    @metrics.instrument('storage.journal.commit')
+    def commit(self, splitter, records):
+        """Append the change records to the log"""
+        with self._lock:
+            if self._log is None:
+                self._log = open(self.log_path, 'a')
+            if len(records) > 1:
+                # A transaction goes on one line, so a crash mid-write tears
+                # the whole batch off instead of leaving half of it to replay
+                self.seq += 1
+                self._log.write(json.dumps({'op': 'batch', 'records': records, 'seq': self.seq},
+                                           separators=(',', ':')) + '\n')
+                for record in records:
+                    record['seq'] = self.seq
+            else:
+                for record in records:
+                    self.seq += 1
+                    record['seq'] = self.seq
+                    self._log.write(json.dumps(record, separators=(',', ':')) + '\n')
+            self._log.flush()
+            st = os.fstat(self._log.fileno())
+            self._log_ino, self._log_offset = st.st_ino, st.st_size
+            self._unsynced += len(records)
+            self._records_since_snapshot += len(records)
+            if (self._unsynced >= self.fsync_every or
+                    time.monotonic() - self._last_sync >= self.fsync_interval):
+                self._sync()
+            should_compact = (not self._compacting and
+                              self._records_since_snapshot >= self.compact_every)
+        if should_compact:
+            self.compact(splitter)
+
+    def _sync(self):
+        if self._log is not None and self._unsynced:
+            os.fsync(self._log.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def compact(self, splitter, wait=False):
+        """Rotate the log and write a fresh snapshot in the background"""
+        with self.lock, self._lock:
+            if self._compacting:
+                return
+            compact_fd = try_lock_file(self.compact_lock_path)
+            if compact_fd is None and fcntl is not None:
+                # Another worker is compacting this group right now
+                return
+            self._compacting = True
+            self._close_log()
+            # An old log left over from an interrupted compaction has to survive
+            # until this snapshot lands; the current log then stays where it is
+            # and its already-snapshotted records are skipped by sequence number.
+            if os.path.exists(self.log_path) and not os.path.exists(self.old_log_path):
+                os.replace(self.log_path, self.old_log_path)
+            self._log_ino, self._log_offset = None, 0
+            state = splitter.to_dict()
+            state['journal_seq'] = self.seq
+            self._records_since_snapshot = 0
+
+        def write_snapshot():
+            try:
+                tmp_path = f"{self.path}.snapshot.{os.getpid()}"
+                atomic_write_json(tmp_path, state, indent=None)
+                # Readers load snapshot and logs under the group lock, so swap both under it too
+                with self.lock:
+                    os.replace(tmp_path, self.path)
+                    if os.path.exists(self.old_log_path):
+                        os.remove(self.old_log_path)
+            finally:
+                self._compacting = False
+                if compact_fd is not None:
+                    unlock_file(compact_fd)
+
+        compactor.submit(write_snapshot)
+        if wait:
+            compactor.wait()
+
+    def flush(self):
+        """Force pending records to disk, the log reopens on the next commit"""
+        self.close()
+
+    def close(self):
+        """Flush pending records to disk and release the log file"""
+        with self._lock:
+            self._close_log()
+
+    def _close_log(self):
+        self._sync()
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS expenses (
+    id INTEGER PRIMARY KEY,
+    paid_by TEXT NOT NULL,
+    amount REAL NOT NULL,
+    description TEXT,
+    date TEXT,
+    category TEXT
+);
+CREATE TABLE IF NOT EXISTS expense_participants (
+    expense_id INTEGER NOT NULL REFERENCES expenses(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    username TEXT NOT NULL,
+    PRIMARY KEY (expense_id, position)
+);
+CREATE TABLE IF NOT EXISTS balances (
+    username TEXT PRIMARY KEY,
+    paise INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_expenses_paid_by ON expenses(paid_by);
+CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses(date);
+CREATE INDEX IF NOT EXISTS idx_participants_username ON expense_participants(username, expense_id);
+"""
+
+
+# Expense amounts are stored rounded to paise; this turns them back into integers
+PAISE_SQL = "CAST(ROUND(e.amount * 100) AS INTEGER)"
+
+
+def connect_sqlite(path):
+    """Open a SQLite database in WAL mode"""
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+
+class SqliteStorage:
+    """Keeps a group in its own SQLite database and answers expense queries with indexes.
+
+    Expenses are not held in memory: BillSplitter asks the backend for the rows it
+    needs through the query methods below. Rows staged by an open transaction()
+    are only visible to the thread that staged them; other threads query through
+    a second connection that sees committed rows only.
+    """
+
+    supports_queries = True
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = connect_sqlite(path)
+        self._conn.executescript(SQLITE_SCHEMA)
+        self._lock = threading.RLock()
+        self.lock = FileLock(f"{path}.lock")
+        # Opened on first use by a thread other than the one with staged rows
+        self._read_conn = None
+        self._staging_thread = None
+
+    @property
+    def conn(self):
+        """The connection, reopened if close() ran while the group was still in use"""
+        if self._conn is None:
+            self._conn = connect_sqlite(self.path)
+        return self._conn
+
+    @property
+    def reader(self):
+        """Connection for queries, one that cannot see another thread's staged rows"""
+        conn = self.conn
+        if not conn.in_transaction or self._staging_thread == threading.get_ident():
+            return conn
+        if self._read_conn is None:
+            self._read_conn = connect_sqlite(self.path)
+        return self._read_conn
+
+    def stamp(self):
+        """SQLite bumps data_version whenever another connection commits"""
+        with self._lock:
+            return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    @metrics.instrument('storage.sqlite.load')
+    def load(self):
+        """Return members, balance ledger and last expense id; expenses stay in the database"""
+        with self._lock:
+            users = [row['username'] for row in self.reader.execute("SELECT username FROM users")]
+            balances = {row['username']: row['paise']
+                        for row in self.reader.execute("SELECT username, paise FROM balances")}
+            meta = {row['key']: row['value'] for row in self.reader.execute("SELECT key, value FROM meta")}
+        state = {'users': users, 'expenses': []}
+        if 'last_expense_id' in meta:
+            state['last_expense_id'] = int(meta['last_expense_id'])
+        if 'version' in meta:
+            state['version'] = int(meta['version'])
+        # An empty ledger next to existing expenses (e.g. a migrated group) is rebuilt
+        if balances or self.max_expense_id() == 0:
+            state['balances_paise'] = balances
+        return state, []
+
+    @metrics.instrument('storage.sqlite.commit')
+    def commit(self, splitter, records):
+        """Apply the change records and the updated balance ledger in one transaction"""
+        with self._lock, self.conn:
+            for record in records:
+                self._execute(record)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO balances (username, paise) VALUES (?, ?)",
+                list(splitter.balances.items()))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [('last_expense_id', str(splitter._last_expense_id)),
+                 ('version', str(splitter.version))])
+            self._staging_thread = None
+
+    def stage(self, record):
+        """Run a change inside the open transaction, committed by the next commit()"""
+        with self._lock:
+            self._staging_thread = threading.get_ident()
+            self._execute(record)
+
+    def rollback(self):
+        """Discard staged changes"""
+        with self._lock:
+            self.conn.rollback()
+            self._staging_thread = None
+
+    def _execute(self, record):
+        op = record['op']
+        if op == 'add_user':
+            self.conn.execute("INSERT OR IGNORE INTO users (username) VALUES (?)",
+                              (record['username'],))
+        elif op == 'add_expense':
+            self._insert_expense(record['expense'])
+        elif op == 'update_expense':
+            self.conn.execute("DELETE FROM expenses WHERE id = ?", (record['id'],))
+            self._insert_expense(record['expense'])
+        elif op == 'delete_expense':
+            self.conn.execute("DELETE FROM expenses WHERE id = ?", (record['id'],))
+        elif op == 'categorize':
+            self.conn.execute("UPDATE expenses SET category = ? WHERE id = ?",
+                              (record['category'], record['id']))
+        else:
+            raise ValueError(f"Unknown change record '{op}'")
+
+    def _insert_expense(self, expense):
+        self.conn.execute(
+            "INSERT INTO expenses (id, paid_by, amount, description, date, category) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (expense['id'], expense['paid_by'], expense['amount'],
+             expense.get('description'), expense.get('date'), expense.get('category')))
+        self.conn.executemany(
+            "INSERT INTO expense_participants (expense_id, position, username) VALUES (?, ?, ?)",
+            [(expense['id'], i, p) for i, p in enumerate(expense['participants'])])
+
+    def import_state(self, state):
+        """Bulk load a JSON-layout group state, used by the migration tool"""
+        with self._lock, self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO users (username) VALUES (?)",
+                                  [(u,) for u in state.get('users', [])])
+            for expense in state.get('expenses', []):
+                self._insert_expense(expense)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO balances (username, paise) VALUES (?, ?)",
+                list(state.get('balances_paise', {}).items()))
+
+    def _rows_to_expenses(self, rows):
+        """Turn expense rows into the dict layout used by the file backends"""
+        expenses = [self._row_to_expense(row) for row in rows]
+        if not expenses:
+            return expenses
+        by_id = {e['id']: e for e in expenses}
+        ids = list(by_id)
+        # Fetch participants in chunks to stay under SQLite's variable limit
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for row in self.reader.execute(
+                    f"SELECT expense_id, username FROM expense_participants "
+                    f"WHERE expense_id IN ({placeholders}) ORDER BY expense_id, position", chunk):
+                by_id[row['expense_id']]['participants'].append(row['username'])
+        return expenses
+
+    @staticmethod
+    def _row_to_expense(row):
+        expense = {
+            'id': row['id'],
+            'paid_by': row['paid_by'],
+            'amount': row['amount'],
+            'description': row['description'],
+            'date': row['date'],
+            'participants': []
+        }
+        if row['category'] is not None:
+            expense['category'] = row['category']
+        return expense
+
+    def all_expenses(self):
+        with self._lock:
+            rows = self.reader.execute("SELECT * FROM expenses ORDER BY id").fetchall()
+            return self._rows_to_expenses(rows)
+
+    def iter_expenses(self, start_date=None, end_date=None, paid_by=None, category=None,
+                      chunk_size=500):
+        """Yield matching expenses in id order, fetching chunk_size rows at a time"""
+        conditions, params = ["id > ?"], []
+        if start_date:
+            conditions.append("date >= ?")
+            params.append(start_date)
+        if end_date:
+            conditions.append("date <= ?")
+            params.append(end_date)
+        if paid_by:
+            conditions.append("paid_by = ?")
+            params.append(paid_by)
+        if category:
+            conditions.append("COALESCE(category, 'Uncategorized') = ?")
+            params.append(category)
+        sql = f"SELECT * FROM expenses WHERE {' AND '.join(conditions)} ORDER BY id LIMIT ?"
+        last_id = 0
+        while True:
+            # Keyset pagination: the lock is released between chunks, not held while yielding
+            with self._lock:
+                rows = self.reader.execute(sql, [last_id] + params + [chunk_size]).fetchall()
+                expenses = self._rows_to_expenses(rows)
+            yield from expenses
+            if len(rows) < chunk_size:
+                return
+            last_id = rows[-1]['id']
+
+    def get_expense(self, expense_id):
+        with self._lock:
+            rows = self.reader.execute("SELECT * FROM expenses WHERE id = ?", (expense_id,)).fetchall()
+            expenses = self._rows_to_expenses(rows)
+        return expenses[0] if expenses else None
+
+    def expenses_paid_by(self, username):
+        with self._lock:
+            rows = self.reader.execute("SELECT * FROM expenses WHERE paid_by = ? ORDER BY id",
+                                     (username,)).fetchall()
+            return self._rows_to_expenses(rows)
+
+    def expenses_with_participant(self, username):
+        with self._lock:
+            rows = self.reader.execute(
+                # DISTINCT: a name listed twice in participants has two rows
+                "SELECT DISTINCT e.* FROM expense_participants p JOIN expenses e ON e.id = p.expense_id "
+                "WHERE p.username = ? ORDER BY e.id", (username,)).fetchall()
+            return self._rows_to_expenses(rows)
+
+    def expense_page(self, kind, username, before, limit):
+        """Up to limit expenses of an expense_page() list with ids below before, newest first"""
+        before = before if before is not None else self.max_expense_id() + 1
+        if kind == 'all':
+            sql = "SELECT * FROM expenses WHERE id < ? ORDER BY id DESC LIMIT ?"
+            params = (before, limit)
+        elif kind == 'paid':
+            sql = "SELECT * FROM expenses WHERE paid_by = ? AND id < ? ORDER BY id DESC LIMIT ?"
+            params = (username, before, limit)
+        else:
+            sql = ("SELECT DISTINCT e.* FROM expense_participants p JOIN expenses e ON e.id = p.expense_id "
+                   "WHERE p.username = ? AND p.expense_id < ? AND e.paid_by != ? "
+                   "ORDER BY p.expense_id DESC LIMIT ?")
+            params = (username, before, username, limit)
+        with self._lock:
+            rows = self.reader.execute(sql, params).fetchall()
+            return self._rows_to_expenses(rows)
+
+    def total_paid_by(self, username):
+        """Sum of the expenses username paid, in paise"""
+        with self._lock:
+            return self.reader.execute(
+                f"SELECT COALESCE(SUM({PAISE_SQL}), 0) FROM expenses e WHERE e.paid_by = ?",
+                (username,)).fetchone()[0]
+
+    def max_expense_id(self):
+        with self._lock:
+            return self.reader.execute("SELECT COALESCE(MAX(id), 0) FROM expenses").fetchone()[0]
+
+    def expense_summary(self):
+        """Total amount and per-category totals in paise"""
+        with self._lock:
+            total = self.reader.execute(
+                f"SELECT COALESCE(SUM({PAISE_SQL}), 0) FROM expenses e").fetchone()[0]
+            rows = self.reader.execute(
+                f"SELECT COALESCE(category, 'Uncategorized') AS category, SUM({PAISE_SQL}) AS paise "
+                "FROM expenses e GROUP BY COALESCE(category, 'Uncategorized')").fetchall()
+        return total, {row['category']: row['paise'] for row in rows}
+
+    def monthly_totals(self):
+        """Total spent per YYYY-MM month in paise"""
+        with self._lock:
+            rows = self.reader.execute(
+                f"SELECT COALESCE(substr(date, 1, 7), 'Unknown') AS month, SUM({PAISE_SQL}) AS paise "
+                "FROM expenses e GROUP BY 1 ORDER BY 1").fetchall()
+        return {row['month']: row['paise'] for row in rows}
+
+    @staticmethod
+    def _date_range(start_date, end_date):
+        """WHERE clause and parameters for expenses dated start_date to end_date, undated ones left out"""
+        conditions, params = ["e.date > ''"], []
+        if start_date:
+            conditions.append("e.date >= ?")
+            params.append(start_date)
+        if end_date:
+            conditions.append("e.date <= ?")
+            params.append(end_date)
+        return ' AND '.join(conditions), params
+
+    def date_range_summary(self, start_date=None, end_date=None):
+        """Total in paise, expense count and per-category totals of a date range"""
+        where, params = self._date_range(start_date, end_date)
+        with self._lock:
+            rows = self.reader.execute(
+                f"SELECT COALESCE(category, 'Uncategorized') AS category, SUM({PAISE_SQL}) AS paise, "
+                f"COUNT(*) AS n FROM expenses e WHERE {where} "
+                "GROUP BY COALESCE(category, 'Uncategorized')", params).fetchall()
+        return (sum(row['paise'] for row in rows), sum(row['n'] for row in rows),
+                {row['category']: row['paise'] for row in rows if row['paise']})
+
+    def period_totals(self, period, start_date=None, end_date=None):
+        """[(day or YYYY-MM month, paise, expense count)] of a date range, in date order"""
+        key = "e.date" if period == 'day' else "substr(e.date, 1, 7)"
+        where, params = self._date_range(start_date, end_date)
+        with self._lock:
+            rows = self.reader.execute(
+                f"SELECT {key} AS period, SUM({PAISE_SQL}) AS paise, COUNT(*) AS n "
+                f"FROM expenses e WHERE {where} GROUP BY 1 ORDER BY 1", params).fetchall()
+        return [(row['period'], row['paise'], row['n']) for row in rows]
+
+    def balances_as_of(self, date, ledger):
+        """Net balance in paise per user over the expenses dated up to date.
+
+        ledger holds the balances over every expense. When fewer expenses
+        come after date (or have none), their effect is taken out of ledger
+        instead of adding up everything before it.
+        """
+        where, params = self._date_range(None, date)
+        with self._lock:
+            before = self.reader.execute(f"SELECT COUNT(*) FROM expenses e WHERE {where}", params).fetchone()[0]
+            total = self.reader.execute("SELECT COUNT(*) FROM expenses").fetchone()[0]
+            if before <= total - before:
+                return self._balance_deltas(where, params)
+            after = self._balance_deltas("COALESCE(e.date, '') = '' OR e.date > ?", [date])
+        balances = dict(ledger)
+        for user, delta in after.items():
+            balances[user] = balances.get(user, 0) - delta
+        return balances
+
+    def _balance_deltas(self, where, params):
+        """Net balance change in paise per user over the expenses matching where, split as ledger.split_paise"""
+        paid = self.reader.execute(
+            f"SELECT e.paid_by AS username, SUM({PAISE_SQL}) AS paise FROM expenses e "
+            f"WHERE ({where}) AND EXISTS (SELECT 1 FROM expense_participants p WHERE p.expense_id = e.id) "
+            "GROUP BY 1", params).fetchall()
+        owed = self.reader.execute(
+            "WITH s AS ("
+            "  SELECT p.expense_id, p.username,"
+            "         ROW_NUMBER() OVER (PARTITION BY p.expense_id ORDER BY p.username, p.position) - 1 AS rank,"
+            "         COUNT(*) OVER (PARTITION BY p.expense_id) AS n"
+            f"  FROM expense_participants p JOIN expenses e ON e.id = p.expense_id WHERE {where})"
+            f" SELECT s.username AS username,"
+            f"        SUM({PAISE_SQL} / s.n +"
+            f"            ((((s.rank - e.id % s.n) % s.n) + s.n) % s.n < {PAISE_SQL} % s.n)) AS paise"
+            " FROM s JOIN expenses e ON e.id = s.expense_id GROUP BY 1", params).fetchall()
+        deltas = {row['username']: row['paise'] for row in paid}
+        for row in owed:
+            deltas[row['username']] = deltas.get(row['username'], 0) - row['paise']
+        return deltas
+
+    def user_category_totals(self, username=None):
+        """Each user's share per category in paise, split the same way as ledger.split_paise"""
+        where = "WHERE s.username = ?" if username is not None else ""
+        params = (username,) if username is not None else ()
+        with self._lock:
+            rows = self.reader.execute(
+                "WITH s AS ("
+                "  SELECT p.expense_id, p.username,"
+                "         ROW_NUMBER() OVER (PARTITION BY p.expense_id ORDER BY p.username, p.position) - 1 AS rank,"
+                "         COUNT(*) OVER (PARTITION BY p.expense_id) AS n"
+                "  FROM expense_participants p)"
+                f" SELECT s.username AS username, COALESCE(e.category, 'Uncategorized') AS category,"
+                f"        SUM({PAISE_SQL} / s.n +"
+                f"            ((((s.rank - e.id % s.n) % s.n) + s.n) % s.n < {PAISE_SQL} % s.n)) AS paise"
+                f" FROM s JOIN expenses e ON e.id = s.expense_id {where}"
+                " GROUP BY 1, 2", params).fetchall()
+        totals = {}
+        for row in rows:
+            totals.setdefault(row['username'], {})[row['category']] = row['paise']
+        return totals
+
+    def flush(self):
+        # Every commit is already a finished transaction
+        pass
+
+    def close(self):
+        with self._lock:
+            for conn in (self._conn, self._read_conn):
+                if conn is not None:
+                    conn.close()
+            self._conn = self._read_conn = None
+
+
+class SqliteAccounts:
+    """SQLite replacement for users.json, one JSON document per account"""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = connect_sqlite(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS accounts (username TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        self._lock = threading.Lock()
+        self._saves = 0
+
+    def stamp(self):
+        """SQLite bumps data_version whenever another connection commits, our own saves are counted"""
+        with self._lock:
+            return (self.conn.execute("PRAGMA data_version").fetchone()[0], self._saves)
+
+    def load(self):
+        with self._lock:
+            rows = self.conn.execute("SELECT username, data FROM accounts").fetchall()
+        return {row['username']: json.loads(row['data']) for row in rows}
+
+    def save(self, users):
+        with self._lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO accounts (username, data) VALUES (?, ?)",
+                                  [(name, json.dumps(info)) for name, info in users.items()])
+            existing = [row[0] for row in self.conn.execute("SELECT username FROM accounts")]
+            self.conn.executemany("DELETE FROM accounts WHERE username = ?",
+                                  [(name,) for name in existing if name not in users])
+            self._saves += 1
+
+
+STORAGE_BACKENDS = {
+    'json': JsonStorage,
+    'journal': JournalStorage,
+    'sqlite': SqliteStorage,
+}
+
+
+def open_storage(path, backend='json'):
+    """Create the storage backend for a group file"""
+    if not isinstance(backend, str):
+        return backend
+    try:
+        return STORAGE_BACKENDS[backend](path)
+    except KeyError:
+        raise ValueError(f"Unknown storage backend '{backend}'")
@@ -0,0 +1,42 @@
+import pytest
+
+from bill_splitter import BillSplitter
+
+BACKENDS = ['json', 'journal', 'sqlite']
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request):
+    return request.param
+
+
+@pytest.fixture
+def group_path(tmp_path, backend):
+    return str(tmp_path / ('group.db' if backend == 'sqlite' else 'group.json'))
+
+
+@pytest.fixture
+def open_group(group_path, backend):
+    """Opens BillSplitters on one group file, all closed at the end of the test"""
+    opened = []
+
+    def open_group():
+        bs = BillSplitter(group_path, storage=backend)
+        opened.append(bs)
+        return bs
+    yield open_group
+    for bs in opened:
+        bs.close()
+
+
+@pytest.fixture(scope='session')
+def app_dir(tmp_path_factory):
+    """Scratch working directory for the Flask app, which keeps its files in the cwd"""
+    return tmp_path_factory.mktemp('app')
+
+
+@pytest.fixture
+def app_module(app_dir, monkeypatch):
+    monkeypatch.chdir(app_dir)
+    import app
+    return app
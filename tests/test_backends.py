@@ -0,0 +1,96 @@
+"""Every storage backend gives the same answers for the same group"""
+import threading
+
+import pytest
+
+from bill_splitter import BillSplitter
+from conftest import BACKENDS
+from expense_record import Expense
+
+
+def build(path, backend):
+    bs = BillSplitter(path, storage=backend)
+    for user in ('alice', 'bob', 'carol'):
+        bs.add_user(user)
+    # alice is listed twice, so she takes two of the three shares
+    bs.add_expense('bob', 90, "Dinner", ['alice', 'bob', 'alice'], date="2024-03-01", category="Food")
+    bs.add_expense('alice', 45.5, "Taxi", ['alice', 'carol'], date="2024-03-02")
+    bs.add_expense('carol', 10, "Tea", ['alice', 'bob', 'carol'], date="2024-03-05")
+    return bs
+
+
+def answers(bs):
+    return {
+        'expenses': {user: bs.get_user_expenses(user) for user in sorted(bs.users)},
+        'summaries': {user: bs.get_user_summary(user) for user in sorted(bs.users)},
+        'balances': bs.get_net_balances(),
+        'summary': bs.get_expense_summary(),
+        'user_categories': bs.get_user_category_summary(),
+        'owed': {user: bs.expense_page('owed', user)[0] for user in sorted(bs.users)}
+    }
+
+
+def normalized(value):
+    """Expense records compare as plain dicts"""
+    if isinstance(value, Expense):
+        return value.copy()
+    if isinstance(value, dict):
+        return {k: normalized(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [normalized(v) for v in value]
+    return value
+
+
+@pytest.fixture
+def results(tmp_path):
+    results = {}
+    for backend in BACKENDS:
+        bs = build(str(tmp_path / f"{backend}.{'db' if backend == 'sqlite' else 'json'}"), backend)
+        results[backend] = normalized(answers(bs))
+        bs.close()
+    return results
+
+
+def test_backends_agree(results):
+    for backend in BACKENDS[1:]:
+        assert results[backend] == results[BACKENDS[0]], backend
+
+
+def test_duplicate_participant_listed_once(results):
+    for backend, result in results.items():
+        alice = result['expenses']['alice']
+        ids = [e['id'] for e in alice['participating_expenses']]
+        assert ids == sorted(set(ids)), backend
+        # Two shares of 90 and one of 45.50 and of 10
+        assert alice['total_owed'] == pytest.approx(60 + 22.75 + 10 / 3, abs=0.01), backend
+
+
+def in_other_thread(query):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(query()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+@pytest.mark.parametrize('fail', [False, True])
+def test_staged_rows_stay_in_their_thread(tmp_path, fail):
+    bs = BillSplitter(str(tmp_path / 'group.db'), storage='sqlite')
+    bs.add_user('alice')
+    bs.add_expense('alice', 10, 'Tea', ['alice'])
+
+    def totals():
+        return (bs.get_expense_summary()['total_amount'], len(bs.storage.all_expenses()),
+                bs.storage.period_totals('day'))
+    committed = totals()
+    try:
+        with bs.transaction():
+            bs.add_expense('alice', 90, 'Dinner', ['alice'], date='2024-01-01')
+            assert totals()[:2] == (100, 2)
+            assert in_other_thread(totals) == committed
+            if fail:
+                raise RuntimeError('import failed')
+    except RuntimeError:
+        pass
+    assert in_other_thread(totals)[:2] == ((10, 1) if fail else (100, 2))
+    bs.close()
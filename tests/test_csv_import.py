@@ -0,0 +1,20 @@
+import io
+
+from csv_import import import_expenses_csv, MAX_AMOUNT
+
+
+def test_bad_amounts_are_rejected_rows(open_group):
+    bs = open_group()
+    for user in ('a', 'b'):
+        bs.add_user(user)
+    rows = ["paid_by,amount,participants",
+            "a,100,a;b",
+            "a,1e26,a;b",
+            f"b,{MAX_AMOUNT * 10},a;b",
+            "b,abc,a;b",
+            "b,40,a;b"]
+    report = import_expenses_csv(bs, io.StringIO('\n'.join(rows) + '\n'))
+    assert report['imported'] == 2
+    assert [error['line'] for error in report['errors']] == [3, 4, 5]
+    assert [e['amount'] for e in bs.expenses] == [100.0, 40.0]
+    assert bs.get_net_balances() == {'a': 30.0, 'b': -30.0}
@@ -0,0 +1,42 @@
+import pytest
+
+
+@pytest.fixture
+def group(app_module):
+    """A group shared by alice and bob, with alice logged in on the client"""
+    group_id = 'group_api_test'
+    bs = app_module.get_group(group_id)
+    if not bs.last_expense_id:
+        bs.add_user('alice')
+        bs.add_user('bob')
+        bs.add_expense('alice', 100, 'Dinner', ['alice', 'bob'])
+    with app_module.user_store.transaction() as users:
+        for name in ('alice', 'bob'):
+            users[name] = {'groups': {group_id: {'name': 'Trip', 'role': 'member'}}}
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['username'] = 'alice'
+    return client, group_id
+
+
+def test_expenses_view_is_not_redirected(group):
+    client, group_id = group
+    for path in (f'/api/group/{group_id}/expenses', f'/group/{group_id}/expenses'):
+        response = client.get(path)
+        assert response.status_code == 200
+        assert response.get_json()['expenses'][0]['description'] == 'Dinner'
+
+
+def test_etag_changes_with_accounts(group, app_module):
+    client, group_id = group
+    path = f'/api/group/{group_id}/settlements'
+    first = client.get(path)
+    assert 'qr_url' not in first.get_json()['settlements'][0]
+    assert client.get(path, headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    with app_module.user_store.transaction() as users:
+        users['alice']['upi_id'] = 'alice@upi'
+    second = client.get(path, headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert second.headers['ETag'] != first.headers['ETag']
+    assert 'qr_url' in second.get_json()['settlements'][0]
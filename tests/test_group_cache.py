@@ -0,0 +1,78 @@
+import pytest
+
+from group_cache import GroupCache
+
+
+class FakeSplitter:
+    def __init__(self, cache, group_id):
+        self.cache = cache
+        self.group_id = group_id
+        self.closed = False
+
+    def estimated_size(self):
+        return 100
+
+    def close(self):
+        # Must not run while the cache is locked
+        assert self.cache._lock.acquire(blocking=False)
+        self.cache._lock.release()
+        assert self.group_id not in self.cache
+        self.closed = True
+
+
+def fake_cache(**limits):
+    loaded = {}
+
+    def loader(group_id):
+        loaded[group_id] = FakeSplitter(cache, group_id)
+        return loaded[group_id]
+    cache = GroupCache(loader, **limits)
+    return cache, loaded
+
+
+def test_evicted_splitters_are_closed_outside_the_lock():
+    cache, loaded = fake_cache(max_entries=2)
+    for group_id in ('a', 'b', 'c'):
+        cache.get(group_id)
+    assert loaded['a'].closed
+    assert not loaded['b'].closed and not loaded['c'].closed
+
+    cache.discard('b')
+    assert loaded['b'].closed
+
+    cache.max_bytes = 50
+    cache.get('d')
+    assert loaded['c'].closed and not loaded['d'].closed
+    assert cache.stats()['evictions'] == {'capacity': 1, 'memory': 1, 'idle': 0}
+
+
+def test_idle_eviction_closes():
+    cache, loaded = fake_cache(idle_timeout=1e-9)
+    cache.get('a')
+    cache.get('b')
+    assert loaded['a'].closed
+    assert cache.stats()['evictions']['idle'] == 1
+
+
+def test_closed_splitter_keeps_working(open_group, backend):
+    cache = GroupCache(lambda group_id: open_group(), max_entries=1)
+    bs = cache.get('a')
+    bs.add_user('alice')
+    cache.get('b')
+    assert 'a' not in cache
+
+    # A request that still holds the evicted splitter can go on using it
+    bs.add_expense('alice', 10, 'Tea', ['alice'])
+    assert [e['description'] for e in bs.get_user_expenses('alice')['paid_expenses']] == ['Tea']
+
+
+def test_limits_below_one_do_not_hang():
+    with pytest.raises(ValueError):
+        GroupCache(lambda group_id: None, max_entries=0)
+
+    cache, loaded = fake_cache(max_entries=1)
+    cache.get('a')
+    cache.max_entries = 0
+    assert cache.get('b') is loaded['b']
+    assert cache.get('b') is loaded['b']
+    assert len(cache) == 1 and loaded['a'].closed
@@ -0,0 +1,87 @@
+"""The expense indexes answer the same as a full scan, through edits and reloads"""
+import random
+
+MEMBERS = ['alice', 'bob', 'carol', 'dave']
+
+
+def rescan(bs):
+    """Every lookup the indexes serve, computed from the full expense list"""
+    expenses = [e.copy() for e in bs.expenses]
+    lookups = {'by_id': {e['id']: e for e in expenses}}
+    for user in MEMBERS:
+        lookups[('paid', user)] = [e for e in expenses if e['paid_by'] == user]
+        lookups[('with', user)] = [e for e in expenses if user in e['participants']]
+        lookups[('owed', user)] = [e['id'] for e in reversed(expenses)
+                                   if user in e['participants'] and e['paid_by'] != user]
+    return lookups
+
+
+def assert_consistent(bs):
+    expected = rescan(bs)
+    for expense_id, expense in expected['by_id'].items():
+        assert bs._find_expense(expense_id) == expense
+    assert bs._find_expense(max(expected['by_id'], default=0) + 1) is None
+    for user in MEMBERS:
+        assert [e.copy() for e in bs._expenses_paid_by(user)] == expected[('paid', user)]
+        assert [e.copy() for e in bs._expenses_with_participant(user)] == expected[('with', user)]
+        page, cursor, ids = None, None, []
+        while True:
+            page, cursor = bs.expense_page('owed', user, before=cursor, limit=3)
+            ids.extend(e['id'] for e in page)
+            if cursor is None:
+                break
+        assert ids == expected[('owed', user)]
+
+
+def make_group(bs):
+    for user in MEMBERS:
+        bs.add_user(user)
+
+
+def random_edits(bs, rng, count):
+    for _ in range(count):
+        ids = [e['id'] for e in bs.expenses]
+        op = rng.random()
+        if op < 0.5 or not ids:
+            bs.add_expense(rng.choice(MEMBERS), rng.randint(1, 50000) / 100, "x",
+                           rng.sample(MEMBERS, rng.randint(1, 4)), date="2024-05-01")
+        elif op < 0.8:
+            bs.update_expense(rng.choice(ids), paid_by=rng.choice(MEMBERS),
+                              participants=rng.sample(MEMBERS, rng.randint(1, 4)))
+        else:
+            bs.delete_expense(rng.choice(ids))
+
+
+def test_indexes_match_rescan_after_edits(open_group):
+    bs = open_group()
+    make_group(bs)
+    rng = random.Random(1)
+    for _ in range(5):
+        random_edits(bs, rng, 20)
+        assert_consistent(bs)
+
+
+def test_indexes_match_rescan_after_reload(open_group):
+    bs = open_group()
+    make_group(bs)
+    random_edits(bs, random.Random(2), 60)
+    expected = [e.copy() for e in bs.expenses]
+    bs.close()
+
+    reloaded = open_group()
+    assert [e.copy() for e in reloaded.expenses] == expected
+    assert_consistent(reloaded)
+    # Edits after the reload keep the rebuilt indexes in step
+    random_edits(reloaded, random.Random(3), 30)
+    assert_consistent(reloaded)
+
+
+def test_indexes_follow_another_process(open_group):
+    writer, reader = open_group(), open_group()
+    make_group(writer)
+    reader.refresh()
+    assert_consistent(reader)
+    random_edits(writer, random.Random(4), 40)
+    reader.refresh()
+    assert [e.copy() for e in reader.expenses] == [e.copy() for e in writer.expenses]
+    assert_consistent(reader)
@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+from bill_splitter import BillSplitter
+
+FRAGMENT = b'{"op":"add_expense","expense":{"id":2,"paid_'
+
+
+@pytest.fixture
+def journal(tmp_path):
+    """Opens journal-backed BillSplitters on one group, closed at the end of the test"""
+    path = str(tmp_path / 'group.json')
+    opened = []
+
+    def open_group():
+        bs = BillSplitter(path, storage='journal')
+        opened.append(bs)
+        return bs
+    open_group.log_path = f"{path}.log"
+    yield open_group
+    for bs in opened:
+        bs.close()
+
+
+def descriptions(bs):
+    return [e['description'] for e in bs.expenses]
+
+
+def test_writes_after_a_crashed_append_survive(journal):
+    first = journal()
+    first.add_user('alice')
+    first.add_user('bob')
+    second, other = journal(), journal()
+    first.add_expense('alice', 10, 'first', ['alice', 'bob'])
+    first.close()
+    # The worker holding `first` dies halfway through its next append
+    with open(journal.log_path, 'ab') as f:
+        f.write(FRAGMENT)
+
+    second.add_expense('bob', 20, 'second', ['alice', 'bob'])
+    second.add_expense('bob', 30, 'third', ['alice', 'bob'])
+    second.close()
+
+    assert other.refresh()
+    assert descriptions(other) == ['first', 'second', 'third']
+    assert descriptions(journal()) == ['first', 'second', 'third']
+
+
+def test_records_after_an_unreadable_line_are_kept(journal):
+    bs = journal()
+    bs.add_user('alice')
+    other = journal()
+    bs.add_expense('alice', 10, 'first', ['alice'])
+    bs.close()
+    # A log damaged before the tail was repaired on write: a fragment glued to
+    # the next record, then a line that is garbage altogether
+    record = {'op': 'add_expense', 'seq': 3,
+              'expense': {'id': 2, 'paid_by': 'alice', 'amount': 20, 'description': 'second',
+                          'participants': ['alice'], 'date': '2024-01-02'}}
+    with open(journal.log_path, 'ab') as f:
+        f.write(FRAGMENT + json.dumps(record).encode() + b'\nnot json\n')
+    bs = journal()
+    bs.add_expense('alice', 30, 'third', ['alice'])
+    bs.close()
+
+    assert descriptions(bs) == ['first', 'second', 'third']
+    assert other.refresh()
+    assert descriptions(other) == ['first', 'second', 'third']
+    assert descriptions(journal()) == ['first', 'second', 'third']
+
+
+def test_transaction_replays_all_or_nothing(journal):
+    bs = journal()
+    bs.add_user('alice')
+    other = journal()
+    bs.add_expense('alice', 10, 'first', ['alice'])
+    with bs.transaction():
+        for description in ('a', 'b', 'c'):
+            bs.add_expense('alice', 5, description, ['alice'])
+    with open(journal.log_path, 'rb') as f:
+        lines = f.readlines()
+    assert len(lines) == 3
+
+    assert other.refresh()
+    assert descriptions(other) == ['first', 'a', 'b', 'c']
+    assert descriptions(journal()) == ['first', 'a', 'b', 'c']
+
+    # The worker dies partway through writing the batch
+    bs.close()
+    with open(journal.log_path, 'wb') as f:
+        f.writelines(lines[:2])
+        f.write(lines[2][:len(lines[2]) // 2])
+    assert descriptions(journal()) == ['first']
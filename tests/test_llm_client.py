@@ -0,0 +1,145 @@
+import threading
+import time
+
+import pytest
+
+from llm_client import FakeModel, LLMUnavailable, ResilientModel
+
+
+def failing(times, error=ConnectionError):
+    """Responder that raises error for the first `times` calls, then answers"""
+    calls = []
+
+    def respond(prompt):
+        calls.append(prompt)
+        if len(calls) <= times:
+            raise error("model down")
+        return 'ok'
+    return respond
+
+
+def resilient(responder, **options):
+    options = dict(dict(backoff_base=0.001, backoff_max=0.002, rate=1000, burst=1000), **options)
+    return ResilientModel(FakeModel(responder), **options)
+
+
+def test_transient_errors_are_retried():
+    model = resilient(failing(2), max_retries=2)
+    assert model.generate_content('hi').text == 'ok'
+    assert model.model.calls == 3
+    stats = model.stats()
+    assert (stats['attempts'], stats['retries'], stats['successes']) == (3, 2, 1)
+
+
+def test_retries_give_up():
+    model = resilient(failing(10), max_retries=2)
+    with pytest.raises(LLMUnavailable) as raised:
+        model.generate_content('hi')
+    assert raised.value.reason == 'failed'
+    assert model.model.calls == 3
+    assert model.stats()['failures'] == 1
+
+
+def test_other_errors_are_not_retried():
+    model = resilient(failing(10, ValueError), max_retries=2)
+    with pytest.raises(ValueError):
+        model.generate_content('hi')
+    assert model.model.calls == 1
+    assert model.breaker.state == 'closed' and model.breaker.failures == 0
+
+
+def test_breaker_opens_half_opens_and_closes():
+    model = resilient(failing(3), max_retries=0, failure_threshold=2, reset_timeout=0.05)
+    for _ in range(2):
+        with pytest.raises(LLMUnavailable):
+            model.generate_content('hi')
+    assert model.breaker.state == 'open'
+    with pytest.raises(LLMUnavailable) as raised:
+        model.generate_content('hi')
+    assert raised.value.reason == 'circuit_open'
+    assert model.model.calls == 2
+
+    # The trial call after reset_timeout fails, so the breaker opens again
+    time.sleep(0.06)
+    with pytest.raises(LLMUnavailable):
+        model.generate_content('hi')
+    assert model.breaker.state == 'open'
+    assert model.breaker.times_opened == 2
+
+    time.sleep(0.06)
+    assert model.generate_content('hi').text == 'ok'
+    assert model.breaker.state == 'closed'
+    assert model.stats()['rejected_open'] == 1
+
+
+def test_half_open_lets_one_trial_through():
+    model = resilient(failing(10), max_retries=0, failure_threshold=1, reset_timeout=0.01)
+    with pytest.raises(LLMUnavailable):
+        model.generate_content('hi')
+    time.sleep(0.02)
+    assert model.breaker.allow()
+    assert model.breaker.state == 'half_open'
+    assert not model.breaker.allow()
+
+
+def test_rate_limit_waits_for_a_token():
+    model = resilient(failing(0), rate=20, burst=1)
+    model.generate_content('hi')
+    started = time.monotonic()
+    model.generate_content('hi')
+    assert time.monotonic() - started >= 0.03
+
+    # Not enough time left to wait for the next token
+    with pytest.raises(LLMUnavailable) as raised:
+        model.generate_content('hi', request_options={'timeout': 0.01})
+    assert raised.value.reason == 'rate_limited'
+    assert model.stats()['rate_limited'] == 1
+
+
+def test_deadline_abandons_a_slow_attempt():
+    model = ResilientModel(FakeModel(latency=0.3), timeout=0.05, max_retries=0)
+    started = time.monotonic()
+    with pytest.raises(LLMUnavailable) as raised:
+        model.generate_content('hi')
+    assert raised.value.reason == 'deadline'
+    assert time.monotonic() - started < 0.25
+    assert model.stats()['timeouts'] == 1
+
+
+def test_hung_attempts_do_not_queue_later_calls():
+    release = threading.Event()
+
+    def respond(prompt):
+        if prompt == 'hang':
+            release.wait()
+        return 'ok'
+    model = resilient(respond, timeout=0.05, max_retries=0, max_concurrency=2,
+                      failure_threshold=10)
+    try:
+        for _ in range(2):
+            with pytest.raises(LLMUnavailable):
+                model.generate_content('hang')
+        assert model.stats()['in_flight'] == 2
+
+        # Fails at once rather than waiting behind the hung attempts
+        with pytest.raises(LLMUnavailable) as raised:
+            model.generate_content('hi')
+        assert raised.value.reason == 'saturated'
+        assert model.model.calls == 2
+    finally:
+        release.set()
+    deadline = time.monotonic() + 1
+    while model.stats()['in_flight'] and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert model.generate_content('hi').text == 'ok'
+
+
+def test_breaker_state_on_metrics(app_module):
+    app_module.chatbot.model.breaker.record_failure()
+    client = app_module.app.test_client()
+    body = client.get('/metrics', environ_base={'REMOTE_ADDR': '127.0.0.1'}).get_data(as_text=True)
+    assert 'llm_breaker_state{state="closed"} 1' in body
+    assert 'llm_breaker_consecutive_failures 1' in body
+    assert 'llm_breaker_trips_total 0' in body
+    assert 'llm_events_total{event="calls"}' in body
+    app_module.chatbot.model.breaker.record_success()
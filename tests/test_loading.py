@@ -0,0 +1,49 @@
+"""A group that fails to load is never written back as an empty group"""
+import pytest
+
+from bill_splitter import BillSplitter
+
+
+def corrupt(path):
+    with open(path, 'w') as f:
+        f.write('{"expenses": [{"id": 1, "paid_by"')
+
+
+@pytest.fixture
+def saved(tmp_path):
+    path = str(tmp_path / 'group.json')
+    bs = BillSplitter(path, storage='json')
+    bs.add_user('alice')
+    bs.add_user('bob')
+    bs.add_expense('alice', 100, "Dinner", ['alice', 'bob'])
+    bs.close()
+    return path
+
+
+def test_corrupt_group_raises(saved):
+    corrupt(saved)
+    with pytest.raises(ValueError):
+        BillSplitter(saved, storage='json')
+
+
+def test_writes_refused_until_the_group_loads(saved):
+    bs = BillSplitter(saved, storage='json')
+    corrupt(saved)
+    with open(saved) as f:
+        damaged = f.read()
+    with pytest.raises(ValueError):
+        bs.add_expense('bob', 50, "Taxi", ['alice', 'bob'])
+    with pytest.raises(RuntimeError):
+        bs.save_data()
+    with open(saved) as f:
+        assert f.read() == damaged
+
+    # Once the file is readable again the next change loads it first
+    fixed = BillSplitter(str(saved) + '.fixed', storage='json')
+    fixed.add_user('alice')
+    fixed.add_user('bob')
+    fixed.close()
+    with open(str(saved) + '.fixed') as src, open(saved, 'w') as dst:
+        dst.write(src.read())
+    assert bs.add_expense('bob', 50, "Taxi", ['alice', 'bob']).startswith("Expense")
+    assert [e['description'] for e in BillSplitter(saved, storage='json').expenses] == ["Taxi"]
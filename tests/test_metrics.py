@@ -0,0 +1,33 @@
+import pytest
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+def get(client, path, addr, headers=None):
+    return client.get(path, headers=headers or {}, environ_base={'REMOTE_ADDR': addr})
+
+
+@pytest.mark.parametrize('path', ['/metrics', '/metrics/slow_requests'])
+def test_local_peer_allowed(client, path):
+    assert get(client, path, '127.0.0.1').status_code == 200
+
+
+@pytest.mark.parametrize('path', ['/metrics', '/metrics/slow_requests'])
+def test_forwarded_for_cannot_claim_localhost(client, path):
+    assert get(client, path, '203.0.113.9', {'X-Forwarded-For': '127.0.0.1'}).status_code == 404
+    # Forwarded by a proxy on the same host
+    assert get(client, path, '127.0.0.1', {'X-Forwarded-For': '203.0.113.9'}).status_code == 404
+    assert get(client, path, '203.0.113.9').status_code == 404
+
+
+def test_token(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'METRICS_TOKEN', 'secret')
+    assert get(client, '/metrics', '127.0.0.1').status_code == 404
+    assert get(client, '/metrics', '127.0.0.1', {'Authorization': 'Bearer wrong'}).status_code == 404
+    response = get(client, '/metrics', '203.0.113.9',
+                   {'Authorization': 'Bearer secret', 'X-Forwarded-For': '198.51.100.1'})
+    assert response.status_code == 200
+    assert b'http_request_duration_seconds' in response.data
@@ -0,0 +1,50 @@
+from chatbot_utils import ParseCache
+
+
+def parsed(amount):
+    return {"status": "success", "amount": amount}
+
+
+def lines(path):
+    with open(path) as f:
+        return f.readlines()
+
+
+def test_put_appends_one_line(tmp_path):
+    path = str(tmp_path / 'cache.jsonl')
+    cache = ParseCache(max_entries=10, path=path)
+    cache.put('a', parsed(1))
+    cache.put('b', parsed(2))
+    cache.put('a', parsed(3))
+    assert len(lines(path)) == 3
+
+    reloaded = ParseCache(max_entries=10, path=path)
+    assert reloaded.get('a') == parsed(3)
+    assert reloaded.get('b') == parsed(2)
+
+
+def test_log_is_rewritten_when_it_grows(tmp_path):
+    path = str(tmp_path / 'cache.jsonl')
+    cache = ParseCache(max_entries=3, path=path)
+    for i in range(20):
+        cache.put(str(i), parsed(i))
+    assert len(lines(path)) <= 6
+
+    reloaded = ParseCache(max_entries=3, path=path)
+    assert reloaded.stats()['entries'] == 3
+    assert [reloaded.get(str(i)) for i in (17, 18, 19)] == [parsed(17), parsed(18), parsed(19)]
+
+
+def test_torn_and_expired_lines_are_skipped(tmp_path):
+    path = str(tmp_path / 'cache.jsonl')
+    cache = ParseCache(max_entries=10, path=path)
+    cache.put('a', parsed(1))
+    with open(path, 'a') as f:
+        f.write('["old", 1, {"status": "success"}]\n["b", 99999999999, {"sta')
+
+    reloaded = ParseCache(max_entries=10, path=path)
+    assert reloaded.stats()['entries'] == 1
+    assert reloaded.get('a') == parsed(1)
+
+    reloaded.clear()
+    assert lines(path) == []
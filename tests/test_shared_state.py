@@ -0,0 +1,83 @@
+import pytest
+
+from shared_state import SharedDict
+
+
+class Store:
+    """Stands in for users.json: a stored dict, a stamp and a switch to break loading"""
+
+    def __init__(self, data):
+        self.data = data
+        self.stamp = 0
+        self.broken = False
+        self.saves = 0
+
+    def load(self):
+        if self.broken:
+            raise ValueError("Expecting value: line 1 column 1 (char 0)")
+        return dict(self.data)
+
+    def save(self, data):
+        self.data = dict(data)
+        self.stamp += 1
+        self.saves += 1
+
+    def shared(self, tmp_path):
+        return SharedDict(self.load, self.save, lambda: self.stamp,
+                          lock_path=str(tmp_path / 'users.lock'))
+
+
+class WatchedDict(dict):
+    """Records its size after every change"""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.sizes = []
+
+    def clear(self):
+        super().clear()
+        self.sizes.append(len(self))
+
+    def update(self, other):
+        for key, value in other.items():
+            self[key] = value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.sizes.append(len(self))
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.sizes.append(len(self))
+
+
+def test_reload_never_empties_data(tmp_path):
+    store = Store({'alice': 1, 'bob': 2})
+    shared = store.shared(tmp_path)
+    data = shared.data = WatchedDict(shared.data)
+
+    store.data = {'bob': 3, 'carol': 4}
+    store.stamp += 1
+    assert shared.refresh()
+    assert data == {'bob': 3, 'carol': 4}
+    assert min(data.sizes) > 0
+
+
+def test_failed_load_keeps_data_and_blocks_saves(tmp_path):
+    store = Store({'alice': 1})
+    shared = store.shared(tmp_path)
+
+    store.broken = True
+    store.stamp += 1
+    with pytest.raises(ValueError):
+        shared.refresh()
+    assert shared.data == {'alice': 1}
+    with pytest.raises(ValueError):
+        with shared.transaction() as data:
+            data['bob'] = 2
+    assert store.saves == 0
+
+    store.broken = False
+    with shared.transaction() as data:
+        data['bob'] = 2
+    assert store.data == {'alice': 1, 'bob': 2}